@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+#
+# Compares the render of a turntable using one Blender instance against the same render split in various instances.
+# Uses the `blender_export.py` script from KiBot, the same way the `blender_export` output does (`workers` option).
+# The render is done by Cycles using the CPU.
+#
+# Usage: bench.py [--steps N] [--samples N] [--width W] [--height H] [--workers N...] OUTPUT_DIR FILE.pcb3d
+#
+# You can get a small PCB3D file running the `blender_export_1` test (light_control.pcb3d).
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from shutil import which
+from subprocess import run, PIPE, STDOUT
+import sys
+from time import perf_counter
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'kibot', 'blender_scripts',
+                      'blender_export.py')
+
+
+def render(pcb3d, scene, out_dir, steps, workers):
+    """ Renders `steps` points of view using `workers` Blender instances """
+    os.makedirs(out_dir, exist_ok=True)
+    cpus = os.cpu_count() or 1
+    cmds = []
+    for n in range(workers):
+        views = list(range(n*steps//workers, (n+1)*steps//workers))
+        cmd = [which('blender'), '-b']
+        if workers > 1:
+            cmd.extend(['--threads', str(max(cpus//workers, 1))])
+        cmd.extend(['--factory-startup', '-P', SCRIPT, '--', '--format'])
+        cmd.extend(['render']*len(views))
+        cmd.append('--output')
+        cmd.extend(os.path.join(out_dir, f'view_{v:03d}.png') for v in views)
+        if workers > 1:
+            cmd.append('--views')
+            cmd.extend(str(v) for v in views)
+        cmd.extend(['--scene', scene, pcb3d])
+        cmds.append(cmd)
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda c: run(c, stdout=PIPE, stderr=STDOUT), cmds))
+    elapsed = perf_counter()-start
+    for r in results:
+        if r.returncode or b'Traceback ' in r.stdout:
+            print(r.stdout.decode())
+            sys.exit(1)
+    return elapsed
+
+
+parser = argparse.ArgumentParser(description='Blender points of view benchmark')
+parser.add_argument('--steps', type=int, default=36, help='Points of view in the turntable')
+parser.add_argument('--samples', type=int, default=4, help='Samples for each render')
+parser.add_argument('--width', type=int, default=320, help='Width of the images')
+parser.add_argument('--height', type=int, default=180, help='Height of the images')
+parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help='Number of Blender instances to try')
+parser.add_argument('output_dir')
+parser.add_argument('pcb3d')
+args = parser.parse_args()
+if not which('blender'):
+    print('Missing Blender')
+    sys.exit(1)
+os.makedirs(args.output_dir, exist_ok=True)
+# Same structure used by the `blender_export` output
+step = 360/args.steps
+scene = {'fixed_auto_camera': True,
+         'auto_camera_z_axis_factor': 1.5,
+         'render': {'samples': args.samples, 'resolution_x': args.width, 'resolution_y': args.height,
+                    'transparent_background': True, 'background1': '#66667F', 'background2': '#CCCCE5'},
+         'lights': [{'name': 'kibot_light', 'position': (-0.5, 0.5, 0.75), 'type': 'POINT', 'energy': 0}],
+         'point_of_view': [{'rotate_x': -30, 'rotate_y': 0, 'rotate_z': -step*n, 'view': 'z'} for n in range(args.steps)]}
+scene_file = os.path.join(args.output_dir, 'scene.json')
+with open(scene_file, 'wt') as f:
+    f.write(json.dumps(scene, sort_keys=True, indent=2))
+print(f'{args.steps} points of view, {args.samples} samples, {args.width}x{args.height}, {os.cpu_count()} CPUs')
+serial = render(args.pcb3d, scene_file, os.path.join(args.output_dir, 'w1'), args.steps, 1)
+print(f'1 instance:   {serial:8.3f} s')
+for w in args.workers:
+    t = render(args.pcb3d, scene_file, os.path.join(args.output_dir, f'w{w}'), args.steps, w)
+    print(f'{w} instances:  {t:8.3f} s (speed-up {serial/t:.1f}x)')
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+#
+# Compares the full (Earley) electro grammar against the LALR fast path.
+# Uses the values found in the schematics from the tests, as `comp_match` sends them to the parser.
+# Values solved by the `comp_match` regex are skipped, they never reach the parser (use --all to include them).
+# Also reports the values where both paths disagree.
+#
+# Usage: bench.py [--all] [--repeat N] [SCHEMATIC...]
+import argparse
+from glob import glob
+import os
+import re
+import sys
+from time import perf_counter
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+import kibot.mcpyrate.activate  # noqa: F401,E402
+from kibot.bom import electro_grammar  # noqa: E402
+from kibot.bom.units import match_string  # noqa: E402
+
+VALUE_V6 = re.compile(r'\(property\s+"Value"\s+"((?:[^"\\]|\\.)*)"')
+REF_V6 = re.compile(r'\(property\s+"Reference"\s+"((?:[^"\\]|\\.)*)"')
+VALUE_V5 = re.compile(r'^F\s*1\s+"([^"]*)"', re.MULTILINE)
+REF_V5 = re.compile(r'^F\s*0\s+"([^"]*)"', re.MULTILINE)
+
+
+def collect(files, all_values):
+    match = re.compile(match_string(), flags=re.IGNORECASE)
+    values = set()
+    for fname in files:
+        with open(fname, 'rt', errors='replace') as f:
+            text = f.read()
+        if fname.endswith('.sch'):
+            comps = re.findall(r'\$Comp(.*?)\$EndComp', text, re.S)
+            ref_re, val_re = REF_V5, VALUE_V5
+        else:
+            comps = re.split(r'\(symbol\s+\(lib_id', text)[1:]
+            ref_re, val_re = REF_V6, VALUE_V6
+        for c in comps:
+            ref = ref_re.search(c)
+            val = val_re.search(c)
+            if not ref or not val:
+                continue
+            value = val.group(1).strip()
+            prefix = ref.group(1).lstrip('#')[:1]
+            if not value or not prefix:
+                continue
+            no_commas = value.replace(',', '')
+            if all_values or not (match.match(no_commas) or re.match(r'(\d+)\/(\d+)', no_commas)):
+                values.add(prefix+' '+value)
+    return sorted(values)
+
+
+def full_parse(text):
+    try:
+        tree = electro_grammar.get_parser().parse(text)
+    except Exception:
+        return {}
+    res = electro_grammar.ComponentTransformer()
+    res.transform(tree)
+    res.parsed.update(res.extra)
+    return res.parsed
+
+
+def fast_parse(text):
+    return electro_grammar.parse(text, with_extra=True)
+
+
+def measure(func, values, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        res = [func(v) for v in values]
+    return (perf_counter()-start)/repeat, res
+
+
+parser = argparse.ArgumentParser(description='Electro grammar benchmark')
+parser.add_argument('--all', action='store_true', help='Also use the values solved without the parser')
+parser.add_argument('--repeat', type=int, default=1, help='Parse the values this number of times')
+parser.add_argument('files', nargs='*')
+args = parser.parse_args()
+files = args.files
+if not files:
+    samples = os.path.join(ROOT, 'tests', 'board_samples')
+    files = glob(os.path.join(samples, '**', '*.kicad_sch'), recursive=True)+glob(os.path.join(samples, '**', '*.sch'),
+                                                                                  recursive=True)
+values = collect(files, args.all)
+start = perf_counter()
+electro_grammar.initialize()
+fast_init = perf_counter()-start
+start = perf_counter()
+electro_grammar.get_parser()
+full_init = perf_counter()-start
+fast_hits = 0
+for v in values:
+    try:
+        electro_grammar.fast_parser.parse(v)
+        fast_hits += 1
+    except Exception:
+        pass
+# `comp_match` doesn't parse values without digits, they can't have a value
+with_digits = [v for v in values if re.search(r'\d', v[2:])]
+full_t, full_res = measure(full_parse, values, args.repeat)
+fast_t, fast_res = measure(fast_parse, values, args.repeat)
+used_t, _ = measure(fast_parse, with_digits, args.repeat)
+print(f'{len(values)} values from {len(files)} files, {fast_hits} solved by the fast path, {len(with_digits)} with digits')
+print(f'Compile: Earley {full_init:.3f} s, LALR {fast_init:.3f} s (cache: {electro_grammar.get_cache_file()})')
+print(f'Earley:                        {full_t:8.3f} s')
+print(f'LALR + fallback:               {fast_t:8.3f} s (speed-up {full_t/fast_t:.1f}x)')
+print(f'LALR + fallback, with digits:  {used_t:8.3f} s (speed-up {full_t/used_t:.1f}x)')
+for v, a, b in zip(values, full_res, fast_res):
+    if a != b:
+        print(f'Different result for `{v}`: {a} (Earley) {b} (LALR)')
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+#
+# Measures the HTML BoM writer using a synthetic BoM (groups with long references, links to datasheets and
+# distributors, empty cells, etc.)
+# Reports the time, the peak memory (tracemalloc, in a second run) and the size of the page, with and without pagination.
+#
+# Usage: bench.py [--groups N] [--columns N] [--page-size N]
+import argparse
+import os
+import re
+import sys
+import tempfile
+from time import perf_counter
+import tracemalloc
+from types import SimpleNamespace
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import kibot.mcpyrate.activate  # noqa: F401,E402
+from kibot.bom.html_writer import write_html  # noqa: E402
+
+
+class Group(object):
+    def __init__(self, n, columns):
+        refs = ' '.join(f'R{n*50+i}' for i in range(1+n % 50))
+        self.row = [refs, str(1+n % 50), f'{n % 1000}k', 'Resistor_SMD:R_0805_2012Metric', f'https://example.com/{n}.pdf',
+                    f'311-{n}-1-ND', '~' if n % 3 else f'www.example.com/{n}']
+        self.row += [f'Field {c} of group {n}' if (n+c) % 4 else '' for c in range(columns-len(self.row))]
+        self.components = [None]
+        self.fitted = n % 10 != 0
+
+    def get_row(self, col_fields):
+        return self.row
+
+    def is_fitted(self):
+        return self.fitted
+
+    def get_field(self, name):
+        return self.row[4]
+
+
+def config(n_groups, page_size):
+    prj = SimpleNamespace(name='bench.kicad_sch', sch=SimpleNamespace(revision='A', date='2024-01-01', title='Bench',
+                                                                      company='KiBot'), ref_id='')
+    html = SimpleNamespace(datasheet_as_link='value', digikey_link=['digikey#'], mouser_link=[], lcsc_link=[],
+                           highlight_empty=True, style='modern-blue', col_colors=True, row_colors=[], logo='',
+                           title='KiBot Bill of Materials', extra_info=['Bench'], generate_dnf=True, hide_pcb_info=False,
+                           hide_stats_info=False, page_size=page_size)
+    return SimpleNamespace(html=html, aggregate=[prj], variant=None, kicad_version='8.0.4', n_groups=n_groups,
+                           total_str=str(n_groups), fitted_str=str(n_groups), number=1, n_build=n_groups,
+                           n_total=n_groups, n_fitted=n_groups-n_groups//10, ignore_dnf=True, ref_separator=' ')
+
+
+def measure(groups, columns, page_size, fname):
+    head_names = ['References', 'Quantity', 'Value', 'Footprint', 'Datasheet', 'Digikey#', 'Link']
+    head_names += [f'Field {c}' for c in range(columns-len(head_names))]
+    col_fields = [re.sub(r'\s', '', h.lower()) for h in head_names]
+    cfg = config(len(groups), page_size)
+    start = perf_counter()
+    write_html(fname, groups, col_fields, head_names, cfg)
+    elapsed = perf_counter()-start
+    # Memory measured in a second run, tracemalloc slows down the writer
+    tracemalloc.start()
+    write_html(fname, groups, col_fields, head_names, cfg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, os.path.getsize(fname)
+
+
+parser = argparse.ArgumentParser(description='HTML BoM writer benchmark')
+parser.add_argument('--groups', type=int, default=10000, help='Number of groups (rows)')
+parser.add_argument('--columns', type=int, default=15, help='Number of columns')
+parser.add_argument('--page-size', type=int, default=500, help='Rows per page for the paginated run')
+args = parser.parse_args()
+groups = [Group(n, args.columns) for n in range(args.groups)]
+with tempfile.TemporaryDirectory() as tmp:
+    print(f'{args.groups} groups, {args.columns} columns')
+    for name, size in (('All rows', 0), (f'Pages of {args.page_size}', args.page_size)):
+        t, m, s = measure(groups, args.columns, size, os.path.join(tmp, 'bom.html'))
+        print(f'{name+":":16} {t:6.2f} s {m/1e6:8.1f} MB peak {s/1e6:8.1f} MB file')
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+#
+# Compares the PDF joiner used by pcb_print/pdfunite against the old PyPDF2 writer code.
+#
+# Usage: bench.py [--width MM] [--repeat N] OUTPUT_DIR FILE.pdf...
+#
+# The same files can be used more than once to simulate long prints.
+import argparse
+import os
+import sys
+from time import perf_counter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from kibot import PyPDF2  # noqa: E402
+from kibot.create_pdf import create_pdf_from_pages  # noqa: E402
+
+
+def old_create_pdf_from_pages(input_files, output_fn, forced_width=None):
+    """ The code used up to 1.8.1 """
+    output = PyPDF2.PdfFileWriter()
+    open_files = []
+    for filename in input_files:
+        file = open(filename, 'rb')
+        open_files.append(file)
+        pdf_reader = PyPDF2.PdfFileReader(file)
+        page_obj = pdf_reader.getPage(0)
+        if forced_width is not None:
+            width = float(page_obj.mediaBox.getWidth())*25.4/72
+            scale = round(forced_width/width, 4)
+            if abs(1.0-scale) > 0.0001:
+                page_obj.scaleBy(scale)
+        page_obj.compressContentStreams()
+        output.addPage(page_obj)
+    with open(output_fn, 'wb') as pdf_output:
+        output.write(pdf_output)
+    for f in open_files:
+        f.close()
+
+
+def measure(func, files, out, width):
+    start = perf_counter()
+    func(files, out, forced_width=width)
+    return perf_counter()-start, os.path.getsize(out)
+
+
+parser = argparse.ArgumentParser(description='PDF join benchmark')
+parser.add_argument('--width', type=float, default=None, help='Scale the pages to this width [mm]')
+parser.add_argument('--repeat', type=int, default=1, help='Use the list of files this number of times')
+parser.add_argument('output_dir')
+parser.add_argument('files', nargs='+')
+args = parser.parse_args()
+os.makedirs(args.output_dir, exist_ok=True)
+files = args.files*args.repeat
+old_t, old_s = measure(old_create_pdf_from_pages, files, os.path.join(args.output_dir, 'old.pdf'), args.width)
+new_t, new_s = measure(create_pdf_from_pages, files, os.path.join(args.output_dir, 'new.pdf'), args.width)
+print(f'{len(files)} pages')
+print(f'PyPDF2 writer: {old_t:8.3f} s {old_s:10d} bytes')
+print(f'Raw copy:      {new_t:8.3f} s {new_s:10d} bytes')
+print(f'Speed-up: {old_t/new_t:.1f}x')
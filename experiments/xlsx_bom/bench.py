@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+#
+# Compares the XLSX BoM writer in normal and constant memory modes.
+# Uses a synthetic BoM (groups with long references, links to datasheets, etc.)
+# Reports the time, the peak memory (tracemalloc) and checks both spreadsheets have the same cells, rows and columns.
+#
+# Usage: bench.py [--groups N] [--columns N]
+import argparse
+import os
+import re
+import sys
+import tempfile
+from time import perf_counter
+import tracemalloc
+from types import SimpleNamespace
+from xml.etree import ElementTree
+import zipfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import kibot.mcpyrate.activate  # noqa: F401,E402
+from kibot.bom.xlsx_writer import write_xlsx  # noqa: E402
+NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+class Group(object):
+    def __init__(self, n, columns):
+        refs = ' '.join(f'R{n*50+i}' for i in range(1+n % 50))
+        self.row = [refs, str(1+n % 50), f'{n % 1000}k', 'Resistor_SMD:R_0805_2012Metric', f'https://example.com/{n}.pdf']
+        self.row += [f'Field {c} of group {n}' for c in range(columns-len(self.row))]
+        self.components = [None]
+
+    def get_row(self, col_fields):
+        return self.row
+
+    def is_fitted(self):
+        return True
+
+    def get_field(self, name):
+        return self.row[4]
+
+
+def config(n_groups, columns, constant_memory):
+    prj = SimpleNamespace(name='bench.kicad_sch', sch=SimpleNamespace(revision='A', date='2024-01-01', title='Bench',
+                                                                      company='KiBot'), ref_id='')
+    xlsx = SimpleNamespace(datasheet_as_link='datasheet', digikey_link=[], mouser_link=[], lcsc_link=[],
+                           highlight_empty=True, max_col_width=60, style='modern-blue', col_colors=True, row_colors=[],
+                           logo=False, title='KiBot Bill of Materials', extra_info=['Bench'], generate_dnf=False,
+                           hide_pcb_info=False, hide_stats_info=False, logo_scale=2, kicost=False,
+                           constant_memory=constant_memory)
+    return SimpleNamespace(xlsx=xlsx, aggregate=[prj], variant=None, kicad_version='8.0.4', n_groups=n_groups,
+                           total_str=str(n_groups), fitted_str=str(n_groups), number=1, n_build=n_groups,
+                           n_total=n_groups, n_fitted=n_groups, ignore_dnf=True, _column_comments=['']*columns,
+                           _column_levels=[0]*columns)
+
+
+def read_sheet(fname):
+    """ Cells (value and style), row heights and column widths """
+    with zipfile.ZipFile(fname) as z:
+        strings = []
+        if 'xl/sharedStrings.xml' in z.namelist():
+            root = ElementTree.fromstring(z.read('xl/sharedStrings.xml'))
+            strings = [''.join(t.text or '' for t in si.iter(NS+'t')) for si in root]
+        root = ElementTree.fromstring(z.read('xl/worksheets/sheet1.xml'))
+    cells = {}
+    for c in root.iter(NS+'c'):
+        if c.get('t') == 's':
+            value = strings[int(c.find(NS+'v').text)]
+        elif c.get('t') == 'inlineStr':
+            value = ''.join(t.text or '' for t in c.iter(NS+'t'))
+        else:
+            v = c.find(NS+'v')
+            value = v.text if v is not None else None
+        cells[c.get('r')] = (value, c.get('s'))
+    rows = {r.get('r'): r.get('ht') for r in root.iter(NS+'row') if r.get('ht')}
+    cols = [(c.get('min'), c.get('width')) for c in root.iter(NS+'col')]
+    merges = sorted(m.get('ref') for m in root.iter(NS+'mergeCell'))
+    return cells, rows, cols, merges
+
+
+def measure(groups, columns, constant_memory, fname):
+    head_names = ['References', 'Quantity', 'Value', 'Footprint', 'Datasheet']+[f'Field {c}' for c in range(columns-5)]
+    col_fields = [re.sub(r'\s', '', h.lower()) for h in head_names]
+    cfg = config(len(groups), columns, constant_memory)
+    tracemalloc.start()
+    start = perf_counter()
+    write_xlsx(fname, groups, col_fields, head_names, cfg)
+    elapsed = perf_counter()-start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+parser = argparse.ArgumentParser(description='XLSX BoM writer benchmark')
+parser.add_argument('--groups', type=int, default=20000, help='Number of groups (rows)')
+parser.add_argument('--columns', type=int, default=15, help='Number of columns')
+args = parser.parse_args()
+groups = [Group(n, args.columns) for n in range(args.groups)]
+with tempfile.TemporaryDirectory() as tmp:
+    normal = os.path.join(tmp, 'normal.xlsx')
+    constant = os.path.join(tmp, 'constant.xlsx')
+    n_t, n_m = measure(groups, args.columns, False, normal)
+    c_t, c_m = measure(groups, args.columns, True, constant)
+    print(f'{args.groups} groups, {args.columns} columns')
+    print(f'Normal:          {n_t:6.2f} s {n_m/1e6:8.1f} MB peak')
+    print(f'Constant memory: {c_t:6.2f} s {c_m/1e6:8.1f} MB peak')
+    print('Same content' if read_sheet(normal) == read_sheet(constant) else 'DIFFERENT CONTENT!')
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+#
+# Compares the old netlist/BoM XML generation (ElementTree + minidom `toprettyxml`) against the streaming writer.
+# Uses a synthetic design with the structure of a netlist (components, fields, sheet paths, etc.)
+# Reports the time, the peak memory (tracemalloc) and checks the output is the same.
+#
+# Usage: bench.py [--components N] [--fields N]
+import argparse
+import io
+import os
+import sys
+from time import perf_counter
+import tracemalloc
+from xml.etree.ElementTree import Element, SubElement, tostring
+from xml.dom import minidom
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from kibot.xml_stream import XMLWriter  # noqa: E402
+
+
+def components(n, n_fields):
+    for i in range(n):
+        ref = f'R{i+1}'
+        fields = [(f'Field{f}', f'Value {f} for {ref} & "co" <x>') for f in range(n_fields)]
+        yield ref, f'{i%100}k', 'Resistor_SMD:R_0805_2012Metric', fields, f'/{i%20:08x}/{i:08x}'
+
+
+def old_way(f, n, n_fields):
+    root = Element('export')
+    root.set('version', 'E')
+    comps = SubElement(root, 'components')
+    for ref, value, fp, fields, path in components(n, n_fields):
+        comp = SubElement(comps, 'comp')
+        comp.set('ref', ref)
+        SubElement(comp, 'value').text = value
+        SubElement(comp, 'footprint').text = fp
+        flds = SubElement(comp, 'fields')
+        for name, val in fields:
+            fld = SubElement(flds, 'field')
+            fld.set('name', name)
+            fld.text = val
+        lbs = SubElement(comp, 'libsource')
+        lbs.set('lib', 'Device')
+        lbs.set('part', 'R')
+        lbs.set('description', '')
+        for name, val in fields:
+            prop = SubElement(comp, 'property')
+            prop.set('name', name)
+            prop.set('value', val)
+        shp = SubElement(comp, 'sheetpath')
+        shp.set('names', '/')
+        shp.set('tstamps', path)
+        SubElement(comp, 'tstamps').text = path
+    SubElement(root, 'nets')
+    rough_string = tostring(root, encoding='utf8')
+    reparsed = minidom.parseString(rough_string.decode('utf8'))
+    f.write(reparsed.toprettyxml(indent="  ", encoding='UTF-8'))
+
+
+def new_way(f, n, n_fields):
+    xml = XMLWriter(f, indent='  ', encoding='UTF-8')
+    xml.start('export', (('version', 'E'),))
+    xml.start('components')
+    for ref, value, fp, fields, path in components(n, n_fields):
+        xml.start('comp', (('ref', ref),))
+        xml.element('value', value)
+        xml.element('footprint', fp)
+        xml.start('fields')
+        for name, val in fields:
+            xml.element('field', val, (('name', name),))
+        xml.end()
+        xml.element('libsource', attrs=(('lib', 'Device'), ('part', 'R'), ('description', '')))
+        for name, val in fields:
+            xml.element('property', attrs=(('name', name), ('value', val)))
+        xml.element('sheetpath', attrs=(('names', '/'), ('tstamps', path)))
+        xml.element('tstamps', path)
+        xml.end()
+    xml.end()
+    xml.start('nets')
+    xml.close()
+
+
+def measure(func, n, n_fields):
+    f = io.BytesIO()
+    tracemalloc.start()
+    start = perf_counter()
+    func(f, n, n_fields)
+    elapsed = perf_counter()-start
+    # The BytesIO buffer is the output file, is counted for both
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, f.getvalue()
+
+
+parser = argparse.ArgumentParser(description='XML netlist writer benchmark')
+parser.add_argument('--components', type=int, default=20000, help='Number of components')
+parser.add_argument('--fields', type=int, default=6, help='User fields for each component')
+args = parser.parse_args()
+old_t, old_m, old_res = measure(old_way, args.components, args.fields)
+new_t, new_m, new_res = measure(new_way, args.components, args.fields)
+print(f'{args.components} components, {args.fields} fields each, {len(old_res)/1e6:.1f} MB of XML')
+print(f'ElementTree + minidom: {old_t:6.2f} s {old_m/1e6:8.1f} MB peak')
+print(f'Streaming:             {new_t:6.2f} s {new_m/1e6:8.1f} MB peak (speed-up {old_t/new_t:.1f}x)')
+print('Same output' if old_res == new_res else 'DIFFERENT OUTPUT!')
@@ -796,6 +796,16 @@ class PlacedComponentInfo:
     scale: Tuple[float, float]
     size: Tuple[float, float]
 
+@dataclass
+class ComponentLayer:
+    """
+    The SVG elements for one component, see PcbPlotter.plot_layers
+    """
+    ref: str
+    elements: List[etree.Element]
+    highlight: Optional[etree.Element] = None
+    warning: Optional[str] = None
+
 @dataclass
 class PlotComponents(PlotInterface):
     filter: Callable[[str], bool] = lambda x: True # Components to show
@@ -803,6 +813,8 @@ class PlotComponents(PlotInterface):
     remapping: Callable[[str, str, str], Tuple[str, str]] = lambda ref, lib, name: (lib, name)
     resistor_values: Dict[str, ResistorValue] = field(default_factory=dict)
     no_warn_back: bool = False
+    # When not None the components are stored here, not in the document
+    layers: Optional[List[ComponentLayer]] = None
 
     def render(self, plotter: PcbPlotter) -> None:
         self._plotter = plotter
@@ -839,12 +851,21 @@ class PlotComponents(PlotInterface):
             ret = self._create_component(lib, name, ref, value)
             if ret is None:
                 if name[-5:] != '.back' or not self.no_warn_back:
-                    self._plotter.yield_warning("component", f"Component {lib}:{name} has no footprint.")
+                    msg = f"Component {lib}:{name} has no footprint."
+                    if self.layers is not None:
+                        self.layers.append(ComponentLayer(ref, [], warning=msg))
+                    else:
+                        self._plotter.yield_warning("component", msg)
                 return
             component_element, component_info = ret
             self._used_components[unique_name] = component_info
+            if self.layers is not None:
+                # The first instance can be excluded from the image, so the definition goes to <defs>
+                self._plotter.append_def_element(component_element)
+                component_element = etree.Element("use",
+                    attrib={"{http://www.w3.org/1999/xlink}href": "#" + component_info.id})
 
-        self._plotter.append_component_element(etree.Comment(f"{lib}:{name}:{ref}"))
+        comment = etree.Comment(f"{lib}:{name}:{ref}")
         group = etree.Element("g")
         group.append(component_element)
         ci = component_info
@@ -853,10 +874,14 @@ class PlotComponents(PlotInterface):
             f"scale({ci.scale[0]}, {ci.scale[1]}) " + \
             f"rotate({-math.degrees(position[2])}) " + \
             f"translate({-ci.origin[0]} {-ci.origin[1]})"
+        if self.layers is not None:
+            self.layers.append(ComponentLayer(ref, [comment, group], self._build_highlight(ref, component_info, position)))
+            return
+        self._plotter.append_component_element(comment)
         self._plotter.append_component_element(group)
 
         if self.highlight(ref):
-            self._build_highlight(ref, component_info, position)
+            self._plotter.append_highlight_element(self._build_highlight(ref, component_info, position))
 
     def _create_component(self, lib: str, name: str, ref: str, value: str) \
                              -> Optional[Tuple[etree.Element, PlacedComponentInfo]]:
@@ -898,7 +923,7 @@ class PlotComponents(PlotInterface):
         return width / vw, height / vh, x, y
 
     def _build_highlight(self, ref: str, info: PlacedComponentInfo,
-                         position: Tuple[int, int, float]) -> None:
+                         position: Tuple[int, int, float]) -> etree.Element:
         padding = mm2ki(self._plotter.get_style("highlight-padding"))
         h = etree.Element("rect", id=f"h_{ref}",
             x=str(self._plotter.ki2svg(-padding)),
@@ -910,7 +935,7 @@ class PlotComponents(PlotInterface):
             f"translate({self._plotter.ki2svg(position[0])} {self._plotter.ki2svg(position[1])}) " + \
             f"rotate({-math.degrees(position[2])}) " + \
             f"translate({-(info.origin[0] - info.svg_offset[0]) * info.scale[0]}, {-(info.origin[1] - info.svg_offset[1]) * info.scale[1]})"
-        self._plotter.append_highlight_element(h)
+        return h
 
     def _apply_resistor_code(self, root: etree.Element, id_prefix: str, ref: str, value: str) -> None:
         if root.find(f".//*[@id='{id_prefix}res_band1']") is None:
@@ -1103,6 +1128,65 @@ class PcbPlotter():
         self._shrink_svg(self._document, self.margin, self.compute_bbox)
         return self._document
 
+    def plot_layers(self) -> List[ComponentLayer]:
+        """
+        Plot the board, but keep the components apart. Returns the elements
+        for each component, use `compose` to get the SVG tree for a particular
+        set of components. This avoids plotting the board again and again when
+        we just want to show different components (i.e. populate).
+        """
+        self._build_libs_path()
+        self._setup_document(self.render_back, self.mirror)
+        layers: List[ComponentLayer] = []
+        for plotter in self.plot_plan:
+            if isinstance(plotter, PlotComponents):
+                plotter.layers = layers
+            plotter.render(self)
+        remove_inkscape_annotation(self._document.getroot())
+        for layer in layers:
+            for e in layer.elements:
+                remove_inkscape_annotation(e)
+        return layers
+
+    def compose(self, layers: List[ComponentLayer], filter: Callable[[str], bool],
+                highlight: Callable[[str], bool]) -> etree.ElementTree:
+        """
+        Create an SVG tree using the board plotted by `plot_layers` and the
+        components that pass the filter.
+        """
+        document = deepcopy(self._document)
+        root = document.getroot()
+        containers = {e.get("id"): e for e in root}
+        comp_cont = containers["componentContainer"]
+        high_cont = containers["highlightContainer"]
+        # The footprint definitions, the first visible instance of each one is moved inline, like `plot` does.
+        # Otherwise the `svg_paths` size detection can't see them (svgpathtools doesn't follow <use>)
+        defs = root[list(self._document.getroot()).index(self._defs)]
+        definitions = {e.get("id"): e for e in defs}
+        href = "{http://www.w3.org/1999/xlink}href"
+        # The components go before anything else in the container (i.e. placeholders)
+        pos = 0
+        for layer in layers:
+            if not filter(layer.ref):
+                continue
+            if layer.warning:
+                self.yield_warning("component", layer.warning)
+                continue
+            for e in layer.elements:
+                e = deepcopy(e)
+                for use in [u for u in e.iter("use")]:
+                    definition = definitions.pop(use.get(href, "")[1:], None)
+                    if definition is not None:
+                        defs.remove(definition)
+                        use.getparent().replace(use, definition)
+                comp_cont.insert(pos, e)
+                pos += 1
+            if highlight(layer.ref):
+                high_cont.append(deepcopy(layer.highlight))
+        remove_empty_elems(document.getroot())
+        self._shrink_svg(document, self.margin, self.compute_bbox)
+        return document
+
 
     def walk_components(self, invert_side: bool,
             callback: Callable[[str, str, str, str, Tuple[int, int, float]], None]) -> None:
@@ -1142,6 +1226,12 @@ class PcbPlotter():
         """
         return etree.SubElement(self._defs, tag_name, id=id)
 
+    def append_def_element(self, element: etree.Element) -> None:
+        """
+        Add new element into the definitions
+        """
+        self._defs.append(element)
+
     def append_board_element(self, element: etree.Element) -> None:
         """
         Add new element into the board container
@@ -11,7 +11,7 @@ Usage:
   kibot [-b BOARD] [-e SCHEMA] [-c CONFIG] [-d OUT_DIR] [-s PRE]
          [-q | -v...] [-L LOGFILE] [-C | -i | -n] [-m MKFILE] [-A] [-g DEF] ...
          [-E DEF] ... [--defs-from-env] [-w LIST] [-D | -W] [--warn-ci-cd]
-         [--banner N] [TARGET...]
+         [--banner N] [--profile] [TARGET...]
   kibot [-v...] [-b BOARD] [-e SCHEMA] [-c PLOT_CONFIG] [--banner N]
          [-E DEF] ... [--defs-from-env] [--config-outs]
          [--only-pre|--only-groups] [--only-names] [--output-name-first] --list
@@ -63,6 +63,8 @@ Options:
   -m MKFILE, --makefile MKFILE     Generate a Makefile (no targets created)
   -n, --no-priority                Don't sort targets by priority
   -p, --copy-options               Copy plot options from the PCB file
+  --profile                        Collect the time and memory used by each
+                                   step, see the `profile` global option
   --only-names                     Print only the names. Note that for --list
                                    if no other --only-* option is provided it
                                    also acts as a virtual --only-outputs
@@ -136,6 +138,7 @@ from . import dep_downloader
 from .misc import (EXIT_BAD_ARGS, W_VARCFG, NO_PCBNEW_MODULE, W_NOKIVER, hide_stderr, TRY_INSTALL_CHECK, W_ONWIN,
                    FAILED_EXECUTE, W_ONMAC)
 from .pre_base import BasePreFlight
+from .profiler import Profiler
 from .config_reader import (print_outputs_help, print_output_help, print_preflights_help, create_example, print_filters_help,
                             print_global_options_help, print_dependencies, print_variants_help, print_errors,
                             print_list_rotations, print_list_offsets)
@@ -462,6 +465,8 @@ def main():
     logger.debug('KiBot {} verbose level: {} started on {}'.format(__version__, args.verbose, datetime.now()))
     apply_warning_filter(args)
     log.stop_on_warnings = args.stop_on_warnings
+    if args.profile:
+        Profiler.enable('yes')
     # Now we have the debug level set we can check (and optionally inform) KiCad info
     detect_windows()
     detect_macos()
@@ -379,6 +379,8 @@ def main():
     parser.add_argument("-s", "--solder_joints", type=str, choices=["NONE", "SMART", "ALL"], default="SMART",
                         help="Add none, all or only for THT/SMD with solder paste [SMART]")
     parser.add_argument("-S", "--dont_stack_boards", action="store_false", help="do not stack sub-PCBs")
+    parser.add_argument("-V", "--views", type=int, nargs='+',
+                        help="points of view from the scene to export, the outputs are for these views [all]")
 
     parser.add_argument('PCB3D_file')
     args = parser.parse_args(argv)
@@ -415,19 +417,26 @@ def main():
     if args.no_denoiser:
         bpy.context.scene.cycles.use_denoising = False
     # Apply the scene first scene
-    c_views = apply_start_scene(args.scene)
+    # Note: the first point of view is always applied, the camera could be computed for it
+    views = range(apply_start_scene(args.scene))
+    if args.views:
+        if jscene is None or not all(0 <= n < len(views) for n in args.views):
+            print(f"The views must be points of view from the scene (views: {len(views)} requested: {args.views})")
+            sys.exit(2)
+        views = args.views
+    c_views = len(views)
     c_formats = len(args.format)
     if c_formats % c_views:
         print("The number of outputs must be a multiple of the views (views: {} outputs: {})".format(c_views, c_formats))
         sys.exit(2)
     per_pass = int(c_formats/c_views)
-    for n in range(c_views):
+    for i, n in enumerate(views):
         if n:
             # Apply scene N
             apply_scene(n)
         # Get the current slice
-        formats = args.format[n*per_pass:(n+1)*per_pass]
-        outputs = args.output[n*per_pass:(n+1)*per_pass]
+        formats = args.format[i*per_pass:(i+1)*per_pass]
+        outputs = args.output[i*per_pass:(i+1)*per_pass]
         # Do all the exports
         for f, o in zip(formats, outputs):
             print(f"Exporting {o} in {f} format")
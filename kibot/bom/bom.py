@@ -207,6 +207,10 @@ class ComponentGroup(object):
             qty = sum((c.qty for c in self.components if c.project == project))
         return self.round_qty(qty)
 
+    def get_fitted_count(self, fitted):
+        """ Components fitted in a variant, `fitted` is the set of ids for the fitted components """
+        return self.round_qty(sum((c.qty for c in self.components if id(c) in fitted)))
+
     def get_build_count(self):
         if not self.is_fitted():
             # Not fitted -> 0
@@ -479,6 +483,9 @@ def group_components(cfg, components):
                         cfg.footprint_populate_values, cfg.footprint_type_values, uses_fp_info, cfg.use_alt)
         if cfg.normalize_values:
             g.fields[ColumnList.COL_VALUE_L] = normalize_value(g.components[0], decimal_point)
+        # Quantities for each variant (`columns` mode of `variants`)
+        for name, fitted in cfg._variants_qty:
+            g.fields[name.lower()] = str(g.get_fitted_count(fitted))
     # Sort the groups
     if cfg.sort_style == 'type_value':
         # First priority is the Type of component (e.g. R?, U?, L?)
@@ -5,7 +5,6 @@
 # Project: KiBot (formerly KiPlot)
 
 from decimal import Decimal
-from lark import Lark, Transformer
 import os
 from ..gs import GS
 from .. import log
@@ -24,16 +23,24 @@ TO_IMPERIAL = {'0402': '01005',
                '4532': '1812',
                '5025': '2010',
                '6332': '2512'}
+# Full grammar (Earley) and the fast path for the common cases (LALR)
 parser = None
+fast_parser = None
 
 
-class ComponentTransformer(Transformer):
+class ComponentTransformer(object):
     """ Transforms a tree parsed by Lark to the electro-grammar dict """
     def __init__(self):
         self.parsed = {}
         # Extra information, not in the original lib and needed for internal purposes
         self.extra = {}
 
+    def transform(self, tree):
+        """ Bottom-up, like lark.Transformer. Implemented here, so we don't need to import Lark to load this module """
+        children = [self.transform(c) if hasattr(c, 'children') else c for c in tree.children]
+        callback = getattr(self, tree.data, None)
+        return children if callback is None else callback(children)
+
     def value3(self, d, type):
         """ VALUE [METRIC_PREFIX [MANTISSA]] """
         v = Decimal(d[0])
@@ -96,12 +103,12 @@ class ComponentTransformer(Transformer):
         if len(d) == 1:
             # 1 W
             v = float(d[0])
-        elif d[0].type == 'INT':
-            # 1/4 W
-            v = float(d[0].value)/float(d[1].value)
-        else:
+        elif isinstance(d[1], Decimal):
             # 250 mW
             v = float(Decimal(d[0].value)*d[1])
+        else:
+            # 1/4 W
+            v = float(d[0].value)/float(d[1].value)
         self.parsed['power_rating'] = v
         return v
 
@@ -192,13 +199,52 @@ class ComponentTransformer(Transformer):
         return None
 
 
+def get_cache_file():
+    """ File used by Lark to store the compiled LALR parser """
+    fname = os.environ.get('KIBOT_GRAMMAR_CACHE')
+    if fname is None:
+        fname = os.path.join(os.path.expanduser('~'), '.cache', 'kibot', 'electro_lalr.cache')
+    return fname
+
+
+def load_grammar(name):
+    with open(os.path.join(GS.get_resource_path('parsers'), name), 'rt') as f:
+        return f.read()
+
+
 def initialize():
-    global parser
-    if parser is not None:
+    global fast_parser
+    if fast_parser is not None:
         return
-    with open(os.path.join(GS.get_resource_path('parsers'), 'electro.lark'), 'rt') as f:
-        g = f.read()
-    parser = Lark(g, start='main')  # , debug=DEBUG)
+    # Lark is slow to import, only do it when we really need to parse a value
+    from lark import Lark
+    # The LALR parser can be loaded from a cache, this is much faster than compiling the grammar
+    g = load_grammar('electro_lalr.lark')
+    cache = get_cache_file()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache)), exist_ok=True)
+        fast_parser = Lark(g, start='main', parser='lalr', cache=cache)
+    except Exception as e:
+        logger.debug(f'Failed to use the grammar cache ({e})')
+        fast_parser = Lark(g, start='main', parser='lalr')
+
+
+def get_parser():
+    """ The full grammar is ambiguous, so we need Earley, it can't be cached and is slow to compile """
+    global parser
+    if parser is None:
+        from lark import Lark
+        parser = Lark(load_grammar('electro.lark'), start='main')  # , debug=DEBUG)
+    return parser
+
+
+def parse_tree(text):
+    """ Tries the fast parser, if the text isn't one of the common cases uses the full grammar """
+    try:
+        return fast_parser.parse(text)
+    except Exception as e:
+        logger.debugl(3, 'Not using the fast path: '+str(e))
+    return get_parser().parse(text)
 
 
 def parse(text, with_extra=False, stronger=False):
@@ -207,7 +253,7 @@ def parse(text, with_extra=False, stronger=False):
         text = text.replace('+/-', ' +/-')
         text = text.replace(' - ', ' ')
     try:
-        tree = parser.parse(text)
+        tree = parse_tree(text)
     except Exception as e:
         logger.debugl(2, str(e))
         return {}
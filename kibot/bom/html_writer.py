@@ -10,6 +10,7 @@ HTML Writer: Generates a HTML BoM file.
 """
 import os
 from base64 import b64encode
+from hashlib import sha1
 from .columnlist import ColumnList, BoMError
 from .kibot_logo import KIBOT_LOGO, KIBOT_LOGO_W, KIBOT_LOGO_H
 from ..misc import (read_png, STYLE_COMMON, TABLE_MODERN, TABLE_CLASSIC, HEAD_COLOR_R, HEAD_COLOR_R_L, HEAD_COLOR_G,
@@ -151,15 +152,115 @@ def cell_class(col):
     return 'user'  # BG_USER
 
 
+# Rows joined before writing them to the file
+CHUNK_ROWS = 256
+# Cache for the embedded images, the key is the hash of the file content
+EMBEDDED_IMAGES = {}
+# Small loader to show the big tables in pages, only the rows of the current page are rendered.
+# Must be after SORT_CODE, so we paginate again after sorting.
+PAGE_CODE = ('<script charset="utf-8">\n'
+             '  (function(d, size) {\n'
+             '    "use strict";\n'
+             '    function paginate(table) {\n'
+             '      var body = table.tBodies[0], page = 0, all = false, nav = d.createElement("div");\n'
+             '      nav.className = "page-nav";\n'
+             '      table.parentNode.insertBefore(nav, table.nextSibling);\n'
+             '      function button(text, enabled, action) {\n'
+             '        var b = d.createElement("button");\n'
+             '        b.textContent = text;\n'
+             '        b.disabled = !enabled;\n'
+             '        b.addEventListener("click", function() { action(); show() });\n'
+             '        nav.appendChild(b)\n'
+             '      }\n'
+             '      function show() {\n'
+             '        var rows = body.rows, pages = Math.ceil(rows.length / size);\n'
+             '        page = Math.min(page, pages - 1);\n'
+             '        for (var i = 0; i < rows.length; ++i)\n'
+             '          rows[i].style.display = all || Math.floor(i / size) == page ? "" : "none";\n'
+             '        nav.textContent = "";\n'
+             '        button("<", !all && page > 0, function() { page-- });\n'
+             '        nav.appendChild(d.createTextNode(all ? " All rows " : " Page " + (page + 1) + " of " + pages + " "));\n'
+             '        button(">", !all && page < pages - 1, function() { page++ });\n'
+             '        button(all ? "Pages" : "All", true, function() { all = !all })\n'
+             '      }\n'
+             '      table.showRow = function(row) { page = Math.floor(row.sectionRowIndex / size); show() };\n'
+             '      table.tHead.addEventListener("click", show);\n'
+             '      show()\n'
+             '    }\n'
+             '    function reveal() {\n'
+             '      var e = location.hash && d.getElementById(decodeURIComponent(location.hash.substring(1)));\n'
+             '      var row = e && e.closest("tr"), table = row && row.closest("table");\n'
+             '      if (table && table.showRow) {\n'
+             '        table.showRow(row);\n'
+             '        e.scrollIntoView()\n'
+             '      }\n'
+             '    }\n'
+             '    d.addEventListener("DOMContentLoaded", function() {\n'
+             '      for (var t = d.getElementsByClassName("content-table"), i = 0; i < t.length; ++i)\n'
+             '        if (t[i].tBodies[0].rows.length > size) paginate(t[i]);\n'
+             '      reveal()\n'
+             '    });\n'
+             '    window.addEventListener("hashchange", reveal)\n'
+             '  })(document, @size@)\n'
+             '</script>\n')
+PAGE_STYLE = " .page-nav { margin: 0.5em 0 1em 0; }\n"
+
+
 def link(text):
-    for t in ["http", "https", "ftp", "www"]:
-        if text.startswith(t):
-            return '<a href="{t}">{t}</a>'.format(t=text)
+    if text.startswith(('http', 'ftp', 'www')):
+        return '<a href="{t}">{t}</a>'.format(t=text)
     return text
 
 
-def content_table(html, groups, headings, head_names, cfg, link_datasheet, link_digikey, link_mouser, link_lcsc, col_colors,
-                  row_colors, dnf=False):
+class CellTemplate(object):
+    """ Precomputed data to render the cells of a column """
+    def __init__(self, heading, n, cfg, link_datasheet, link_digikey, link_mouser, link_lcsc, col_colors):
+        super().__init__()
+        # Links to the distributors, applied in this order
+        self.links = []
+        if link_digikey and heading in link_digikey:
+            self.links.append('<a href="https://www.digikey.com/products/en?keywords={r}">{r}</a>')
+        if link_mouser and heading in link_mouser:
+            self.links.append('<a href="https://www.mouser.com/ProductDetail/{r}">{r}</a>')
+        if link_lcsc and heading in link_lcsc:
+            self.links.append('<a href="https://www.lcsc.com/product-detail/{r}.html">{r}</a>')
+        self.datasheet = link_datasheet == n
+        # Classes for the even and odd rows
+        if col_colors:
+            cl = cell_class(heading)
+            self.classes = (' class="td-{}0"'.format(cl), ' class="td-{}1"'.format(cl))
+            self.empty = (' class="td-empty0"', ' class="td-empty1"') if cfg.html.highlight_empty else None
+        else:
+            self.classes = (' class="td-nocolor"', ' class="td-nocolor"')
+            self.empty = None
+        self.ref_sep = cfg.ref_separator if heading == ColumnList.COL_REFERENCE_L else None
+
+    def render(self, r, parity, style, datasheet):
+        for lnk in self.links:
+            r = lnk.format(r=r)
+        # Link this column to the datasheet?
+        if self.datasheet and datasheet.startswith('http'):
+            r = '<a href="' + datasheet + '">' + r + '</a>'
+        # Empty cell?
+        if self.empty is not None and (len(r) == 0 or r.strip() == "~"):
+            cl = self.empty[parity]
+        else:
+            cl = self.classes[parity]
+        if self.ref_sep is not None:
+            r = ''.join('<div id="{}"></div>'.format(ref) for ref in reversed(r.split(self.ref_sep)))+r
+        return '   <td' + cl + style + '>' + link(r) + '</td>\n'
+
+
+def compile_row(headings, cfg, link_datasheet, link_digikey, link_mouser, link_lcsc, col_colors):
+    """ Templates for the cells of each column. Computed once for all the tables """
+    return [CellTemplate(h, n, cfg, link_datasheet, link_digikey, link_mouser, link_lcsc, col_colors)
+            for n, h in enumerate(headings)]
+
+
+def content_table(html, groups, headings, head_names, cfg, link_datasheet, cells, col_colors, row_colors, dnf=False):
+    """ Writes the table, the rows are joined in chunks of CHUNK_ROWS.
+        `cells` is the list of templates from `compile_row`.
+        Returns the number of rows """
     cl = ''
     # Table start
     html.write('<table class="content-table">\n')
@@ -176,59 +277,45 @@ def content_table(html, groups, headings, head_names, cfg, link_datasheet, link_
 
     html.write(" <tbody>\n")
     rc = 0
-    hl_empty = cfg.html.highlight_empty
+    datasheet = ''
+    chunk = []
     for i, group in enumerate(groups):
         if (cfg.ignore_dnf and not group.is_fitted()) != dnf:
             continue
         # Check if the user wants a color for this row
-        row_color = None
+        style = ''
         for r_color in row_colors:
             c = group.components[0]
             if r_color.filter.filter(c):
-                row_color = r_color.color
+                style = f' style="background-color: {r_color.color}"'
                 break
         row = group.get_row(headings)
         if link_datasheet != -1:
             datasheet = group.get_field(ColumnList.COL_DATASHEET_L)
-        html.write('  <tr id="{}">\n'.format(i))
-        for n, r in enumerate(row):
-            # A link to Digi-Key?
-            if link_digikey and headings[n] in link_digikey:
-                r = '<a href="https://www.digikey.com/products/en?keywords=' + r + '">' + r + '</a>'
-            if link_mouser and headings[n] in link_mouser:
-                r = '<a href="https://www.mouser.com/ProductDetail/' + r + '">' + r + '</a>'
-            if link_lcsc and headings[n] in link_lcsc:
-                r = '<a href="https://www.lcsc.com/product-detail/' + r + '.html">' + r + '</a>'
-            # Link this column to the datasheet?
-            if link_datasheet == n and datasheet.startswith('http'):
-                r = '<a href="' + datasheet + '">' + r + '</a>'
-            if col_colors:
-                # Empty cell?
-                if hl_empty and (len(r) == 0 or r.strip() == "~"):
-                    cl = 'empty'
-                else:
-                    cl = cell_class(headings[n])
-                cl = ' class="td-{}{}"'.format(cl, rc % 2)
-            else:
-                cl = ' class="td-nocolor"'
-            if row_color is not None:
-                cl += f' style="background-color: {row_color}"'
-            if headings[n] == ColumnList.COL_REFERENCE_L:
-                for ref in r.split(cfg.ref_separator):
-                    r = '<div id="{}"></div>'.format(ref)+r
-            html.write('   <td{}>{}</td>\n'.format(cl, link(r)))
-        html.write("  </tr>\n")
+        parity = rc % 2
+        chunk.append('  <tr id="{}">\n'.format(i))
+        chunk.extend(cell.render(r, parity, style, datasheet) for cell, r in zip(cells, row))
+        chunk.append("  </tr>\n")
         rc += 1
+        if rc % CHUNK_ROWS == 0:
+            html.write(''.join(chunk))
+            chunk = []
+    html.write(''.join(chunk))
     html.write(" </tbody>\n")
     html.write("</table>\n")
-    return
+    return rc
 
 
 def embed_image(file):
+    """ The image as a data URI. Cached by content, so the same logo is encoded only once """
     s, w, h = read_png(file)
     if s is None:
         raise BoMError('Only PNG images are supported for the logo')
-    return int(w), int(h), 'data:image/png;base64,'+b64encode(s).decode('ascii')
+    key = sha1(s).hexdigest()
+    img = EMBEDDED_IMAGES.get(key)
+    if img is None:
+        img = EMBEDDED_IMAGES[key] = 'data:image/png;base64,'+b64encode(s).decode('ascii')
+    return int(w), int(h), img
 
 
 def write_stats(html, cfg):
@@ -328,6 +415,7 @@ def write_html(filename, groups, headings, head_names, cfg):
     link_lcsc = cfg.html.lcsc_link
     col_colors = cfg.html.col_colors
     row_colors = cfg.html.row_colors
+    page_size = cfg.html.page_size
     # Compute the CSS
     style_name = cfg.html.style
     if os.path.isfile(style_name):
@@ -364,6 +452,8 @@ def write_html(filename, groups, headings, head_names, cfg):
         # CSS
         html.write("<style>\n")
         html.write(style)
+        if page_size:
+            html.write(PAGE_STYLE)
         html.write("</style>\n")
         html.write("</head>\n")
 
@@ -399,15 +489,15 @@ def write_html(filename, groups, headings, head_names, cfg):
             html.write('</table>\n')
 
         # Fitted groups
+        cells = compile_row(headings, cfg, link_datasheet, link_digikey, link_mouser, link_lcsc, col_colors)
         html.write("<h2>Component Groups</h2>\n")
-        content_table(html, groups, headings, head_names, cfg, link_datasheet, link_digikey, link_mouser, link_lcsc,
-                      col_colors, row_colors)
+        rows = content_table(html, groups, headings, head_names, cfg, link_datasheet, cells, col_colors, row_colors)
 
         # DNF component groups
         if cfg.html.generate_dnf and cfg.n_total != cfg.n_fitted:
             html.write("<h2>Optional components (DNF=Do Not Fit)</h2>\n")
-            content_table(html, groups, headings, head_names, cfg, link_datasheet, link_digikey, link_mouser, link_lcsc,
-                          col_colors, row_colors, True)
+            rows = max(rows, content_table(html, groups, headings, head_names, cfg, link_datasheet, cells, col_colors,
+                                           row_colors, True))
 
         # Color reference
         if col_colors:
@@ -429,6 +519,8 @@ def write_html(filename, groups, headings, head_names, cfg):
             html.write('</table>\n')
 
         html.write(SORT_CODE)
+        if page_size and rows > page_size:
+            html.write(PAGE_CODE.replace('@size@', str(page_size)))
         html.write("</body></html>")
 
     return True
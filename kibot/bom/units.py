@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
-# Copyright (c) 2020-2023 Salvador E. Tropea
-# Copyright (c) 2020-2023 Instituto Nacional de Tecnología Industrial
+# Copyright (c) 2020-2024 Salvador E. Tropea
+# Copyright (c) 2020-2024 Instituto Nacional de Tecnología Industrial
 # Copyright (c) 2016-2020 Oliver Henry Walters (@SchrodingersGat)
 # License: MIT
 # Project: KiBot (formerly KiPlot)
@@ -12,12 +12,16 @@ e.g.
 0.1uF = 100n (different suffix specified, one has missing unit)
 0R1 = 0.1Ohm (Unit replaces decimal, different units)
 Oriented to normalize and sort R, L and C values.
+The parsed values are cached between runs.
 """
 from decimal import Decimal
+import json
 import re
 import locale
 from math import log10
-from .. import log
+import os
+from ..gs import GS
+from .. import log, __version__
 from ..misc import W_BADVAL1, W_BADVAL2, W_BADVAL3, W_BADVAL4, W_EXTRAINVAL
 from .electro_grammar import parse
 
@@ -51,8 +55,14 @@ GRAM_TYPES = {'inductor': 'L', 'capacitor': 'C', 'resistor': 'R', 'led': ''}
 match = None
 # Current locale decimal point value
 decimal_point = None
-# Parser cache
-parser_cache = {}
+# Parser cache: (value, ref prefix, stronger, decimal point) -> (ParsedValue or None, warnings, has extra data)
+parser_cache = None
+# Keys used during this run
+parser_cache_used = set()
+# True when we parsed values not in the cache
+parser_cache_changed = False
+# Maximum number of values we keep between runs
+MAX_CACHED_VALUES = 50000
 # Flag to indicate we already warned about extra data
 warn_extra_issued = False
 
@@ -88,6 +98,77 @@ class ParsedValue(object):
     def get_extra(self, property):
         return self.extra.get(property) if self.extra else None
 
+    def get_data(self):
+        return [self.norm_val, self.exp, self.unit, self.extra]
+
+    @staticmethod
+    def from_data(data):
+        parsed = ParsedValue.__new__(ParsedValue)
+        parsed.norm_val, parsed.exp, parsed.unit, parsed.extra = data
+        parsed.prefix = PREFIXES[parsed.exp]
+        return parsed
+
+
+def get_cache_file():
+    fname = os.environ.get('KIBOT_VALUES_CACHE')
+    if fname is None:
+        fname = os.path.join(os.path.expanduser('~'), '.cache', 'kibot', 'values.json')
+    return fname
+
+
+def to_json(o):
+    if isinstance(o, Decimal):
+        return {'__decimal__': str(o)}
+    raise TypeError(f'Unexpected type {type(o)}')
+
+
+def from_json(o):
+    return Decimal(o['__decimal__']) if '__decimal__' in o else o
+
+
+def get_parser_cache():
+    """ The cache, loaded from disk the first time.
+        Discarded when created by another KiBot version """
+    global parser_cache
+    if parser_cache is not None:
+        return parser_cache
+    parser_cache = {}
+    fname = get_cache_file()
+    try:
+        with open(fname, 'rt') as f:
+            data = json.load(f, object_hook=from_json)
+    except (OSError, ValueError):
+        return parser_cache
+    if data.get('version') != __version__:
+        logger.debug('Discarding values cache from KiBot v'+str(data.get('version')))
+        return parser_cache
+    for value, ref_prefix, stronger, dp, parsed, warnings, extra in data.get('values', []):
+        parsed = ParsedValue.from_data(parsed) if parsed is not None else None
+        parser_cache[(value, ref_prefix, stronger, dp)] = (parsed, warnings, extra)
+    logger.debug(f'Loaded {len(parser_cache)} values from {fname}')
+    return parser_cache
+
+
+def save_parser_cache():
+    """ Stores the cache for the next runs, only if we parsed new values """
+    if not parser_cache_changed:
+        return
+    # Values used in this run go last, they are the last to be discarded
+    keys = [k for k in parser_cache if k not in parser_cache_used]+[k for k in parser_cache if k in parser_cache_used]
+    values = []
+    for k in keys[-MAX_CACHED_VALUES:]:
+        parsed, warnings, extra = parser_cache[k]
+        values.append(list(k)+[parsed.get_data() if parsed is not None else None, warnings, extra])
+    fname = get_cache_file()
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        # Write to a temporal and then rename, the cache can be shared by concurrent runs
+        tmp = GS.tmp_file(content=json.dumps({'version': __version__, 'values': values}, default=to_json),
+                          suffix='.json', dir=os.path.dirname(fname))
+        os.replace(tmp, fname)
+    except OSError as e:
+        logger.debug(f'Failed to save the values cache: {e}')
+
 
 def get_unit(unit, ref_prefix):
     """ Return a simplified version of a units string, for comparison purposes  """
@@ -167,13 +248,28 @@ def value_from_grammar(r):
     return parsed
 
 
-def check_extra_data(r, v):
+def has_extra_data(r):
+    return 'tolerance' in r or 'characteristic' in r or 'voltage_rating' in r or 'power_rating' in r or 'size' in r
+
+
+def check_extra_data(v):
     global warn_extra_issued
     if warn_extra_issued:
         return
-    if 'tolerance' in r or 'characteristic' in r or 'voltage_rating' in r or 'power_rating' in r or 'size' in r:
-        logger.warning(W_EXTRAINVAL+f'Avoid adding extra information in the component value, use separated fields ({v})')
-        warn_extra_issued = True
+    logger.warning(W_EXTRAINVAL+f'Avoid adding extra information in the component value, use separated fields ({v})')
+    warn_extra_issued = True
+
+
+def init_decimal_point():
+    """ Decimal point from the current locale, empty for '.' """
+    global decimal_point
+    if decimal_point is None:
+        decimal_point = locale.localeconv()['decimal_point']
+        logger.debug('Decimal point `{}`'.format(decimal_point))
+        # Avoid conversions for '.'
+        if decimal_point == '.':
+            decimal_point = ''
+    return decimal_point
 
 
 def comp_match(component, ref_prefix, ref=None, relax_severity=False, stronger=False, warn_extra=False):
@@ -181,24 +277,38 @@ def comp_match(component, ref_prefix, ref=None, relax_severity=False, stronger=F
     Return a normalized value and units for a given component value string
     Also tries to separate extra data, i.e. tolerance, using a complex parser
     """
+    global parser_cache_changed
+    cache = get_parser_cache()
+    key = (component, ref_prefix, stronger, init_decimal_point())
+    res = cache.get(key)
+    if res is None:
+        res = cache[key] = parse_value(component, ref_prefix, stronger)
+        parser_cache_changed = True
+    parsed, warnings, extra = res
+    first = key not in parser_cache_used
+    # Warnings for bad values are always reported, the rest only the first time
+    if warnings and (parsed is None or first):
+        log_func_warn = logger.debug if relax_severity else logger.warning
+        where = ' in {}'.format(ref) if ref is not None else ''
+        for w in warnings:
+            log_func_warn(w+where+')')
+    if warn_extra and extra:
+        check_extra_data(component)
+    parser_cache_used.add(key)
+    return parsed
+
+
+def parse_value(component, ref_prefix, stronger):
+    """ Does the real work for `comp_match`.
+        Returns the ParsedValue (or None), the warnings (without the location and the closing parenthesis) and
+        if we found extra information """
     original = component
-    global parser_cache
-    parsed = parser_cache.get(original+ref_prefix)
-    if parsed:
-        return parsed
     # Remove useless spaces
     component = component.strip()
     # ~ is the same as empty for KiCad
     if component == '~':
         component = ''
     # Convert the decimal point from the current locale to a '.'
-    global decimal_point
-    if decimal_point is None:
-        decimal_point = locale.localeconv()['decimal_point']
-        logger.debug('Decimal point `{}`'.format(decimal_point))
-        # Avoid conversions for '.'
-        if decimal_point == '.':
-            decimal_point = ''
     if decimal_point:
         component = re.sub(r'(\d)'+decimal_point+r'(\d)', r'\1.\2', component)
 
@@ -212,8 +322,6 @@ def comp_match(component, ref_prefix, ref=None, relax_severity=False, stronger=F
         # Ignore case
         match = re.compile(match_string(), flags=re.IGNORECASE)
 
-    log_func_warn = logger.debug if relax_severity else logger.warning
-    where = ' in {}'.format(ref) if ref is not None else ''
     result = match.match(component)
     if not result:
         # This is used to parse things like "1/8 W", but we get "1/8" here
@@ -221,31 +329,28 @@ def comp_match(component, ref_prefix, ref=None, relax_severity=False, stronger=F
         if result:
             val = int(result.group(1))/int(result.group(2))
             val, pow = get_prefix(val, '')
-            parsed = ParsedValue(val, pow, get_unit('', ref_prefix))
-            # Cache the result
-            parser_cache[original+ref_prefix] = parsed
-            return parsed
+            return ParsedValue(val, pow, get_unit('', ref_prefix)), [], False
     if not result:
-        # Failed with the regex, try with the parser
-        result = parse(ref_prefix[0]+' '+with_commas, with_extra=True, stronger=stronger)
+        # Failed with the regex, try with the parser.
+        # Without digits the parser can't find a value or extra data, this is the case for most ICs, connectors, etc.
+        if re.search(r'\d', with_commas):
+            result = parse(ref_prefix[0]+' '+with_commas, with_extra=True, stronger=stronger)
+        warnings = []
+        extra = False
         if result:
-            if warn_extra:
-                check_extra_data(result, original)
+            extra = has_extra_data(result)
             result = value_from_grammar(result)
             if result and result.get_extra('discarded'):
                 discarded = " ".join(('`'+x+'`' for x in result.get_extra('discarded')))
-                log_func_warn(W_BADVAL4+"Malformed value: `{}` (discarded: {}{})".format(original, discarded, where))
+                warnings.append(W_BADVAL4+"Malformed value: `{}` (discarded: {}".format(original, discarded))
         if not result:
-            log_func_warn(W_BADVAL1+"Malformed value: `{}` (no match{})".format(original, where))
-            return None
-        # Cache the result
-        parser_cache[original+ref_prefix] = result
-        return result
+            warnings.append(W_BADVAL1+"Malformed value: `{}` (no match".format(original))
+            return None, warnings, extra
+        return result, warnings, extra
 
     value, prefix, units, post = result.groups()
     if value == '.':
-        log_func_warn(W_BADVAL2+"Malformed value: `{}` (reduced to decimal point{})".format(original, where))
-        return None
+        return None, [W_BADVAL2+"Malformed value: `{}` (reduced to decimal point".format(original)], False
     if value == '':
         value = '0'
 
@@ -255,8 +360,7 @@ def comp_match(component, ref_prefix, ref=None, relax_severity=False, stronger=F
     # We will also have a trailing number
     if post:
         if "." in value:
-            log_func_warn(W_BADVAL3+"Malformed value: `{}` (unit split, but contains decimal point{})".format(original, where))
-            return None
+            return None, [W_BADVAL3+"Malformed value: `{}` (unit split, but contains decimal point".format(original)], False
         value = float(value)
         postValue = float(post)/(10**len(post))
         val = value*1.0+postValue
@@ -265,10 +369,7 @@ def comp_match(component, ref_prefix, ref=None, relax_severity=False, stronger=F
 
     # Create an object with the result
     val, pow = get_prefix(val, prefix)
-    parsed = ParsedValue(val, pow, get_unit(units, ref_prefix))
-    # Cache the result
-    parser_cache[original+ref_prefix] = parsed
-    return parsed
+    return ParsedValue(val, pow, get_unit(units, ref_prefix)), [], False
 
 
 def compare_values(c1, c2):
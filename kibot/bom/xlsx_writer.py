@@ -360,15 +360,36 @@ def adjust_widths(worksheet, column_widths, max_width, levels):
             worksheet.set_column(i, i, width, None, {'level': levels[i]})
 
 
-def adjust_heights(worksheet, rows, max_width, head_size):
-    for rn, r in enumerate(rows):
-        max_h = 1
-        for c in r:
-            if len(c) > max_width:
-                h = len(wrap(c, max_width))
-                max_h = max(h, max_h)
-        if max_h > 1:
-            worksheet.set_row(head_size+rn, 15.0*max_h)
+def adjust_height(worksheet, row_num, row, max_width):
+    """ Makes room for the wrapped text. Must be called before writing the row (constant_memory mode) """
+    max_h = 1
+    for c in row:
+        if len(c) > max_width:
+            h = len(wrap(c, max_width))
+            max_h = max(h, max_h)
+    if max_h > 1:
+        worksheet.set_row(row_num, 15.0*max_h)
+
+
+class SortedRows(object):
+    """ Worksheet proxy that collects the cells and then writes them sorted by row.
+        In constant_memory mode the rows must be written in order, but the page head is written column by column """
+    DELAYED = {'write_string', 'write_number', 'merge_range', 'set_row'}
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self.worksheet, name)
+        if name in self.DELAYED:
+            return lambda *args: self.calls.append((args[0], len(self.calls), attr, args))
+        return attr
+
+    def flush(self):
+        for _, _, func, args in sorted(self.calls, key=lambda x: x[:2]):
+            func(*args)
+        self.calls = []
 
 
 def write_info(cfg, r_info_start, worksheet, column_widths, col1, fmt_info, fmt_subtitle, compact=False):
@@ -755,7 +776,12 @@ def write_xlsx(filename, groups, col_fields, head_names, cfg):
     link_lcsc = cfg.xlsx.lcsc_link
     hl_empty = cfg.xlsx.highlight_empty
 
-    workbook = Workbook(filename)
+    # In constant_memory mode the rows are written as soon as we start a new one, so the memory usage is bounded.
+    # KiCost fills its cells in arbitrary order, so we can't use it.
+    constant_memory = cfg.xlsx.constant_memory and not cfg.xlsx.kicost
+    if constant_memory:
+        logger.debug('Using XLSX constant memory mode')
+    workbook = Workbook(filename, {'constant_memory': constant_memory})
     ws_names = ['BoM', 'DNF']
     row_headings = head_names
 
@@ -796,15 +822,28 @@ def write_xlsx(filename, groups, col_fields, head_names, cfg):
             break
 
         worksheet = workbook.add_worksheet(ws_names[ws])
-        row_count = head_size
-
-        # Headings
-        # Create the head titles
         column_widths = [0]*max(len(col_fields), 6)
-        rows = [row_headings]
         for i in range(len(row_headings)):
             # Title for this column
             column_widths[i] = len(row_headings[i]) + 10
+
+        # Page head
+        head = SortedRows(worksheet) if constant_memory else worksheet
+        # Logo
+        col1 = insert_logo(head, image_data, cfg.xlsx.logo_scale)
+        # Title
+        do_title(cfg, head, col1, len(column_widths)-1, fmt_title, fmt_info[0] if fmt_info else None)
+        # PCB & Stats Info
+        if not (cfg.xlsx.hide_pcb_info and cfg.xlsx.hide_stats_info):
+            write_info(cfg, r_info_start, head, column_widths, col1, fmt_info, fmt_subtitle)
+        if constant_memory:
+            head.flush()
+
+        # Headings
+        # Create the head titles
+        row_count = head_size
+        adjust_height(worksheet, row_count, row_headings, max_width)
+        for i in range(len(row_headings)):
             worksheet.write_string(row_count, i, row_headings[i], fmt_head)
             if cfg._column_comments[i]:
                 worksheet.write_comment(row_count, i, cfg._column_comments[i])
@@ -816,7 +855,7 @@ def write_xlsx(filename, groups, col_fields, head_names, cfg):
                 continue
             # Get the data row
             row = group.get_row(col_fields)
-            rows.append(row)
+            adjust_height(worksheet, row_count, row, max_width)
             if link_datasheet != -1:
                 datasheet = group.get_field(ColumnList.COL_DATASHEET_L)
             # Check if the user wants a color for this row
@@ -856,18 +895,8 @@ def write_xlsx(filename, groups, col_fields, head_names, cfg):
                     column_widths[i] = len(cell) + 5
             row_count += 1
 
-        # Page head
-        # Logo
-        col1 = insert_logo(worksheet, image_data, cfg.xlsx.logo_scale)
-        # Title
-        do_title(cfg, worksheet, col1, len(column_widths)-1, fmt_title, fmt_info[0] if fmt_info else None)
-        # PCB & Stats Info
-        if not (cfg.xlsx.hide_pcb_info and cfg.xlsx.hide_stats_info):
-            write_info(cfg, r_info_start, worksheet, column_widths, col1, fmt_info, fmt_subtitle)
-
-        # Adjust cols and rows
+        # Adjust cols, the widths are stored apart, so this is valid in constant_memory mode
         adjust_widths(worksheet, column_widths, max_width, cfg._column_levels)
-        adjust_heights(worksheet, rows, max_width, head_size)
 
         worksheet.freeze_panes(head_size+1, 0)
         worksheet.repeat_rows(head_size+1)
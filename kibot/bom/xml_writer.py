@@ -9,8 +9,7 @@
 """
 XML Writer: Generates an XML BoM file.
 """
-from xml.etree import ElementTree
-from xml.dom import minidom
+from ..xml_stream import XMLWriter
 
 
 def write_xml(filename, groups, headings, head_names, cfg):
@@ -46,25 +45,25 @@ def write_xml(filename, groups, headings, head_names, cfg):
             attrib['Fitted_Components{}'.format(n)] = str(prj.fitted_str)
             attrib['Number_of_PCBs{}'.format(n)] = str(prj.number)
             attrib['Total_Components{}'.format(n)] = str(prj.comp_build)
-    xml = ElementTree.Element('KiCad_BOM', attrib=attrib, encoding='utf-8')
-    for group in groups:
-        if cfg.ignore_dnf and not group.is_fitted():
-            continue
-        row = group.get_row(headings)
-        attrib = {}
-        for i, h in enumerate(head_names):
-            # Adapt the column name to a valid XML attribute name
-            h = h.replace(' ', '_')
-            h = h.replace('/', '_')
-            h = h.replace('"', '')
-            h = h.replace("'", '')
-            h = h.replace('#', '_num')
-            attrib[h] = str(row[i])
-        ElementTree.SubElement(xml, "group", attrib=attrib)
-
+    # The `encoding` attribute is here for compatibility with old versions
+    attrib['encoding'] = 'utf-8'
     with open(filename, "wb") as output:
-        out = ElementTree.tostring(xml, encoding="utf-8")
-        reparsed = minidom.parseString(out.decode('utf-8'))
-        output.write(reparsed.toprettyxml(indent="\t", encoding="utf-8"))
+        xml = XMLWriter(output)
+        xml.start('KiCad_BOM', attrib)
+        for group in groups:
+            if cfg.ignore_dnf and not group.is_fitted():
+                continue
+            row = group.get_row(headings)
+            attrib = {}
+            for i, h in enumerate(head_names):
+                # Adapt the column name to a valid XML attribute name
+                h = h.replace(' ', '_')
+                h = h.replace('/', '_')
+                h = h.replace('"', '')
+                h = h.replace("'", '')
+                h = h.replace('#', '_num')
+                attrib[h] = str(row[i])
+            xml.element('group', attrs=attrib)
+        xml.close()
 
     return True
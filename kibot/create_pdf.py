@@ -1,36 +1,186 @@
 # -*- coding: utf-8 -*-
-# Copyright (c) 2022 Salvador E. Tropea
-# Copyright (c) 2022 Instituto Nacional de Tecnología Industrial
+# Copyright (c) 2022-2024 Salvador E. Tropea
+# Copyright (c) 2022-2024 Instituto Nacional de Tecnología Industrial
 # Copyright (c) 2022 Albin Dennevi (create_pdf_from_pages)
 # License: GPL-3.0
 # Project: KiBot (formerly KiPlot)
 # Base idea: https://gitlab.com/dennevi/Board2Pdf/ (Released as Public Domain)
-from . import PyPDF2
+"""
+PDF pages joiner.
+The pages are copied without decoding their content, streams are written as they come (already compressed).
+Scaling is applied using a transformation matrix in separated content streams, so the page content isn't touched.
+Objects with the same content (fonts, images, etc.) are written only once.
+"""
+from hashlib import sha1
+from io import BytesIO
+from .PyPDF2 import PdfFileReader
+from .PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+                             RectangleObject, StreamObject)
 from . import log
 
 logger = log.get_logger()
+HEADER = b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n'
+PAGE_BOXES = ('/MediaBox', '/CropBox', '/BleedBox', '/TrimBox', '/ArtBox')
+# Used to mark an object we are copying, to detect circular references
+IN_PROGRESS = object()
+
+
+class PdfJoiner(object):
+    """ Writes the PDF incrementally, each object is written as soon as it is copied """
+    def __init__(self, stream):
+        self.stream = stream
+        stream.write(HEADER)
+        # Object number -> offset
+        self.offsets = {}
+        self.next_id = 1
+        # sha1 of an object -> object number
+        self.hashes = {}
+        self.pages_ref = self.new_ref()
+        self.kids = ArrayObject()
+        self.dups = 0
+        # Original reference -> new reference, only valid for the current reader
+        self.refs = {}
+
+    def new_ref(self):
+        ref = IndirectObject(self.next_id, 0, None)
+        self.next_id += 1
+        return ref
+
+    @staticmethod
+    def serialize(obj):
+        data = BytesIO()
+        obj.writeToStream(data, None)
+        return data.getvalue()
+
+    def write(self, ref, data):
+        self.offsets[ref.idnum] = self.stream.tell()
+        self.stream.write(b'%d 0 obj\n' % ref.idnum)
+        self.stream.write(data)
+        self.stream.write(b'\nendobj\n')
+
+    def add(self, obj, ref=None):
+        """ Writes an object, avoiding duplicates if we don't need a particular reference """
+        data = self.serialize(obj)
+        if ref is None:
+            key = sha1(data).digest()
+            ref = self.hashes.get(key)
+            if ref is not None:
+                self.dups += 1
+                return ref
+            ref = self.hashes[key] = self.new_ref()
+        self.write(ref, data)
+        return ref
+
+    def copy_ref(self, ref):
+        key = (ref.idnum, ref.generation)
+        new = self.refs.get(key)
+        if new is IN_PROGRESS:
+            # Circular reference, we need the number now, so we can't check for duplicates
+            new = self.refs[key] = self.new_ref()
+            return new
+        if new is not None:
+            return new
+        self.refs[key] = IN_PROGRESS
+        obj = self.copy(ref.getObject())
+        new = self.refs[key]
+        self.refs[key] = self.add(obj, None if new is IN_PROGRESS else new)
+        return self.refs[key]
+
+    def copy(self, obj):
+        """ Copies an object from a reader, the streams aren't decoded """
+        if isinstance(obj, IndirectObject):
+            return self.copy_ref(obj)
+        if isinstance(obj, StreamObject):
+            new = obj.__class__()
+            new._data = obj._data
+            if '/Filter' not in obj:
+                # Uncompressed stream, compress it (the PyPDF2 writer used to do it for the content)
+                new = new.flateEncode()
+            for k, v in obj.items():
+                # Computed when writing
+                if k != '/Length':
+                    new[k] = self.copy(v)
+            return new
+        if isinstance(obj, DictionaryObject):
+            new = DictionaryObject()
+            for k, v in obj.items():
+                new[k] = self.copy(v)
+            return new
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(v) for v in obj)
+        return obj
+
+    def scale_page(self, page, scale):
+        """ Scales the page using a transformation matrix in separated content streams """
+        contents = page.get('/Contents')
+        if contents is None:
+            return
+        if not isinstance(contents, ArrayObject):
+            contents = ArrayObject([contents])
+        pre = DecodedStreamObject()
+        pre._data = b'q %.6f 0 0 %.6f 0 0 cm\n' % (scale, scale)
+        post = DecodedStreamObject()
+        post._data = b'\nQ\n'
+        page[NameObject('/Contents')] = ArrayObject([self.add(pre)]+list(contents)+[self.add(post)])
+        for box in PAGE_BOXES:
+            if box in page:
+                page[NameObject(box)] = RectangleObject([float(v)*scale for v in page[box].getObject()])
+
+    def add_page(self, reader, page_n=0, scale=None):
+        self.refs = {}
+        page = reader.getPage(page_n)
+        ref = self.new_ref()
+        if page.indirectRef is not None:
+            # Annotations can refer to the page
+            self.refs[(page.indirectRef.idnum, page.indirectRef.generation)] = ref
+        new = DictionaryObject()
+        for k, v in page.items():
+            if k != '/Parent':
+                new[k] = self.copy(v)
+        new[NameObject('/Parent')] = self.pages_ref
+        if scale is not None:
+            self.scale_page(new, scale)
+        self.add(new, ref)
+        self.kids.append(ref)
+
+    def finish(self):
+        pages = DictionaryObject()
+        pages[NameObject('/Type')] = NameObject('/Pages')
+        pages[NameObject('/Kids')] = self.kids
+        pages[NameObject('/Count')] = NumberObject(len(self.kids))
+        self.add(pages, self.pages_ref)
+        catalog = DictionaryObject()
+        catalog[NameObject('/Type')] = NameObject('/Catalog')
+        catalog[NameObject('/Pages')] = self.pages_ref
+        root = self.add(catalog)
+        # Cross-reference table, unused numbers are marked as free
+        xref = self.stream.tell()
+        size = self.next_id
+        self.stream.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for n in range(1, size):
+            offset = self.offsets.get(n)
+            self.stream.write(b'%010d 00000 n \n' % offset if offset is not None else b'0000000000 00000 f \n')
+        trailer = DictionaryObject()
+        trailer[NameObject('/Size')] = NumberObject(size)
+        trailer[NameObject('/Root')] = root
+        self.stream.write(b'trailer\n'+self.serialize(trailer)+b'\nstartxref\n%d\n%%%%EOF\n' % xref)
+        logger.debugl(1, 'PDF join: {} pages, {} objects, {} duplicated objects avoided'.
+                      format(len(self.kids), len(self.offsets), self.dups))
 
 
 def create_pdf_from_pages(input_files, output_fn, forced_width=None):
-    output = PyPDF2.PdfFileWriter()
-    # Collect all pages
-    open_files = []
-    for filename in input_files:
-        file = open(filename, 'rb')
-        open_files.append(file)
-        pdf_reader = PyPDF2.PdfFileReader(file)
-        page_obj = pdf_reader.getPage(0)
-        if forced_width is not None:
-            width = float(page_obj.mediaBox.getWidth())*25.4/72
-            scale = round(forced_width/width, 4)
-            logger.debugl(1, 'PDF scale {} ({} -> {})'.format(scale, width, forced_width))
-            if abs(1.0-scale) > 0.0001:
-                page_obj.scaleBy(scale)
-        page_obj.compressContentStreams()
-        output.addPage(page_obj)
-    # Write all pages to a file
     with open(output_fn, 'wb') as pdf_output:
-        output.write(pdf_output)
-    # Close the files
-    for f in open_files:
-        f.close()
+        output = PdfJoiner(pdf_output)
+        for filename in input_files:
+            with open(filename, 'rb') as file:
+                pdf_reader = PdfFileReader(file)
+                scale = None
+                if forced_width is not None:
+                    page_obj = pdf_reader.getPage(0)
+                    width = float(page_obj.mediaBox.getWidth())*25.4/72
+                    scale = round(forced_width/width, 4)
+                    logger.debugl(1, 'PDF scale {} ({} -> {})'.format(scale, width, forced_width))
+                    if abs(1.0-scale) <= 0.0001:
+                        scale = None
+                output.add_page(pdf_reader, 0, scale)
+        output.finish()
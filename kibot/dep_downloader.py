@@ -98,6 +98,12 @@ Dependencies:
     url: https://www.blender.org/
     debian: blender
     arch: blender
+  - name: Pillow
+    python_module: true
+    module_name: PIL
+    debian: python3-pil
+    arch: python-pillow
+    downloader: python
   - name: Lark
     python_module: true
     role: mandatory
@@ -3,6 +3,7 @@
 # Copyright (c) 2020-2023 Instituto Nacional de Tecnología Industrial
 # License: GPL-3.0
 # Project: KiBot (formerly KiPlot)
+from weakref import WeakKeyDictionary
 from .registrable import RegFilter, Registrable, RegOutput
 from .optionable import Optionable
 from .gs import GS
@@ -13,6 +14,9 @@ from .macros import macros, document  # noqa: F401
 from . import log
 
 logger = log.get_logger()
+# Results of the logic filters: component -> {id(filter): (component state, result)}
+# Components are the keys, so copies (i.e. from subparts) get their own entry
+FILTER_CACHE = WeakKeyDictionary()
 DEFAULT_EXCLUDE = [{'column': ColumnList.COL_REFERENCE, 'regex': '^TP[0-9]*'},
                    {'column': ColumnList.COL_REFERENCE, 'regex': '^FID'},
                    {'column': ColumnList.COL_PART, 'regex': '^mount.*hole'},
@@ -117,8 +121,12 @@ class MultiFilter(Registrable):
         self.comment = 'Multi-filter'
         self.filters = filters
         self._is_transform = is_transform
+        # A chain of logic filters used for logic is just an AND
+        self._only_logic = not is_transform and not any(f._is_transform for f in filters)
 
     def filter(self, comp):
+        if self._only_logic:
+            return all(f.filter(comp) for f in self.filters)
         comps = [comp]
         # We support logic and transform filters mixed
         # Apply all the filters
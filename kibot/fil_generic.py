@@ -4,16 +4,18 @@
 # License: AGPL-3.0
 # Project: KiBot (formerly KiPlot)
 # Description: Implements the KiBoM and IBoM filters.
-from re import compile, IGNORECASE
+from re import compile, IGNORECASE, error as re_error
 from .optionable import Optionable
 from .bom.columnlist import ColumnList
 from .gs import GS
+from .fil_base import FILTER_CACHE
 from .misc import DNF, DNC
 from .macros import macros, document, filter_class  # noqa: F401
 from .out_base import BoMRegex
 from . import log
 
 logger = log.get_logger()
+BACK_REF = compile(r'\\\d|\(\?P=')
 
 
 @filter_class
@@ -84,132 +86,180 @@ class Generic(BaseFilter):  # noqa: F821
             col = col[:-1]
         return col
 
+    @staticmethod
+    def _can_be_joined(reg):
+        """ Regexs that doesn't use special options and back-references can be joined in one alternation """
+        if reg.skip_if_no_field or reg.match_if_field or reg.match_if_no_field or reg.invert:
+            return False
+        return not BACK_REF.search(reg.regex)
+
+    @staticmethod
+    def _compile_regs(regs):
+        """ Creates the list of regex tests.
+            Plain regexs applied to the same column are joined in just one regex.
+            We keep the column names, they are solved during the first use. """
+        joined = {}
+        compiled = []
+        for r in regs:
+            r.column = Generic._fix_field(r.column)
+            if Generic._can_be_joined(r):
+                joined.setdefault(r.column, []).append(r.regex)
+            else:
+                r.regex = compile(r.regex, flags=IGNORECASE)
+                compiled.append(r)
+        for column, regexs in joined.items():
+            r = BoMRegex()
+            r.column = column
+            if len(regexs) == 1:
+                r.regex = compile(regexs[0], flags=IGNORECASE)
+            else:
+                try:
+                    r.regex = compile('|'.join('(?:'+reg+')' for reg in regexs), flags=IGNORECASE)
+                except re_error:
+                    # Something like global flags in the middle, just compile them separately
+                    for reg in regexs:
+                        r = BoMRegex()
+                        r.column = column
+                        r.regex = compile(reg, flags=IGNORECASE)
+                        compiled.append(r)
+                    continue
+            compiled.append(r)
+        return compiled
+
     def config(self, parent):
         super().config(parent)
         # include_only
-        for r in self.include_only:
-            r.column = self._fix_field(r.column)
-            r.regex = compile(r.regex, flags=IGNORECASE)
+        self._include_only = self._compile_regs(self.include_only)
         # exclude_any
-        for r in self.exclude_any:
-            r.column = self._fix_field(r.column)
-            r.regex = compile(r.regex, flags=IGNORECASE)
+        self._exclude_any = self._compile_regs(self.exclude_any)
+        self._columns_solved = False
         # keys
         if len(self.keys) == 1 and self.keys[0] in {'dnf_list', 'dnc_list'}:
             self._keys = DNF if self.keys[0] == 'dnf_list' else DNC
         else:
             # Ensure lowercase
-            self._keys = [v.lower() for v in self.keys]
+            self._keys = {v.lower() for v in self.keys}
+        self._exclude_refs = set(self.exclude_refs)
         # Config field must be lowercase
         self.config_field = self.config_field.lower()
+        self._compile()
 
-    def test_reg_include(self, c):
-        """ Reject components that doesn't match the provided regex.
-            So we include only the components that matches any of the regexs. """
-        if not self.include_only:  # Nothing to match against, means include all
-            return True
-        for reg in self.include_only:
-            reg.column = Optionable.solve_field_name(reg.column)
-            if reg.skip_if_no_field and not c.is_field(reg.column):
-                # Skip the check if the field doesn't exist
-                continue
-            if reg.match_if_field and c.is_field(reg.column):
-                return True
-            if reg.match_if_no_field and not c.is_field(reg.column):
-                return True
-            field_value = c.get_field_value(reg.column)
-            res = reg.regex.search(field_value)
-            if reg.invert:
-                res = not res
-            if res:
-                if GS.debug_level > 1:
-                    logger.debug("- Including '{ref}': Field '{field}' ({value}) matched '{re}'".format(
-                                 ref=c.ref, field=reg.column, value=field_value, re=reg.regex))
-                # Found a match
-                return True
-        # Default, could not find a match
-        return False
-
-    def test_reg_exclude(self, c):
-        """ Test if this part should be included, based on any regex expressions provided in the preferences """
-        if not self.exclude_any:  # Nothing to match against, means don't exclude any
-            return False
-        for reg in self.exclude_any:
-            reg.column = Optionable.solve_field_name(reg.column)
-            if reg.skip_if_no_field and not c.is_field(reg.column):
-                # Skip the check if the field doesn't exist
-                continue
-            if reg.match_if_field and c.is_field(reg.column):
-                return True
-            if reg.match_if_no_field and not c.is_field(reg.column):
-                return True
-            field_value = c.get_field_value(reg.column)
-            res = reg.regex.search(field_value)
-            if reg.invert:
-                res = not res
-            if res:
-                if GS.debug_level > 1:
-                    logger.debug("Excluding '{ref}': Field '{field}' ({value}) matched '{re}'".format(
-                                 ref=c.ref, field=reg.column, value=field_value, re=reg.regex))
-                # Found a match
-                return True
-        # Default, could not find any matches
-        return False
-
-    def filter(self, comp):
-        exclude = self.invert
-        value = comp.value.strip().lower()
+    def _compile(self):
+        """ Creates the list of tests needed for the enabled options.
+            Each test returns True if the component must be excluded """
+        tests = []
         # Exclude components with empty 'Value'
-        if self.exclude_empty_val and (value == '' or value == '~'):
-            return exclude
+        if self.exclude_empty_val:
+            tests.append(lambda c, v: v == '' or v == '~')
         # Exclude all ref == #*
-        if self.exclude_all_hash_ref and comp.ref and comp.ref[0] == '#':
-            return exclude
+        if self.exclude_all_hash_ref:
+            tests.append(lambda c, v: c.ref and c.ref[0] == '#')
         # KiCad 5 PCB classification
-        if self.exclude_virtual and comp.virtual:
-            return exclude
-        if self.exclude_smd and comp.smd:
-            return exclude
-        if self.exclude_tht and comp.tht:
-            return exclude
-        if self.exclude_top and not comp.bottom:
-            return exclude
-        if self.exclude_bottom and comp.bottom:
-            return exclude
-        if self.exclude_not_in_bom and not (comp.in_bom and comp.in_bom_pcb):
-            return exclude
-        if self.exclude_not_on_board and not comp.on_board:
-            return exclude
+        if self.exclude_virtual:
+            tests.append(lambda c, v: c.virtual)
+        if self.exclude_smd:
+            tests.append(lambda c, v: c.smd)
+        if self.exclude_tht:
+            tests.append(lambda c, v: c.tht)
+        if self.exclude_top:
+            tests.append(lambda c, v: not c.bottom)
+        if self.exclude_bottom:
+            tests.append(lambda c, v: c.bottom)
+        if self.exclude_not_in_bom:
+            tests.append(lambda c, v: not (c.in_bom and c.in_bom_pcb))
+        if self.exclude_not_on_board:
+            tests.append(lambda c, v: not c.on_board)
         # List of references to be excluded
-        if self.exclude_refs and (comp.ref in self.exclude_refs or comp.ref_prefix+'*' in self.exclude_refs):
-            return exclude
+        if self._exclude_refs:
+            refs = self._exclude_refs
+            tests.append(lambda c, v: c.ref in refs or c.ref_prefix+'*' in refs)
         # All stuff where keys are involved
         if self._keys:
+            keys = self._keys
             # Exclude components if their 'Value' is any of the keys
-            if self.exclude_value and value in self._keys:
-                return exclude
+            if self.exclude_value:
+                tests.append(lambda c, v: v in keys)
             # Exclude components if a field is named as any of the keys
             if self.exclude_field:
-                for k in self._keys:
-                    if k in comp.dfields:
-                        return exclude
+                tests.append(lambda c, v: any(k in c.dfields for k in keys))
             # Exclude components containing a key value in the config field.
             if self.exclude_config:
-                config = comp.get_field_value(self.config_field).strip().lower()
-                if self.config_separators:
-                    # Try with all the separators
-                    for sep in self.config_separators:
-                        opts = config.split(sep)
-                        # Try with all the extracted values
-                        for opt in opts:
-                            if opt.strip() in self._keys:
-                                return exclude
-                else:  # No separator
-                    if config in self._keys:
-                        return exclude
+                tests.append(self.test_config)
         # Regular expressions
-        if not self.test_reg_include(comp):
-            return exclude
-        if self.test_reg_exclude(comp):
-            return exclude
-        return not exclude
+        if self._include_only:
+            tests.append(lambda c, v: not self.test_reg_include(c))
+        if self._exclude_any:
+            tests.append(self.test_reg_exclude)
+        self._tests = tests
+        self._needs_value = self.exclude_empty_val or (self._keys and self.exclude_value)
+
+    def _solve_columns(self):
+        """ Solve the `_field_*` names, only once """
+        for reg in self._include_only+self._exclude_any:
+            reg.column = Optionable.solve_field_name(reg.column)
+        self._columns_solved = True
+
+    def test_config(self, c, value=None):
+        """ Exclude components containing a key value in the config field.
+            Separators are applied """
+        config = c.get_field_value(self.config_field).strip().lower()
+        if self.config_separators:
+            # Try with all the separators
+            for sep in self.config_separators:
+                opts = config.split(sep)
+                # Try with all the extracted values
+                for opt in opts:
+                    if opt.strip() in self._keys:
+                        return True
+            return False
+        # No separator
+        return config in self._keys
+
+    @staticmethod
+    def _test_reg(c, reg):
+        """ Returns True if the regex matches the component """
+        if reg.skip_if_no_field and not c.is_field(reg.column):
+            # Skip the check if the field doesn't exist
+            return False
+        if reg.match_if_field and c.is_field(reg.column):
+            return True
+        if reg.match_if_no_field and not c.is_field(reg.column):
+            return True
+        field_value = c.get_field_value(reg.column)
+        res = reg.regex.search(field_value)
+        if reg.invert:
+            res = not res
+        if res and GS.debug_level > 1:
+            logger.debug("- Field '{field}' ({value}) of '{ref}' matched '{re}'".format(
+                         ref=c.ref, field=reg.column, value=field_value, re=reg.regex.pattern))
+        return bool(res)
+
+    def test_reg_include(self, c):
+        """ Reject components that doesn't match the provided regex.
+            So we include only the components that matches any of the regexs. """
+        if not self._include_only:  # Nothing to match against, means include all
+            return True
+        if not self._columns_solved:
+            self._solve_columns()
+        return any(self._test_reg(c, reg) for reg in self._include_only)
+
+    def test_reg_exclude(self, c, value=None):
+        """ Test if this part should be included, based on any regex expressions provided in the preferences """
+        if not self._exclude_any:  # Nothing to match against, means don't exclude any
+            return False
+        if not self._columns_solved:
+            self._solve_columns()
+        return any(self._test_reg(c, reg) for reg in self._exclude_any)
+
+    def filter(self, comp):
+        # The result only depends on the component state, so we can reuse the last result
+        state = comp.get_filter_state()
+        cache = FILTER_CACHE.setdefault(comp, {})
+        res = cache.get(id(self))
+        if res is not None and res[0] == state:
+            return res[1]
+        value = comp.value.strip().lower() if self._needs_value else None
+        exclude = any(test(comp, value) for test in self._tests)
+        res = self.invert if exclude else not self.invert
+        cache[id(self)] = (state, res)
+        return res
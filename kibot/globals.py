@@ -13,6 +13,7 @@ from .macros import macros, document  # noqa: F401
 from .pre_filters import FiltersOptions, FilterOptionsKiBot
 from .log import get_logger, set_filters
 from .misc import W_MUSTBEINT, W_ENVEXIST
+from .profiler import Profiler
 from .kicad.config import KiConf
 from .kicad.sexpdata import load, SExpData, sexp_iter, Symbol
 from .kicad.v6_sch import PCBLayer
@@ -396,6 +397,28 @@ class Globals(FiltersOptions):
             """ String used for *yes*. Currently used by the **update_pcb_characteristics** preflight """
             self.str_no = 'no'
             """ String used for *no*. Currently used by the **update_pcb_characteristics** preflight """
+            self.profile = 'no'
+            """ [no,yes,memory,cprofile] Collect the time and memory used by the preflights, outputs, loads and
+                external commands. The results are stored in `kibot_profile.json` and `kibot_profile.txt`, in the
+                output dir. *yes* measures the time and the process peak RSS, *memory* also traces the Python allocations
+                (slower) and reports their peak for each step, *cprofile* also stores cProfile stats for each top
+                level output in the `kibot_profile` dir.
+                The `--profile` command line option is equivalent to *yes* """
+            self.diff_cache_size = 1024
+            """ [0,1000000] Maximum size, in MB, of the cache used to share the PCB/SCH renders between the `diff`
+                and `kiri` outputs, and between runs. The renders are identified by the content of the files, so
+                commits and variants with the same content are rendered only once. The least recently used renders
+                are removed when the cache is bigger than this size. Use 0 to disable this cache.
+                The cache is stored in `~/.cache/kibot/diff`, you can change it using the `KIBOT_DIFF_CACHE`
+                environment variable """
+            self.preflight_workers = 1
+            """ [0,64] Maximum number of preflights running at the same time. When bigger than 1 the preflights
+                that just run KiCad (i.e. `erc`, `drc`, `run_erc`, `run_drc` and `update_xml`) and don't modify the
+                files used by the others are executed concurrently. Preflights that modify the project files are
+                executed in order. Use 0 to use the number of CPUs.
+                The default is to run them one after the other. The concurrent preflights start various eeschema/pcbnew
+                instances (KiAuto) for the same project, sharing the KiCad user configuration, and KiCad doesn't
+                support it. Enable it only if your preflights don't interfere """
         self.set_doc('filters', " [list(dict)=[]] KiBot warnings to be ignored ")
         self._filter_what = 'KiBot warnings'
         self.filters = FilterOptionsKiBot
@@ -538,6 +561,8 @@ class Globals(FiltersOptions):
             if not GS.global_silk_screen_color_bottom:
                 GS.global_silk_screen_color_bottom = GS.global_silk_screen_color
         set_filters(self.filters)
+        if GS.global_profile != 'no':
+            Profiler.enable(GS.global_profile)
         # 3D models aliases
         if self.aliases_for_3d_models:
             KiConf.init(GS.pcb_file or GS.sch_file)
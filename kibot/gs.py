@@ -119,6 +119,8 @@ class GS(object):
     test_boolean = True
     test_number = 5
     stackup = None
+    # Netlists for variants, shared by the outputs (see kiplot.get_shared_netlist)
+    shared_netlists = {}
     # Preprocessor definitions
     cli_defines = {}
     kikit_units_to_kicad = {'mm': IU_PER_MM, 'cm': 10*IU_PER_MM, 'dm': 100*IU_PER_MM,
@@ -155,6 +157,7 @@ class GS(object):
     global_default_resistor_tolerance = None
     global_drc_exclusions_workaround = None
     global_dir = None
+    global_diff_cache_size = None
     global_disable_3d_alias_as_env = None
     global_drill_size_increment = None
     global_edge_connector = None
@@ -183,6 +186,8 @@ class GS(object):
     global_output = None
     global_pcb_finish = None
     global_pcb_material = None
+    global_preflight_workers = None
+    global_profile = None
     global_remove_solder_paste_for_dnp = None
     global_remove_solder_mask_for_dnp = None
     global_remove_adhesive_for_dnp = None
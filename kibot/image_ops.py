@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# Copyright (c) 2024 Instituto Nacional de Tecnología Industrial
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+"""
+Image post-processing (crop, chroma key, resize, gray and composition).
+Done in-process using Pillow (and NumPy for the chroma key) when available.
+Otherwise we use ImageMagick, so the callers must provide the `convert` command when `needs_convert()` says so.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+from .kiplot import run_command
+from .misc import FAILED_EXECUTE
+from . import log
+try:
+    from PIL import Image, ImageChops
+    LANCZOS = getattr(Image, 'Resampling', Image).LANCZOS
+except ImportError:
+    Image = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = log.get_logger()
+
+
+def needs_convert(chroma_key=False):
+    """ True if we need ImageMagick for the operations """
+    return Image is None or (chroma_key and numpy is None)
+
+
+def backend():
+    """ Name of the backend, used for caches """
+    return 'ImageMagick' if Image is None else 'Pillow'
+
+
+def _load(fname):
+    img = Image.open(fname)
+    img.load()
+    return img
+
+
+def _save(img, fname):
+    img.save(fname, optimize=True)
+
+
+def trim_box(img):
+    """ Box with the content of the image, like ImageMagick `-trim`.
+        The background is the color of the top left corner, transparent backgrounds are detected using the alpha. """
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA') and img.getpixel((0, 0))[-1] == 0:
+        return img.getchannel('A').getbbox()
+    img = img.convert('RGB')
+    return ImageChops.difference(img, Image.new('RGB', img.size, img.getpixel((0, 0)))).getbbox()
+
+
+def trim(fname, convert_command=None, double=False, err_lvl=FAILED_EXECUTE):
+    """ Removes the empty space around the image, in place.
+        `double` is the two passes workaround, only needed by some ImageMagick versions """
+    if Image is None:
+        cmd = [convert_command, fname, '-trim', '+repage']
+        if double:
+            cmd.extend(['-trim', '+repage'])
+        cmd.append(fname)
+        run_command(cmd, err_lvl=err_lvl)
+        return
+    img = _load(fname)
+    box = trim_box(img)
+    logger.debugl(2, f'- Trimming {fname} {img.size} -> {box}')
+    if box is not None and box != (0, 0)+img.size:
+        _save(img.crop(box), fname)
+
+
+def chroma_key(fname, color, fuzz, convert_command=None, err_lvl=FAILED_EXECUTE):
+    """ Makes transparent the pixels close to `color`, in place.
+        Like ImageMagick `-fuzz FUZZ% -transparent COLOR`.
+        `color` is an (R, G, B) tuple (0-255), `fuzz` is the maximum distance in RGB space (percent) """
+    if needs_convert(chroma_key=True):
+        run_command([convert_command, fname, '-fuzz', str(fuzz)+'%', '-transparent', 'rgb({}, {}, {})'.format(*color),
+                     fname], err_lvl=err_lvl)
+        return
+    data = numpy.array(_load(fname).convert('RGBA'))
+    dist = ((data[:, :, :3].astype(numpy.int32)-numpy.array(color, dtype=numpy.int32))**2).sum(axis=2)
+    limit = fuzz*255/100
+    data[dist <= limit*limit, 3] = 0
+    _save(Image.fromarray(data, 'RGBA'), fname)
+
+
+def resize_width(fname, width, dest=None, convert_command=None, err_lvl=FAILED_EXECUTE):
+    """ Scales the image to the specified width, keeping the aspect ratio """
+    dest = dest or fname
+    if Image is None:
+        run_command([convert_command, fname, '-resize', str(width)+'x', dest], err_lvl=err_lvl)
+        return
+    img = _load(fname)
+    w, h = img.size
+    _save(img.resize((width, max(round(h*width/w), 1)), LANCZOS), dest)
+
+
+def gray(fname, dest, convert_command=None, err_lvl=FAILED_EXECUTE):
+    """ Converts the image to gray using the average of the channels, keeps the alpha """
+    if Image is None:
+        run_command([convert_command, fname, '-set', 'colorspace', 'Gray', '-separate', '-average', dest], err_lvl=err_lvl)
+        return
+    img = _load(fname)
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+    img = img.convert('RGBA')
+    res = img.convert('RGB').convert('L', (1/3, 1/3, 1/3, 0))
+    if has_alpha:
+        res.putalpha(img.getchannel('A'))
+    _save(res, dest)
+
+
+def compose_icon(fname, width, icon, dest):
+    """ Scales the image to `width` and adds the `icon` at the bottom right.
+        Only for Pillow, check `needs_convert()` """
+    img = _load(fname)
+    w, h = img.size
+    img = img.convert('RGBA').resize((width, max(round(h*width/w), 1)), LANCZOS)
+    if icon:
+        ico = _load(icon).convert('RGBA')
+        if ico.width > img.width or ico.height > img.height:
+            ico = ico.crop((0, 0, min(ico.width, img.width), min(ico.height, img.height)))
+        img.alpha_composite(ico, (max(img.width-ico.width, 0), max(img.height-ico.height, 0)))
+    _save(img, dest)
+
+
+def process_images(func, files, *args, **kwargs):
+    """ Applies `func(file, *args, **kwargs)` to all the files, in parallel """
+    workers = min(os.cpu_count() or 1, len(files))
+    if workers <= 1:
+        for f in files:
+            func(f, *args, **kwargs)
+        return
+    logger.debug(f'Processing {len(files)} images using {workers} workers ({backend()})')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(lambda f: func(f, *args, **kwargs), files):
+            pass
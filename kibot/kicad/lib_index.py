@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# Copyright (c) 2024 Instituto Nacional de Tecnología Industrial
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+"""
+Run level index for the footprint libs and 3D models.
+Used to avoid listing the same libs, parsing the same footprints and solving the same 3D model names
+every time we need them.
+"""
+from collections import OrderedDict
+from copy import deepcopy
+import os
+from .config import KiConf
+from .sexp_helpers import load_sexp_file
+from ..gs import GS
+from .. import log
+
+logger = log.get_logger()
+# Maximum number of parsed footprints we keep in memory
+MAX_FOOTPRINTS = 128
+
+
+class LibIndex(object):
+    """ Static class, just a placeholder for the index """
+    # Directory -> (mtime, set of file names)
+    dirs = {}
+    # File name -> (mtime, size, S-Expression), in LRU order
+    footprints = OrderedDict()
+    # (3D model name, lib nickname, environment) -> (full name, used extra)
+    models_3d = {}
+    # Hash of the things used to expand the 3D model names
+    env_key = None
+    # [hits, misses]
+    stats = {'lib dirs': [0, 0], 'footprints': [0, 0], '3D models': [0, 0]}
+
+    @staticmethod
+    def list_dir(path):
+        """ Names of the files in a lib dir. Updated when the dir changes """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return set()
+        cached = LibIndex.dirs.get(path)
+        if cached is not None and cached[0] == mtime:
+            LibIndex.stats['lib dirs'][0] += 1
+            return cached[1]
+        LibIndex.stats['lib dirs'][1] += 1
+        try:
+            # Only the things we can read as files, i.e. no broken symlinks
+            with os.scandir(path) as it:
+                files = {e.name for e in it if e.is_file()}
+        except OSError:
+            return set()
+        LibIndex.dirs[path] = (mtime, files)
+        return files
+
+    @staticmethod
+    def footprint_name(lib_alias, name):
+        """ Full name for the `name` footprint in the `lib_alias` lib. None if missing """
+        fname = name+'.kicad_mod'
+        full_name = os.path.join(lib_alias.uri, fname)
+        # The list is just a fast path, the file system could be case insensitive
+        if fname in LibIndex.list_dir(lib_alias.uri) or os.path.isfile(full_name):
+            return full_name
+        return None
+
+    @staticmethod
+    def load_footprint(fname):
+        """ Returns the S-Expression for a footprint file.
+            You get a copy, so you can modify it """
+        st = os.stat(fname)
+        cached = LibIndex.footprints.get(fname)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            LibIndex.stats['footprints'][0] += 1
+            LibIndex.footprints.move_to_end(fname)
+            return deepcopy(cached[2])
+        LibIndex.stats['footprints'][1] += 1
+        sexp = load_sexp_file(fname)
+        LibIndex.footprints[fname] = (st.st_mtime_ns, st.st_size, sexp)
+        LibIndex.footprints.move_to_end(fname)
+        if len(LibIndex.footprints) > MAX_FOOTPRINTS:
+            LibIndex.footprints.popitem(last=False)
+        return deepcopy(sexp)
+
+    @staticmethod
+    def update_env():
+        """ Computes a hash of all the things used to solve a 3D model name.
+            Must be called before using `solve_3d_model` """
+        LibIndex.env_key = hash((frozenset(os.environ.items()), frozenset(KiConf.kicad_env.items()),
+                                 frozenset(KiConf.aliases_3D.items()), frozenset(GS.load_pro_variables().items()),
+                                 os.getcwd(), GS.pcb_dir, GS.global_disable_3d_alias_as_env))
+
+    @staticmethod
+    def solve_3d_model(name, lib_nickname, used_extra, solver):
+        """ Memoized call to `solver(name, used_extra)` """
+        key = (name, lib_nickname, LibIndex.env_key)
+        res = LibIndex.models_3d.get(key)
+        if res is None:
+            LibIndex.stats['3D models'][1] += 1
+            n_used_extra = [False]
+            res = (solver(name, n_used_extra), n_used_extra[0])
+            LibIndex.models_3d[key] = res
+        else:
+            LibIndex.stats['3D models'][0] += 1
+        if res[1]:
+            used_extra[0] = True
+        return res[0]
+
+    @staticmethod
+    def report():
+        if GS.debug_level > 1:
+            stats = ', '.join(f'{k}: {v[0]}/{v[1]}' for k, v in LibIndex.stats.items())
+            logger.debug('Libs index stats (hits/misses): '+stats)
@@ -14,6 +14,7 @@ from ..misc import W_NOLIB, W_MISSFPINFO
 from ..gs import GS
 from .sexpdata import load, dumps, SExpData, sexp_iter, Symbol
 from .sexp_helpers import _check_relaxed, _get_symbol_name, make_separated, load_sexp_file
+from .lib_index import LibIndex
 from .v6_sch import _check_str, _check_symbol, _check_is_symbol_list, _check_float
 PAGE_SIZE = {'A0': (841, 1189),
              'A1': (594, 841),
@@ -131,11 +132,12 @@ def update_footprint(ref, name, s, aliases, logger):
     lib_alias = aliases.get(res[0])
     if lib_alias is None:
         raise KiPlotConfigurationError(f'Unknown library `{res[0]}`')
-    fname = os.path.join(lib_alias.uri, res[1]+'.kicad_mod')
-    if not os.path.isfile(fname):
+    fname = LibIndex.footprint_name(lib_alias, res[1])
+    if fname is None:
         raise KiPlotConfigurationError(f'Missing footprint `{res[1]}` in `{res[0]}` lib')
     logger.debug(f'- Lib file {fname}')
-    c = load_sexp_file(fname)
+    # This is a copy, we can modify it
+    c = LibIndex.load_footprint(fname)
     # Which attributes we want to keep from the original PCB
     attrs = KICAD8_ATTRS if GS.ki8 else KICAD6_ATTRS
     # Keep the attributes like UUID/tstamp, position, properties, etc.
@@ -177,6 +179,7 @@ def replace_footprints(fname, replacements, logger, replace_pcb=True):
                     if ref in replacements:
                         new_fp = replacements.get(ref)  # None means just update from lib
                         updated |= update_footprint(ref, new_fp if new_fp else fp_name, fp, aliases, logger)
+    LibIndex.report()
     # If we replaced one or more footprints
     if updated:
         save_pcb_from_sexp(pcb, logger, replace_pcb)
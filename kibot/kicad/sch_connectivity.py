@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# Copyright (c) 2024 Instituto Nacional de Tecnología Industrial
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+"""
+Schematic connectivity.
+Computes the nets of a loaded KiCad 6+ schematic, so we can write a complete XML netlist without running eeschema.
+The items of each sheet instance are connected using an index of their connection points (union-find), then the nets
+are joined using the labels, power pins, buses and the hierarchy. The names are assigned using the KiCad rules.
+"""
+from collections import namedtuple
+from functools import cmp_to_key
+import re
+from ..gs import GS
+from .. import log
+
+logger = log.get_logger()
+# Coordinates are rounded to the KiCad schematic internal unit (100 nm)
+SCALE = 10000
+# Priority of the items that can name a net, as used by KiCad 6 to 8
+PRIORITY_PIN = 1
+PRIORITY_SHEET_PIN = 2
+PRIORITY_HIER_LABEL = 3
+PRIORITY_LOCAL_LABEL = 4
+PRIORITY_POWER_PIN = 5
+PRIORITY_GLOBAL = 6
+VECTOR_BUS = re.compile(r'^(.*?)\[(\d+)\.\.(\d+)\]$')
+GROUP_BUS = re.compile(r'^([^{}]*)\{(.*)\}$')
+Driver = namedtuple('Driver', 'node priority depth name text')
+Pin = namedtuple('Pin', 'ref number name type comp lib_pins units')
+Net = namedtuple('Net', 'code name nodes no_connect')
+
+
+def _key(x, y):
+    return (round(x*SCALE), round(y*SCALE))
+
+
+def _escape(name):
+    """ Net name escaping, as KiCad does for the names it creates """
+    return name.replace('/', '{slash}').replace('\n', '{return}')
+
+
+def str_num_cmp(a, b):
+    """ String compare using the numeric value of the digits runs, like KiCad's StrNumCmp """
+    i = j = 0
+    la = len(a)
+    lb = len(b)
+    while i < la and j < lb:
+        c1 = a[i]
+        c2 = b[j]
+        if c1.isdigit() and c2.isdigit():
+            n1 = n2 = 0
+            while i < la and a[i].isdigit():
+                n1 = n1*10+int(a[i])
+                i += 1
+            while j < lb and b[j].isdigit():
+                n2 = n2*10+int(b[j])
+                j += 1
+            if n1 != n2:
+                return -1 if n1 < n2 else 1
+            c1 = a[i] if i < la else ''
+            c2 = b[j] if j < lb else ''
+        if c1 != c2:
+            return -1 if c1 < c2 else 1
+        i += 1
+        j += 1
+    if i >= la and j < lb:
+        return -1
+    if i < la and j >= lb:
+        return 1
+    return 0
+
+
+def pin_shown_name(name):
+    return '' if name == '~' else name
+
+
+class UnionFind(object):
+    """ Disjoint sets of nodes, the nodes are just numbers """
+    def __init__(self):
+        self.parent = []
+
+    def add(self):
+        n = len(self.parent)
+        self.parent.append(n)
+        return n
+
+    def find(self, n):
+        parent = self.parent
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        # The lower number is the root, so the result doesn't depend on the order
+        if a < b:
+            self.parent[b] = a
+        elif b < a:
+            self.parent[a] = b
+
+
+class PointIndex(object):
+    """ Connection points of one sheet instance, for wires or buses """
+    def __init__(self):
+        # (x, y) -> [node]
+        self.points = {}
+        # Horizontal segments indexed by y, vertical ones by x, the rest in a list
+        self.h_segs = {}
+        self.v_segs = {}
+        self.segs = []
+
+    def add_point(self, node, key):
+        self.points.setdefault(key, []).append(node)
+
+    def add_segment(self, node, k1, k2):
+        self.add_point(node, k1)
+        self.add_point(node, k2)
+        (x1, y1), (x2, y2) = k1, k2
+        if y1 == y2:
+            self.h_segs.setdefault(y1, []).append((min(x1, x2), max(x1, x2), node))
+        elif x1 == x2:
+            self.v_segs.setdefault(x1, []).append((min(y1, y2), max(y1, y2), node))
+        else:
+            self.segs.append((k1, k2, node))
+
+    def segments_at(self, key):
+        """ Segments passing through a point """
+        x, y = key
+        for x1, x2, node in self.h_segs.get(y, ()):
+            if x1 <= x <= x2:
+                yield node
+        for y1, y2, node in self.v_segs.get(x, ()):
+            if y1 <= y <= y2:
+                yield node
+        for (x1, y1), (x2, y2), node in self.segs:
+            if (min(x1, x2) <= x <= max(x1, x2) and min(y1, y2) <= y <= max(y1, y2) and
+               abs((x2-x1)*(y-y1)-(y2-y1)*(x-x1)) <= max(abs(x2-x1), abs(y2-y1))):
+                yield node
+
+    def connect(self, uf, on_segments):
+        """ Join the items at the same point and the ones in the middle of a segment """
+        for nodes in self.points.values():
+            first = nodes[0]
+            for n in nodes[1:]:
+                uf.union(first, n)
+        for node, key in on_segments:
+            for seg in self.segments_at(key):
+                uf.union(node, seg)
+
+
+class SheetNames(object):
+    """ Labels found in a sheet instance """
+    def __init__(self):
+        # Local and hierarchical labels, they are connected inside the sheet
+        self.local = {}
+        # Hierarchical labels, connected to the sheet pins in the parent
+        self.hier = {}
+        # All the labels, used to connect bus members
+        self.all = {}
+
+
+class SchConnectivity(object):
+    """ Nets of a schematic hierarchy.
+        Only for KiCad 6 and newer (SchematicV6) """
+    def __init__(self, sch):
+        self.sch = sch
+        self.uf = UnionFind()
+        self.drivers = []
+        # node -> Pin
+        self.pins = {}
+        self.no_connects = []
+        # Global labels and power pins, by name
+        self.globals = {}
+        # Sheet pins: (node, is_bus, child sheet, pin name)
+        self.sheet_links = []
+        # Bus nodes: (node, SheetNames)
+        self.bus_nodes = []
+        # Bus aliases for the whole project
+        self.aliases = {}
+        # id(SchematicV6) -> SheetNames
+        self.names = {}
+        self.collect_aliases(sch)
+        self.add_sheet(sch, 0)
+        self.connect_hierarchy()
+        self.connect_buses()
+        self.nets = self.solve_nets()
+
+    def collect_aliases(self, sch):
+        for alias in sch.bus_alias:
+            self.aliases[alias.name] = alias.members
+        for sheet in sch.sheets:
+            self.collect_aliases(sheet.sheet)
+
+    def is_bus(self, name):
+        return VECTOR_BUS.match(name) is not None or GROUP_BUS.match(name) is not None or name in self.aliases
+
+    def bus_members(self, name, level=0):
+        """ List of (key, member name) for a bus name.
+            Vector members use its index as key, so they can be matched with other vector buses """
+        m = VECTOR_BUS.match(name)
+        if m:
+            prefix = m.group(1)
+            start = int(m.group(2))
+            end = int(m.group(3))
+            step = 1 if end >= start else -1
+            return [(n, prefix+str(n)) for n in range(start, end+step, step)]
+        m = GROUP_BUS.match(name)
+        if m:
+            prefix = m.group(1)
+            members = [s for s in re.split(r'[\s,]+', m.group(2)) if s]
+        elif name in self.aliases:
+            prefix = ''
+            members = self.aliases[name]
+        else:
+            return []
+        res = []
+        for mem in members:
+            if level < 8 and self.is_bus(mem):
+                # Buses inside a group
+                expanded = [n for _, n in self.bus_members(mem, level+1)]
+            else:
+                expanded = [mem]
+            for n in expanded:
+                res.append((n, prefix+'.'+n if prefix else n))
+        return res
+
+    def add_node(self, index, key, on_segments=None):
+        node = self.uf.add()
+        index.add_point(node, key)
+        if on_segments is not None:
+            on_segments.append((node, key))
+        return node
+
+    def add_global(self, name, node):
+        other = self.globals.get(name)
+        if other is None:
+            self.globals[name] = node
+        else:
+            self.uf.union(other, node)
+
+    def add_label(self, label, priority, name, depth, indexes, on_segments, names):
+        """ Labels connect to the items at the same point and also in the middle of a wire """
+        text = label.text
+        is_bus = self.is_bus(text)
+        node = self.add_node(indexes[is_bus], _key(label.pos_x, label.pos_y), on_segments[is_bus])
+        self.drivers.append(Driver(node, priority, depth, name, text))
+        names.all.setdefault(text, []).append(node)
+        if is_bus:
+            self.bus_nodes.append((node, names))
+        return node, text
+
+    @staticmethod
+    def unit_pins(comp, lib):
+        """ Pins for the unit and body style used by a symbol """
+        convert = comp.convert or 1
+        pins = list(lib.pins)
+        for unit in lib.units:
+            m = lib.unit_regex.search(unit.lib_id)
+            if m is None:
+                continue
+            n_unit = int(m.group(2))
+            n_convert = int(m.group(3))
+            if (n_unit and n_unit != comp.unit) or (n_convert and n_convert != convert):
+                continue
+            pins.extend(unit.pins)
+        return pins
+
+    @staticmethod
+    def pin_position(comp, pin):
+        """ Absolute position of a pin. The library uses Y axis pointing up """
+        x = pin.pos_x
+        y = -pin.pos_y
+        ang = round(comp.ang) % 360
+        # Counter-clockwise rotation, as seen in the screen (Y axis pointing down)
+        if ang == 90:
+            x, y = y, -x
+        elif ang == 180:
+            x, y = -x, -y
+        elif ang == 270:
+            x, y = -y, x
+        # The mirror is applied after the rotation
+        if comp.mirror == 'x':
+            y = -y
+        elif comp.mirror == 'y':
+            x = -x
+        return comp.x+x, comp.y+y
+
+    def add_symbols(self, sch, depth, wires):
+        for comp in sch.symbols:
+            if comp.ref is None:
+                # Not used in this project
+                continue
+            lib = sch.lib_symbol_names.get(comp.local_name) if comp.local_name else None
+            if lib is None:
+                lib = getattr(comp, 'lib_symbol', None)
+                if lib is None or not hasattr(lib, 'units'):
+                    # Missing in the lib_symbols section
+                    continue
+            pins = self.unit_pins(comp, lib)
+            for pin in pins:
+                node = self.add_node(wires, _key(*self.pin_position(comp, pin)))
+                name = pin.name
+                tp = pin.type
+                alt = comp.pin_alternates.get(pin.number)
+                if alt:
+                    name = alt
+                    if pin.alternate is not None and pin.alternate.name == alt:
+                        tp = pin.alternate.type
+                self.pins[node] = Pin(comp.ref, pin.number, pin_shown_name(name), tp, comp, pins, lib.unit_count)
+                # Power pins (hidden power inputs and the pins of power symbols) are global
+                if pin.type == 'power_in' and (pin.hide or lib.is_power):
+                    # KiCad 7 uses the value of power symbols
+                    name = comp.value if GS.ki7 and lib.is_power else pin.name
+                    self.drivers.append(Driver(node, PRIORITY_POWER_PIN, depth, name, name))
+                    self.add_global(name, node)
+
+    def add_sheet(self, sch, depth):
+        """ Connects the items of a sheet instance and then its sub-sheets """
+        names = self.names[id(sch)] = SheetNames()
+        prefix = sch.sheet_path_h.rstrip('/')+'/'
+        # Index 0 for wires, 1 for buses
+        indexes = (PointIndex(), PointIndex())
+        on_segments = ([], [])
+        for w in sch.wires:
+            if w.type == 'polyline':
+                continue
+            is_bus = w.type == 'bus'
+            node = self.uf.add()
+            for p1, p2 in zip(w.points, w.points[1:]):
+                indexes[is_bus].add_segment(node, _key(p1.x, p1.y), _key(p2.x, p2.y))
+            if is_bus:
+                self.bus_nodes.append((node, names))
+        for j in sch.junctions:
+            key = _key(j.pos_x, j.pos_y)
+            self.add_node(indexes[0], key, on_segments[0])
+            self.bus_nodes.append((self.add_node(indexes[1], key, on_segments[1]), names))
+        for nc in sch.no_conn:
+            self.no_connects.append(self.add_node(indexes[0], _key(nc.pos_x, nc.pos_y)))
+        # Bus entries don't carry names, the bus members are connected by the name of the labels, like KiCad does
+        for lbl in sch.labels:
+            node, text = self.add_label(lbl, PRIORITY_LOCAL_LABEL, prefix+lbl.text, depth, indexes, on_segments, names)
+            names.local.setdefault(text, []).append(node)
+        for lbl in sch.hlabels:
+            node, text = self.add_label(lbl, PRIORITY_HIER_LABEL, prefix+lbl.text, depth, indexes, on_segments, names)
+            names.local.setdefault(text, []).append(node)
+            names.hier.setdefault(text, []).append(node)
+        for lbl in sch.glabels:
+            node, text = self.add_label(lbl, PRIORITY_GLOBAL, lbl.text, depth, indexes, on_segments, names)
+            self.add_global(text, node)
+        for sheet in sch.sheets:
+            for pin in sheet.pins:
+                is_bus = self.is_bus(pin.name)
+                node = self.add_node(indexes[is_bus], _key(pin.pos_x, pin.pos_y))
+                self.drivers.append(Driver(node, PRIORITY_SHEET_PIN, depth, prefix+pin.name, pin.name))
+                self.sheet_links.append((node, is_bus, sheet.sheet, pin.name))
+                if is_bus:
+                    self.bus_nodes.append((node, names))
+        self.add_symbols(sch, depth, indexes[0])
+        for index, on_seg in zip(indexes, on_segments):
+            index.connect(self.uf, on_seg)
+        # Labels with the same name are connected inside the sheet
+        for nodes in names.local.values():
+            for n in nodes[1:]:
+                self.uf.union(nodes[0], n)
+        for sheet in sch.sheets:
+            self.add_sheet(sheet.sheet, depth+1)
+
+    def connect_hierarchy(self):
+        """ Sheet pins are connected to the hierarchical labels with the same name """
+        self.bus_links = []
+        for node, is_bus, child, name in self.sheet_links:
+            for label in self.names[id(child)].hier.get(name, ()):
+                if is_bus:
+                    # Buses are connected member by member, they are in different sheets
+                    self.bus_links.append((node, label))
+                else:
+                    self.uf.union(node, label)
+
+    def best_drivers(self):
+        """ The driver that names each group of nodes """
+        find = self.uf.find
+        best = {}
+        for d in self.drivers:
+            root = find(d.node)
+            cur = best.get(root)
+            if cur is None or (-d.priority, d.depth, d.name) < (-cur.priority, cur.depth, cur.name):
+                best[root] = d
+        return best
+
+    def connect_buses(self):
+        """ Creates a node for each member of each bus and connects them with the nets (by name) and between
+            the buses connected by the hierarchy """
+        if not self.bus_nodes:
+            return
+        find = self.uf.find
+        best = self.best_drivers()
+        # Bus root -> {key: member node}
+        members = {}
+        for node, names in self.bus_nodes:
+            root = find(node)
+            if root in members:
+                continue
+            mems = members[root] = {}
+            driver = best.get(root)
+            if driver is None:
+                continue
+            for key, name in self.bus_members(driver.text):
+                m = mems[key] = self.uf.add()
+                for n in names.all.get(name, ()):
+                    self.uf.union(m, n)
+        for a, b in self.bus_links:
+            mem_b = members.get(find(b), {})
+            for key, node in members.get(find(a), {}).items():
+                other = mem_b.get(key)
+                if other is not None:
+                    self.uf.union(node, other)
+
+    @staticmethod
+    def sub_reference(pin):
+        """ The reference with the unit letter, for multi-unit symbols """
+        if pin.units <= 1:
+            return pin.ref
+        unit = pin.comp.unit
+        letters = ''
+        while unit > 0:
+            unit, r = divmod(unit-1, 26)
+            letters = chr(ord('A')+r)+letters
+        return pin.ref+letters
+
+    @staticmethod
+    def pin_net_name(pin, unconnected):
+        """ Default name for a net driven by a pin """
+        name = 'unconnected-(' if unconnected or pin.type == 'no_connect' else 'Net-('
+        unconnected = name[0] == 'u'
+        if pin.ref.endswith('?'):
+            return name+pin.ref+pin.comp.uuid+'-Pad'+pin.number+')'
+        if not GS.ki7:
+            return name+pin.ref+'-Pad'+pin.number+')'
+        if pin.name and pin.name != pin.number:
+            has_multiple = any(pin_shown_name(p.name) == pin.name and p.number != pin.number and
+                               unconnected == (p.type == 'no_connect') for p in pin.lib_pins)
+            name += SchConnectivity.sub_reference(pin)+'-'+_escape(pin.name)
+            if unconnected or has_multiple:
+                name += '-Pad'+_escape(pin.number)
+            return name+')'
+        return name+pin.ref+'-Pad'+_escape(pin.number)+')'
+
+    def solve_nets(self):
+        find = self.uf.find
+        best = self.best_drivers()
+        no_connect = {find(n) for n in self.no_connects}
+        # Root -> [Pin]
+        groups = {}
+        for node, pin in self.pins.items():
+            root = find(node)
+            groups.setdefault(root, []).append(pin)
+            if pin.type == 'no_connect':
+                no_connect.add(root)
+        # Name -> ([Pin], no connect)
+        by_name = {}
+        for root, pins in groups.items():
+            driver = best.get(root)
+            nc = root in no_connect
+            if driver is not None and driver.priority > PRIORITY_PIN:
+                name = driver.name
+            else:
+                unconnected = nc or len({(p.ref, p.number) for p in pins}) == 1
+                name = min(self.pin_net_name(p, unconnected) for p in pins)
+            # KiCad joins the nets with the same name
+            cur = by_name.get(name)
+            if cur is None:
+                by_name[name] = (pins, nc)
+            else:
+                by_name[name] = (cur[0]+pins, cur[1] or nc)
+        nets = []
+        for name in sorted(by_name.keys(), key=cmp_to_key(str_num_cmp)):
+            pins, nc = by_name[name]
+            nodes = {}
+            for p in pins:
+                if p.ref[0] != '#':
+                    nodes.setdefault((p.ref, p.number), p)
+            if not nodes:
+                continue
+            nets.append(Net(len(nets)+1, name, [nodes[k] for k in sorted(nodes.keys())], nc))
+        logger.debug('Schematic connectivity: {} nets'.format(len(nets)))
+        return nets
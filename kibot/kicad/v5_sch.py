@@ -11,20 +11,22 @@ Currently oriented to collect the components for the BoM.
 # Encapsulate file/line
 import re
 import os
-from xml.etree.ElementTree import Element, SubElement, tostring
-from xml.dom import minidom
 from datetime import datetime
 from copy import deepcopy
 from collections import OrderedDict
+from itertools import count
 from .config import KiConf, un_quote
 from .error import SchError, SchFileError, SchLibError
 from ..gs import GS
+from ..xml_stream import XMLWriter
 from ..misc import (W_BADPOLI, W_POLICOORDS, W_BADSQUARE, W_BADCIRCLE, W_BADARC, W_BADTEXT, W_BADPIN, W_BADCOMP, W_BADDRAW,
                     W_UNKDCM, W_UNKAR, W_ARNOPATH, W_ARNOREF, W_MISCFLD, W_EXTRASPC, W_NOLIB, W_INCPOS, W_NOANNO, W_MISSLIB,
                     W_MISSDCM, W_MISSCMP, W_MISFLDNAME, W_NOENDLIB)
 from .. import log
 
 logger = log.get_logger()
+# Source for the revision numbers assigned to modified fields
+fields_rev_counter = count(1)
 
 
 class LineReader(object):
@@ -880,6 +882,8 @@ class SchematicComponent(object):
         - footprint_h: height of the footprint (pads only)
         - qty: amount of this part used.
         - kicad_dnp: is the KiCad v7 DNP flag. If not defined (v5/6) is None and is like False.
+        - fields_rev: revision of the fields, changes every time we modify them.
+                      Restoring the back-up also restores the revision.
         """
     ref_re = re.compile(r'([^\d]+)([\?\d]+)')
 
@@ -895,6 +899,7 @@ class SchematicComponent(object):
         self.dfields = {}
         self.fields_bkp = None
         self.dfields_bkp = None
+        self.fields_rev = self.fields_rev_bkp = 0
         # Will be computed
         self.fitted = True
         self.included = True
@@ -945,6 +950,7 @@ class SchematicComponent(object):
         """ Change the value for an existing field.
             Or create a new one (returns True). """
         field_lc = field.lower()
+        self.fields_rev = next(fields_rev_counter)
         if field_lc in self.dfields:
             target = self.dfields[field_lc]
             target.value = value
@@ -977,6 +983,7 @@ class SchematicComponent(object):
         return [(f.name, f.value) for f in self.fields if f.number > 3]
 
     def add_field(self, field):
+        self.fields_rev = next(fields_rev_counter)
         self.fields.append(field)
         self.dfields[field.name.lower()] = field
 
@@ -984,6 +991,7 @@ class SchematicComponent(object):
         old_name = old_name.lower()
         field = self.dfields[old_name]
         field.name = new_name
+        self.fields_rev = next(fields_rev_counter)
         del self.dfields[old_name]
         self.dfields[new_name.lower()] = field
 
@@ -995,11 +1003,19 @@ class SchematicComponent(object):
             self.fields = deepcopy(self.fields_bkp)
             self.dfields = {f.name.lower(): f for f in self.fields}
             self._solve_fields(LineReader(None, '**Internal**'))
+            self.fields_rev = self.fields_rev_bkp
         else:
             # No back-up. Make one for the next reset
             self.fields_bkp = deepcopy(self.fields)
+            self.fields_rev_bkp = self.fields_rev
             self.dfields_bkp = {f.name.lower(): f for f in self.fields_bkp}
 
+    def get_filter_state(self):
+        """ Returns a tuple that changes when something used by the logic filters changes.
+            Fields are represented by its revision, so this is cheap. """
+        return (self.fields_rev, self.ref, self.value, self.bottom, self.virtual, self.smd, self.tht, self.in_bom,
+                self.in_bom_pcb, self.on_board)
+
     def _solve_ref(self, path):
         """ Look for the correct reference for this path.
             Returns the default reference if no paths defined.
@@ -1893,43 +1909,51 @@ class Schematic(object):
             fnames.append(os.path.join(dest_dir, sch.replace('/', '_')))
         return fnames
 
-    def save_netlist_design(self, root):
+    def save_netlist_design(self, xml):
         """ Generates the `design` section of the netlist """
-        design = SubElement(root, 'design')
-        SubElement(design, 'source').text = self.fname
-        SubElement(design, 'date').text = datetime.now().strftime("%c")
-        SubElement(design, 'tool').text = 'KiBot v'+GS.kibot_version
+        xml.start('design')
+        xml.element('source', self.fname)
+        xml.element('date', datetime.now().strftime("%c"))
+        xml.element('tool', 'KiBot v'+GS.kibot_version)
         order = 1
         is_v5 = self.max_comments == 4
         for s in self.all_sheets:
-            sheet = SubElement(design, 'sheet')
             # KiCad v5 numbering is broken
-            sheet.set('number', str(order) if is_v5 else s.sheet)
-            sheet.set('name', _path(s.sheet_path_h))
-            sheet.set('tstamps', _path(s.sheet_path))
-            tblock = SubElement(sheet, 'title_block')
-            title = SubElement(tblock, 'title')
-            if s.title_ori:
-                title.text = s.title_ori
-            company = SubElement(tblock, 'company')
-            if s.company:
-                company.text = s.company
-            rev = SubElement(tblock, 'rev')
-            if s.revision:
-                rev.text = s.revision
-            dt = SubElement(tblock, 'date')
-            if s.date:
-                dt.text = s.date
-            SubElement(tblock, 'source').text = os.path.basename(s.fname)
+            xml.start('sheet', (('number', str(order) if is_v5 else s.sheet), ('name', _path(s.sheet_path_h)),
+                                ('tstamps', _path(s.sheet_path))))
+            xml.start('title_block')
+            xml.element('title', s.title_ori)
+            xml.element('company', s.company)
+            xml.element('rev', s.revision)
+            xml.element('date', s.date)
+            xml.element('source', os.path.basename(s.fname))
             for num in range(s.max_comments):
-                com = SubElement(tblock, 'comment')
-                com.set('number', str(num+1))
-                com.set('value', s.comment[num])
+                xml.element('comment', attrs=(('number', str(num+1)), ('value', s.comment[num])))
+            xml.end()
+            xml.end()
             order += 1
+        xml.end()
 
-    def save_netlist_components(self, root, comps, excluded, fitted, no_field):
+    @staticmethod
+    def save_netlist_attributes(xml, c):
+        """ Extra properties added by KiCad, used to check the PCB parity """
+        if GS.ki7 and hasattr(c, 'lib_symbol'):
+            # KiCad 7 also copies the description and keywords, KiCad 8 the keywords and footprint filters
+            for fname in ('ki_keywords', 'ki_fp_filters') if GS.ki8 else ('ki_description', 'ki_keywords'):
+                fvalue = c.lib_symbol.get_field_value(fname)
+                if fvalue:
+                    xml.element('property', attrs=(('name', fname), ('value', fvalue)))
+        # Attributes, without value
+        attrs = [('exclude_from_bom', not c.in_bom), ('exclude_from_board', not c.on_board)]
+        if GS.ki7:
+            attrs.append(('dnp', c.kicad_dnp))
+        for name, used in attrs:
+            if used:
+                xml.element('property', attrs=(('name', name),))
+
+    def save_netlist_components(self, xml, comps, excluded, fitted, no_field, complete=False):
         """ Generates the `components` section of the netlist """
-        components = SubElement(root, 'components')
+        xml.start('components')
         # Collapse units
         real_comps = []
         tstamps = {}
@@ -1946,52 +1970,62 @@ class Schematic(object):
             if fitted and not c.fitted:
                 # DNP
                 continue
-            comp = SubElement(components, 'comp')
-            comp.set('ref', c.ref)
-            SubElement(comp, 'value').text = c.value
+            xml.start('comp', (('ref', c.ref),))
+            xml.element('value', c.value)
             if c.footprint:
-                SubElement(comp, 'footprint').text = c.footprint
+                xml.element('footprint', c.footprint_lib+':'+c.footprint if complete and c.footprint_lib else c.footprint)
             if len(c.datasheet) and not (self.netlist_version == 'E' and c.datasheet == '~'):
-                SubElement(comp, 'datasheet').text = c.datasheet
+                xml.element('datasheet', c.datasheet)
             user_fields = c.get_user_fields()
-            if user_fields:
-                fields = SubElement(comp, 'fields')
-                for fname, fvalue in user_fields:
+            desc = c.desc
+            if complete and GS.ki8:
+                # KiCad 8: the description is a mandatory field, they are listed after the user fields
+                user_fields = [f for f in user_fields if f[0] != 'Description']
+                fields = user_fields+[('Footprint', c.footprint_lib+':'+c.footprint if c.footprint_lib else c.footprint),
+                                      ('Datasheet', '' if c.datasheet == '~' else c.datasheet),
+                                      ('Description', c.get_field_value('Description'))]
+                if hasattr(c, 'lib_symbol'):
+                    desc = c.lib_symbol.get_field_value('Description')
+            elif complete:
+                # KiCad 6/7 sorts the fields by name
+                fields = sorted(user_fields, key=lambda f: f[0])
+            else:
+                fields = user_fields
+            if fields:
+                xml.start('fields')
+                for fname, fvalue in fields:
                     if fname.lower() in no_field:
                         continue
-                    fld = SubElement(fields, 'field')
-                    fld.set('name', fname)
-                    fld.text = fvalue
-            lbs = SubElement(comp, 'libsource')
-            lbs.set('lib', c.lib)
-            lbs.set('part', c.name)
-            lbs.set('description', c.desc)
+                    xml.element('field', fvalue, (('name', fname),))
+                xml.end()
+            xml.element('libsource', attrs=(('lib', c.lib), ('part', c.name), ('description', desc)))
             # v6 properties
             if self.netlist_version == 'E':
                 for fname, fvalue in user_fields:
                     if fname in no_field:
                         continue
-                    fld = SubElement(comp, 'property')
-                    fld.set('name', fname)
-                    fld.set('value', fvalue)
-                prop = SubElement(comp, 'property')
-                prop.set('name', 'Sheetname')
-                prop.set('value', os.path.basename(c.sheet_path_h))
+                    xml.element('property', attrs=(('name', fname), ('value', fvalue)))
+                sheet_name = os.path.basename(c.sheet_path_h)
+                if complete and GS.ki8 and not sheet_name:
+                    sheet_name = 'Root'
+                xml.element('property', attrs=(('name', 'Sheetname'), ('value', sheet_name)))
                 if hasattr(c, 'parent_sheet'):
                     # Components from the PCB doesn't have "parent_sheet"
-                    prop = SubElement(comp, 'property')
-                    prop.set('name', 'Sheetfile')
-                    prop.set('value', os.path.basename(c.parent_sheet.fname))
-            shp = SubElement(comp, 'sheetpath')
-            shp.set('names', _path(c.sheet_path_h))
-            shp.set('tstamps', _path(c.sheet_path))
+                    xml.element('property', attrs=(('name', 'Sheetfile'), ('value', os.path.basename(c.parent_sheet.fname))))
+                if complete:
+                    self.save_netlist_attributes(xml, c)
+            xml.element('sheetpath', attrs=(('names', _path(c.sheet_path_h)), ('tstamps', _path(c.sheet_path))))
             if self.netlist_version == 'D':
-                SubElement(comp, 'tstamp').text = tstamps[c.ref].split()[0]
+                xml.element('tstamp', tstamps[c.ref].split()[0])
             else:
-                SubElement(comp, 'tstamps').text = tstamps[c.ref]
-
-    def save_netlist_libparts(self, root):
-        libparts = SubElement(root, 'libparts')
+                xml.element('tstamps', tstamps[c.ref])
+            xml.end()
+        xml.end()
+
+    def save_netlist_libparts(self, xml, complete=False):
+        xml.start('libparts')
+        # KiCad 8 uses a regular field for the description and lists the empty fields
+        ki8_layout = complete and GS.ki8
         for k in sorted(self.comps_data.keys()):
             v = self.comps_data[k]
             if not v:
@@ -1999,27 +2033,28 @@ class Schematic(object):
             ref = v.get_field_value('reference')
             if ref and ref[0] == '#':
                 continue
-            libpart = SubElement(libparts, 'libpart')
             res = k.split(':')
             cres = len(res)
             if cres == 1:
-                libpart.set('lib', '')
-                libpart.set('part', res[0])
+                attrs = (('lib', ''), ('part', res[0]))
             elif cres == 2:
-                libpart.set('lib', res[0])
-                libpart.set('part', res[1])
+                attrs = (('lib', res[0]), ('part', res[1]))
+            else:
+                attrs = None
+            xml.start('libpart', attrs)
             if v.alias:
-                aliases = SubElement(libpart, 'aliases')
+                xml.start('aliases')
                 for alias in v.alias:
-                    SubElement(aliases, 'alias').text = alias
+                    xml.element('alias', alias)
+                xml.end()
             # Description
             desc = None
             if v.dcm and v.dcm.desc:
                 desc = v.dcm.desc
             else:
-                desc = v.get_field_value('ki_description')
+                desc = v.get_field_value('Description' if ki8_layout else 'ki_description')
             if desc:
-                SubElement(libpart, 'description').text = desc
+                xml.element('description', desc)
             # Datatsheet
             datasheet = None
             if v.dcm and v.dcm.datasheet:
@@ -2027,7 +2062,7 @@ class Schematic(object):
             else:
                 datasheet = v.get_field_value('datasheet')
             if datasheet:
-                SubElement(libpart, 'docs').text = datasheet
+                xml.element('docs', datasheet)
             # Footprint filters
             fp_list = None
             if v.fp_list:
@@ -2035,52 +2070,57 @@ class Schematic(object):
             else:
                 fp_list = v.get_field_value('ki_fp_filters').split()
             if fp_list:
-                fps = SubElement(libpart, 'footprints')
+                xml.start('footprints')
                 for fp in fp_list:
-                    SubElement(fps, 'fp').text = fp
+                    xml.element('fp', fp)
+                xml.end()
             # Fields
-            flds = SubElement(libpart, 'fields')
+            xml.start('fields')
             for fld in v.fields:
-                if not fld.value or fld.name.startswith('ki_'):
+                if (not fld.value and not ki8_layout) or fld.name.startswith('ki_'):
                     continue
-                field = SubElement(flds, 'field')
-                field.set('name', fld.name)
-                field.text = fld.value
+                xml.element('field', fld.value, (('name', fld.name),))
+            xml.end()
             # Pins
             if v.all_pins:
-                pins = SubElement(libpart, 'pins')
+                xml.start('pins')
                 for pin in sorted(v.all_pins, key=lambda x: "%10s" % x.number):
-                    pn = SubElement(pins, 'pin')
-                    pn.set('num', pin.number)
                     name = pin.name
                     if self.netlist_version == 'E' and name == '~':
                         name = ''
-                    pn.set('name', name)
                     tp = pin.type
                     if len(tp) == 1:
                         tp = pin.type2name.get(pin.type, 'unknown')
-                    pn.set('type', tp)
-
-    def save_netlist(self, fhandle, comps, excluded=False, fitted=True, no_field=()):
-        """ This is a partial netlist in XML, only useful for BoMs """
-        root = Element("export")
-        root.set('version', self.netlist_version)
+                    xml.element('pin', attrs=(('num', pin.number), ('name', name), ('type', tp)))
+                xml.end()
+            xml.end()
+        xml.end()
+
+    def save_netlist_nets(self, xml):
+        """ Generates the `nets` section of the netlist, not available for KiCad 5 """
+        return
+
+    def save_netlist(self, fhandle, comps, excluded=False, fitted=True, no_field=(), complete=False):
+        """ This is a partial netlist in XML, only useful for BoMs.
+            Use `complete` to also include the nets and the footprint libs, like KiCad does (KiCad 6+).
+            The XML is written while generated, we don't keep it in memory """
+        xml = XMLWriter(fhandle, indent='  ', encoding='UTF-8')
+        xml.start('export', (('version', self.netlist_version),))
         # Design section
-        self.save_netlist_design(root)
+        self.save_netlist_design(xml)
         # Components
-        self.save_netlist_components(root, comps, excluded, fitted, no_field)
+        self.save_netlist_components(xml, comps, excluded, fitted, no_field, complete)
         # LibParts
-        self.save_netlist_libparts(root)
+        self.save_netlist_libparts(xml, complete)
         # Libraries
-        libraries = SubElement(root, 'libraries')
+        xml.start('libraries')
         for k, v in self.libs.items():
-            lib = SubElement(libraries, 'library')
-            lib.set('logical', k)
-            SubElement(lib, 'uri').text = v
+            xml.start('library', (('logical', k),))
+            xml.element('uri', v)
+            xml.end()
+        xml.end()
         # Nets
-        # TODO: May be in the future
-        SubElement(root, 'nets')
-        # Make it look nice
-        rough_string = tostring(root, encoding='utf8')
-        reparsed = minidom.parseString(rough_string.decode('utf8'))
-        fhandle.write(reparsed.toprettyxml(indent="  ", encoding='UTF-8'))
+        xml.start('nets')
+        if complete:
+            self.save_netlist_nets(xml)
+        xml.close()
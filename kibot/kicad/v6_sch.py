@@ -18,6 +18,7 @@ from ..gs import GS
 from .. import log
 from ..misc import W_NOLIB, W_UNKFLD, W_MISSCMP
 from .error import SchError
+from .sch_connectivity import SchConnectivity
 from .sexpdata import load, SExpData, Symbol, dumps, Sep
 from .sexp_helpers import (_check_is_symbol_list, _check_len, _check_len_total, _check_symbol, _check_hide, _check_integer,
                            _check_float, _check_str, _check_symbol_value, _check_symbol_float, _check_symbol_int,
@@ -2102,6 +2103,19 @@ class SchematicV6(Schematic):
                 sch.sch.save(sch.flat_file if exp_hierarchy else sch.sch.fname_rel, dest_dir, base_sheet, saved, cross=cross,
                              exp_hierarchy=exp_hierarchy, dry=dry)
 
+    def save_netlist_nets(self, xml):
+        """ Generates the `nets` section of the netlist """
+        for net in SchConnectivity(self).nets:
+            xml.start('net', (('code', str(net.code)), ('name', net.name)))
+            for pin in net.nodes:
+                attrs = [('ref', pin.ref), ('pin', pin.number)]
+                if pin.name:
+                    attrs.append(('pinfunction', pin.name))
+                # KiCad 7 marks the pins connected to a no connect flag
+                attrs.append(('pintype', pin.type+'+no_connect' if GS.ki7 and net.no_connect else pin.type))
+                xml.element('node', attrs=attrs)
+            xml.end()
+
     def save_variant(self, dest_dir):
         fname = os.path.basename(self.fname)
         self.save(fname, dest_dir, cross=True, exp_hierarchy=self.check_exp_hierarchy())
@@ -136,6 +136,10 @@ class WksDrawing(object):
         """ Default parser for arguments specific for the class. """
         raise WksError('Unknown {} attribute `{}`'.format(self.c_name, i))
 
+    def is_dynamic(self):
+        """ True if the drawing changes from page to page """
+        return False
+
     @classmethod
     def parse(cls, items):
         s = cls()
@@ -266,6 +270,10 @@ class WksText(WksDrawing):
         self.text = _check_relaxed(items, 1, self.c_name+' text')
         return 2
 
+    def is_dynamic(self):
+        # Text variables can change for each page (page number, layer, title, etc.)
+        return '${' in self.text
+
     def parse_specific_args(self, i_type, i, items, offset):
         if i_type == 'rotate':
             self.rotate = _check_float(i, 1, i_type)
@@ -401,6 +409,9 @@ class WksBitmap(WksDrawing):
         self.pos_ref = 'rbcorner'
         self.scale = 1.0
         self.data = b''
+        # Gray version of the image, created on demand
+        self.gray_data = None
+        self.png_info = None
 
     def parse_specific_args(self, i_type, i, items, offset):
         if i_type == 'pos':
@@ -426,6 +437,11 @@ class WksBitmap(WksDrawing):
         p.images.append(e)
 
     def parse_png(e):
+        if e.png_info is None:
+            e.png_info = e._parse_png()
+        return e.png_info
+
+    def _parse_png(e):
         s = e.data
         offset = 8
         ppi = 300
@@ -455,10 +471,10 @@ class WksBitmap(WksDrawing):
             raise WksError('Broken PNG, no IHDR chunk')
         return w, h, ppi
 
-    def add_to_svg(e, svg, p, svg_precision):
+    def add_to_svg(e, svg, p, svg_precision, monochrome=False):
         # Note: we compute all in KiCad IUs, and then apply a scale for the SVG
         w, h, ppi = e.parse_png()
-        s = e.data
+        s = e.gray_data if monochrome else e.data
         # For KiCad 300 dpi is 1:1 scale
         dpi = ppi/e.scale
         # Convert pixels to mm and then to KiCad units
@@ -494,6 +510,11 @@ class Worksheet(object):
         self.version = version
         self.generator = generator
         self.has_images = has_images
+        # Elements that must be drawn for each page
+        self.has_dynamic = any(e.is_dynamic() for e in elements)
+        # The static elements are different for the first page
+        self.page_dependent = any(e.option for e in elements)
+        self.images = []
 
     @staticmethod
     def load(file):
@@ -570,23 +591,28 @@ class Worksheet(object):
     def check_page(self, e):
         return e.option and ((e.option == 'page1only' and self.page != 1) or (e.option == 'notonpage1' and self.page == 1))
 
-    def draw(self, board, layer, page, page_w, page_h, tb_vars):
+    def draw(self, board, layer, page, page_w, page_h, tb_vars, dynamic=None):
+        """ Draws the worksheet in the board.
+            Use `dynamic` to draw only the elements that change from page to page (True) or the rest (False) """
         self.pcb_items = []
         self.set_page(page_w, page_h)
         self.layer = layer
         self.board = board
         self.page = page
         self.tb_vars = tb_vars
-        self.images = []
+        if not dynamic:
+            self.images = []
         for e in self.elements:
             # Some objects are for the first page, other for all but the first page, and most for all
             if self.check_page(e):
                 continue
+            if dynamic is not None and e.is_dynamic() != dynamic:
+                continue
             e.draw(self)
 
-    def add_images_to_svg(self, svg, svg_precision):
-        for e in self.images:
-            e.add_to_svg(svg, self, svg_precision)
+    def add_images_to_svg(self, svg, svg_precision, images=None, monochrome=False):
+        for e in self.images if images is None else images:
+            e.add_to_svg(svg, self, svg_precision, monochrome)
 
     def out_of_margin(self, p):
         """ Used to check if the repeat went outside the page usable area """
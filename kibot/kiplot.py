@@ -14,7 +14,7 @@ import gzip
 import os
 import re
 from sys import path as sys_path
-from shutil import which, copy2
+from shutil import which, copy2, rmtree
 from subprocess import run, PIPE, STDOUT, Popen, CalledProcessError
 from glob import glob
 from importlib.util import spec_from_file_location, module_from_spec
@@ -30,6 +30,8 @@ from .misc import (PLOT_ERROR, CORRUPTED_PCB, EXIT_BAD_ARGS, CORRUPTED_SCH, vers
 from .error import PlotError, KiPlotConfigurationError, config_error, KiPlotError
 from .config_reader import CfgYamlReader
 from .pre_base import BasePreFlight
+from .profiler import Profiler
+from .bom.units import save_parser_cache
 from .dep_downloader import register_deps
 import kibot.dep_downloader as dep_downloader
 from .kicad.v5_sch import Schematic, SchFileError, SchError, SchematicField
@@ -146,11 +148,12 @@ def debug_output(res):
         logger.debug('- Output from command: '+res.stdout.decode())
 
 
-def _run_command(command, change_to):
-    return run(command, check=True, stdout=PIPE, stderr=STDOUT, cwd=change_to)
+def _run_command(command, change_to, env=None):
+    with Profiler.measure('command', os.path.basename(command[0])):
+        return run(command, check=True, stdout=PIPE, stderr=STDOUT, cwd=change_to, env=env)
 
 
-def run_command(command, change_to=None, just_raise=False, use_x11=False, err_msg=None, err_lvl=FAILED_EXECUTE):
+def run_command(command, change_to=None, just_raise=False, use_x11=False, err_msg=None, err_lvl=FAILED_EXECUTE, env=None):
     logger.debug('- Executing: '+GS.pasteable_cmd(command))
     if change_to is not None:
         logger.debug('- CWD: '+change_to)
@@ -159,9 +162,9 @@ def run_command(command, change_to=None, just_raise=False, use_x11=False, err_ms
             logger.debug('Using Xvfb to run the command')
             from xvfbwrapper import Xvfb
             with Xvfb(width=640, height=480, colordepth=24):
-                res = _run_command(command, change_to)
+                res = _run_command(command, change_to, env)
         else:
-            res = _run_command(command, change_to)
+            res = _run_command(command, change_to, env)
     except CalledProcessError as e:
         if just_raise:
             raise
@@ -179,7 +182,8 @@ def exec_with_retry(cmd, exit_with=None):
         logger.debug('Command line: '+str(cmd))
     retry = 2
     while retry:
-        result = run(cmd, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+        with Profiler.measure('command', os.path.basename(cmd[0])):
+            result = run(cmd, stdout=PIPE, stderr=PIPE, universal_newlines=True)
         ret = result.returncode
         retry -= 1
         if ret != 16 and (ret > 0 and ret < 128 and retry):
@@ -206,7 +210,7 @@ def load_board(pcb_file=None, forced=False):
         GS.check_pcb()
         pcb_file = GS.pcb_file
     try:
-        with hide_stderr():
+        with hide_stderr(), Profiler.measure('load', 'PCB '+os.path.basename(pcb_file)):
             board = pcbnew.LoadBoard(pcb_file)
         if GS.global_invalidate_pcb_text_cache == 'yes' and GS.ki6:
             # Workaround for unexpected KiCad behavior:
@@ -283,7 +287,8 @@ def load_sch(sch_file=None, forced=False):
     if not sch_file:
         GS.check_sch()
         sch_file = GS.sch_file
-    GS.sch = load_any_sch(sch_file, os.path.splitext(os.path.basename(sch_file))[0])
+    with Profiler.measure('load', 'SCH '+os.path.basename(sch_file)):
+        GS.sch = load_any_sch(sch_file, os.path.splitext(os.path.basename(sch_file))[0])
 
 
 def create_component_from_footprint(m, ref):
@@ -528,7 +533,8 @@ def config_output(out, dry=False, dont_stop=False):
             load_sch()
     ok = True
     try:
-        out.config(None)
+        with Profiler.measure('config', out.name):
+            out.config(None)
     except (KiPlotConfigurationError, PlotError) as e:
         msg = "In section '"+out.name+"' ("+out.type+"): "+str(e)
         GS.exit_with_error(msg, DONT_STOP if dont_stop else EXIT_BAD_CONFIG)
@@ -561,7 +567,8 @@ def run_output(out, dont_stop=False):
             load_board()
     GS.current_output = out.name
     try:
-        out.run(get_output_dir(out.dir, out))
+        with Profiler.output(out.name):
+            out.run(get_output_dir(out.dir, out))
         out._done = True
     except KiPlotConfigurationError as e:
         msg = "In section '"+out.name+"' ("+out.type+"): "+str(e)
@@ -661,6 +668,30 @@ def _generate_outputs(targets, invert, skip_pre, cli_order, no_priority, dont_st
             run_output(out, dont_stop)
 
 
+def get_shared_netlist(key, name, comps, no_field=()):
+    """ Returns the name of an XML netlist for the `comps` components.
+        The netlist is created only once for each `key`, then shared by all the outputs.
+        The file name is `name`.xml, removed by `remove_shared_netlists` """
+    netlist = GS.shared_netlists.get(key)
+    if netlist is not None:
+        logger.debug('Using the shared netlist `{}`'.format(netlist))
+        return netlist
+    netlist = os.path.join(GS.mkdtemp('netlist'), name+'.xml')
+    logger.debug('Creating variant netlist `{}`'.format(netlist))
+    with open(netlist, 'wb') as f:
+        GS.sch.save_netlist(f, comps, no_field=no_field)
+    GS.shared_netlists[key] = netlist
+    return netlist
+
+
+def remove_shared_netlists():
+    for netlist in GS.shared_netlists.values():
+        net_dir = os.path.dirname(netlist)
+        logger.debug('Removing temporal netlist dir `{}`'.format(net_dir))
+        rmtree(net_dir, ignore_errors=True)
+    GS.shared_netlists = {}
+
+
 def generate_outputs(targets, invert, skip_pre, cli_order, no_priority, dont_stop=False):
     setup_resources()
     prj = None
@@ -672,6 +703,9 @@ def generate_outputs(targets, invert, skip_pre, cli_order, no_priority, dont_sto
     finally:
         # Restore the project file
         GS.write_pro(prj)
+        Profiler.save()
+        save_parser_cache()
+        remove_shared_netlists()
 
 
 def adapt_file_name(name):
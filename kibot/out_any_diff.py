@@ -4,10 +4,13 @@
 # License: GPL-3.0
 # Project: KiBot (formerly KiPlot)
 import os
+from subprocess import CalledProcessError, run, PIPE, DEVNULL
+from . import __version__
 from .gs import GS
 from .kiplot import run_command
 from .out_base import VariantOptions
 from .pre_base import BasePreFlight
+from .render_cache import RenderCache, MISSING, file_blob_id, read_text, sch_sheets
 from .macros import macros, document, output_class  # noqa: F401
 from . import log
 
@@ -25,6 +28,7 @@ class AnyDiffOptions(VariantOptions):
         self._expand_id = 'diff'
         self._expand_ext = 'pdf'
         self._kiri_mode = False
+        self._kidiff_version = None
 
     def add_zones_ops(self, cmd):
         if self.zones == 'global':
@@ -35,7 +39,67 @@ class AnyDiffOptions(VariantOptions):
         elif self.zones == 'unfill':
             cmd.extend(['--zones', 'unfill'])
 
-    def add_to_cache(self, name, hash):
+    def render_signature(self):
+        """ Things that affect the renders, other than the content of the files.
+            The tools versions are included, so an upgrade doesn't reuse old renders """
+        cmd = []
+        self.add_zones_ops(cmd)
+        layers = getattr(self, '_solved_layers', None) if self.incl_file else None
+        all_pages = not getattr(self, 'only_first_sch_page', False)
+        return (self._kiri_mode, ' '.join(cmd), [la.id for la in layers] if layers else 'all', all_pages,
+                GS.kicad_version, self.command, self._kidiff_version, __version__)
+
+    def render_key(self, hash, pro=None):
+        """ Key for the content addressed cache. `pro` is the blob id of the project, it has the text variables,
+            layer settings, etc. """
+        return RenderCache.make_key(hash, pro, *self.render_signature()) if RenderCache.enabled() else None
+
+    @staticmethod
+    def pro_name(name):
+        """ Name of the project for a PCB or schematic """
+        return os.path.splitext(name)[0]+GS.pro_ext
+
+    def content_hash(self, pcb=None, sch=None):
+        """ Hash for the content of a PCB and/or schematic, including all the sub-sheets """
+        blobs = []
+        if pcb:
+            blobs.append(file_blob_id(pcb))
+        if sch:
+            blobs.extend(file_blob_id(f) for f in sch_sheets(sch, read_text))
+        return blobs[0] if len(blobs) == 1 else RenderCache.make_key(*blobs)
+
+    def git_blob_id(self, rev, name):
+        """ Blob id for a file in the repo (relative to the repo dir), without a checkout """
+        try:
+            return self.run_git(['rev-parse', rev+':./'+name], just_raise=True)
+        except CalledProcessError:
+            return MISSING
+
+    def git_read(self, rev, name):
+        # Not using run_command, we don't want the whole file in the debug log
+        res = run([self.git_command, 'show', rev+':./'+name], stdout=PIPE, stderr=DEVNULL, cwd=self.repo_dir)
+        return res.stdout.decode(errors='replace') if res.returncode == 0 else None
+
+    def git_content_hash(self, rev, pcb=None, sch=None):
+        """ Same as content_hash, but for the files in a git revision. Names are relative to the repo dir """
+        blobs = []
+        if pcb:
+            blobs.append(self.git_blob_id(rev, pcb))
+        if sch:
+            blobs.extend(self.git_blob_id(rev, f) for f in sch_sheets(sch, lambda n: self.git_read(rev, n)))
+        return blobs[0] if len(blobs) == 1 else RenderCache.make_key(*blobs)
+
+    def add_to_cache(self, name, hash, pro=None):
+        """ Renders `name` to the `hash` dir of the cache.
+            Diff renders are also stored in the content addressed cache, KiRi handles it for the whole commit.
+            `pro` is the blob id of the project, computed from the file system when omitted """
+        key = None
+        if not self._kiri_mode and RenderCache.enabled():
+            key = self.render_key(hash, file_blob_id(self.pro_name(name)) if pro is None else pro)
+        self.name_used_for_cache = name
+        dest = os.path.join(self.cache_dir, hash)
+        if key and RenderCache.fetch(key, dest):
+            return
         cmd = [self.command, '--no_reader', '--only_cache', '--old_file_hash', hash, '--cache_dir', self.cache_dir]
         if self._kiri_mode:
             cmd.append('--kiri_mode')
@@ -47,8 +111,9 @@ class AnyDiffOptions(VariantOptions):
         if GS.debug_enabled:
             cmd.insert(1, '-'+'v'*GS.debug_level)
         cmd.extend([name, name])
-        self.name_used_for_cache = name
         run_command(cmd)
+        if key:
+            RenderCache.store(key, dest)
 
     def run_git(self, cmd, cwd=None, just_raise=False):
         if cwd is None:
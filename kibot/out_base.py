@@ -11,7 +11,7 @@ from shutil import rmtree
 from .bom.columnlist import ColumnList
 from .gs import GS
 from .kicad.pcb import replace_footprints
-from .kiplot import load_sch, get_board_comps_data
+from .kiplot import load_sch, get_board_comps_data, get_shared_netlist
 from .misc import Rect, W_WRONGPASTE, DISABLE_3D_MODEL_TEXT, W_NOCRTYD, MOD_ALLOW_MISSING_COURTYARD, W_MISSDIR, W_KEEPTMP
 if not GS.kicad_version_n:
     # When running the regression tests we need it
@@ -32,6 +32,8 @@ from .error import KiPlotConfigurationError
 from . import log
 
 logger = log.get_logger()
+# Schematic fields that KiCad 6/7 doesn't keep as footprint properties
+SCH_BASIC_FIELDS = {'Reference', 'Value', 'Footprint', 'Datasheet'}
 HIGHLIGHT_3D_WRL = """#VRML V2.0 utf8
 #KiBot generated highlight
 Shape {
@@ -280,6 +282,12 @@ class VariantOptions(BaseOptions):
             return None
         return {c.ref: c for c in self._comps}
 
+    def get_netlist(self, name, no_field=()):
+        """ An XML netlist for the filtered components, named `name`.xml.
+            Outputs using the same variant and filters share it, don't modify or remove it """
+        key = tuple(f.name if f else None for f in (self.variant, self.dnf_filter, self.pre_transform))
+        return get_shared_netlist(key+(tuple(sorted(no_field)), name), name, self._comps, no_field)
+
     def get_refs_hash_multi(self):
         """ This version allows having multiple components with the same reference.
             Is useful for things like a panel """
@@ -904,40 +912,89 @@ class VariantOptions(BaseOptions):
 
     def sch_fields_to_pcb(self, board, comps_hash):
         """ Change the module/footprint data according to the filtered fields.
-            iBoM can parse it. """
+            iBoM can parse it.
+            Only the values that differ are changed, what we change is recorded in an undo log. """
         self._sch_fields_to_pcb_bkp = {}
         has_GetFPIDAsString = False
         first = True
+        # KiCad 6/7 replaces all the properties, KiCad 8 sets one field at a time
+        per_field = GS.ki8
+        writes = saved = 0
         for m in GS.get_modules_board(board):
             if first:
                 has_GetFPIDAsString = hasattr(m, 'GetFPIDAsString')
                 first = False
             ref = m.GetReference()
             comp = comps_hash.get(ref, None)
-            if comp is not None:
-                old_value = m.GetValue()
-                old_fields = GS.get_fields(m)
-                # Introduced in 6.0.6
-                old_fp = m.GetFPIDAsString() if has_GetFPIDAsString else None
-                fields = {f.name: f.value for f in comp.fields}
-                GS.set_fields(m, fields)
-                m.SetValue(fields['Value'])
-                if has_GetFPIDAsString:
-                    m.SetFPIDAsString(fields['Footprint'])
-                self._sch_fields_to_pcb_bkp[ref] = (old_value, old_fields, old_fp)
-        self._has_GetFPIDAsString = has_GetFPIDAsString
+            if comp is None:
+                continue
+            fields = {f.name: f.value for f in comp.fields}
+            # Value
+            old_value = m.GetValue()
+            new_value = fields['Value']
+            if old_value == new_value:
+                old_value = None
+            # Fields
+            old_fields = GS.get_fields(m)
+            if per_field:
+                changed = {k: v for k, v in fields.items() if old_fields.get(k) != v}
+                # Fields that didn't exist aren't removed on restore
+                old_fields = {k: old_fields[k] for k in changed if k in old_fields}
+                saved += len(fields)-len(changed)
+            elif GS.ki6:
+                # The whole map is replaced, so we write all the fields if any of them differs.
+                props = dict(old_fields.items())
+                same = all(props.get(k) == v for k, v in fields.items() if k not in SCH_BASIC_FIELDS)
+                changed = None if same else fields
+                if not changed:
+                    saved += 1
+                    old_fields = None
+            else:
+                # KiCad 5 didn't have fields in the modules
+                changed = old_fields = None
+            # Footprint, introduced in 6.0.6
+            old_fp = None
+            if has_GetFPIDAsString:
+                old_fp = m.GetFPIDAsString()
+                new_fp = fields['Footprint']
+                if old_fp == new_fp:
+                    old_fp = None
+            if old_value is None and not changed and old_fp is None:
+                saved += 2 if has_GetFPIDAsString else 1
+                continue
+            if changed:
+                GS.set_fields(m, changed)
+                writes += len(changed) if per_field else 1
+            if old_value is not None:
+                m.SetValue(new_value)
+                writes += 1
+            else:
+                saved += 1
+            if old_fp is not None:
+                m.SetFPIDAsString(new_fp)
+                writes += 1
+            elif has_GetFPIDAsString:
+                saved += 1
+            self._sch_fields_to_pcb_bkp[ref] = (old_value, old_fields, old_fp)
+        logger.debug(f'Schematic fields to PCB: {len(self._sch_fields_to_pcb_bkp)} footprints changed, {writes} writes'
+                     f' ({saved} avoided)')
 
     def restore_sch_fields_to_pcb(self, board):
         """ Undo sch_fields_to_pcb() """
-        has_GetFPIDAsString = self._has_GetFPIDAsString
+        if not self._sch_fields_to_pcb_bkp:
+            return
         for m in GS.get_modules_board(board):
             ref = m.GetReference()
             data = self._sch_fields_to_pcb_bkp.get(ref, None)
             if data is not None:
-                m.SetValue(data[0])
-                if has_GetFPIDAsString:
-                    m.SetFPIDAsString(data[2])
-                GS.set_fields(m, data[1])
+                old_value, old_fields, old_fp = data
+                if old_value is not None:
+                    m.SetValue(old_value)
+                if old_fp is not None:
+                    m.SetFPIDAsString(old_fp)
+                if old_fields:
+                    GS.set_fields(m, old_fields)
+        self._sch_fields_to_pcb_bkp = {}
 
     def save_tmp_board(self, dir=None):
         """ Save the PCB to a temporal file.
@@ -3,13 +3,16 @@
 # Copyright (c) 2020-2023 Instituto Nacional de Tecnología Industrial
 # License: GPL-3.0
 # Project: KiBot (formerly KiPlot)
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from fnmatch import fnmatch
+from hashlib import sha1
 import os
 import re
 import requests
 import urllib
 from shutil import copy2
+from threading import Lock
 from .bom.units import comp_match
 from .EasyEDA.easyeda_3d import download_easyeda_3d_model
 from .fil_base import reset_filters
@@ -18,10 +21,18 @@ from .gs import GS
 from .optionable import Optionable
 from .out_base import VariantOptions, BaseOutput
 from .kicad.config import KiConf
+from .kicad.lib_index import LibIndex
 from .macros import macros, document  # noqa: F401
 from . import log
 
 logger = log.get_logger()
+# Colored resistors generated during this run: (source hash, bars, length) -> file name
+# Shared by all the 3D outputs
+COLORED_RESISTORS = {}
+# Hash for the source 3D models: file name -> (mtime, size, hash)
+MODELS_HASH = {}
+# Locks used to download each 3D model only once: destination -> Lock
+DOWNLOAD_LOCKS = {}
 # 3D models for resistors data
 
 # Tolerance bar:
@@ -143,6 +154,9 @@ class Base3DOptions(VariantOptions):
             self.kicad_3d_url_suffix = ''
             """ Text added to the end of the download URL.
                 Can be used to pass variables to the GET request, i.e. ?VAR1=VAL1&VAR2=VAL2 """
+            self.download_workers = 8
+            """ [1,64] Maximum number of 3D models downloaded at the same time.
+                Each model is downloaded only once, even when used by many footprints """
         # Temporal dir used to store the downloaded files
         self._tmp_dir = None
         super().__init__()
@@ -155,11 +169,19 @@ class Base3DOptions(VariantOptions):
         self.download_lcsc = ref.download_lcsc
         self.kicad_3d_url = ref.kicad_3d_url
         self.kicad_3d_url_suffix = ref.kicad_3d_url_suffix
+        self.download_workers = ref.download_workers
 
     def download_model(self, url, fname, rel_dirs):
         """ Download the 3D model from the provided URL """
         dest = os.path.join(self._tmp_dir, fname)
         os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Different names can point to the same model (i.e. KICAD6_3DMODEL_DIR and KICAD7_3DMODEL_DIR)
+        # Only one worker downloads it, the rest wait and then use the cached file
+        with DOWNLOAD_LOCKS.setdefault(dest, Lock()):
+            return self.download_model_locked(url, dest)
+
+    def download_model_locked(self, url, dest):
+        """ Download the 3D model, the caller holds the lock for `dest` """
         # Is already there?
         if os.path.isfile(dest):
             logger.debug('Using cached model `{}`'.format(dest))
@@ -173,8 +195,9 @@ class Base3DOptions(VariantOptions):
         if failed or r.status_code != 200:
             logger.warning(W_FAILDL+'Failed to download `{}`'.format(url))
             return None
-        with open(dest, 'wb') as f:
-            f.write(r.content)
+        # Write it atomically, other workers (or KiBot instances) could be using the same cache
+        tmp_name = GS.tmp_file(r.content, dir=os.path.dirname(dest), binary=True)
+        os.replace(tmp_name, dest)
         return dest
 
     def wrl_name(self, name, force_wrl):
@@ -249,9 +272,23 @@ class Base3DOptions(VariantOptions):
         name = os.path.splitext(os.path.basename(name))[0]
         return name.startswith('R_Axial_DIN')
 
-    def colored_tht_resistor_name(self, name, bars):
+    def model_hash(self, name):
+        """ SHA1 of a 3D model, computed only once unless the file changes """
+        st = os.stat(name)
+        cached = MODELS_HASH.get(name)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        h = sha1()
+        with open(name, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+        hash = h.hexdigest()
+        MODELS_HASH[name] = (st.st_mtime_ns, st.st_size, hash)
+        return hash
+
+    def colored_tht_resistor_name(self, name, bars, hash):
         name = os.path.splitext(os.path.basename(name))[0]
-        return os.path.join(self._tmp_dir, name+'_'+'_'.join(map(str, bars))+'.wrl')
+        return os.path.join(self._tmp_dir, name+'_'+hash[:10]+'_'+'_'.join(map(str, bars))+'.wrl')
 
     def add_tht_resistor_colors(self, file, colors):
         for bar, c in enumerate(colors):
@@ -309,8 +346,11 @@ class Base3DOptions(VariantOptions):
             prev_ln = None
             points = None
             axis = None
-            os.makedirs(os.path.dirname(name), exist_ok=True)
-            with open(name, "wt") as d:
+            dest_dir = os.path.dirname(name)
+            os.makedirs(dest_dir, exist_ok=True)
+            # Write to a temporal and then rename, the cache can be shared by concurrent runs
+            tmp_name = GS.tmp_file(dir=dest_dir, suffix='.wrl')
+            with open(tmp_name, "wt") as d:
                 colors_defined = False
                 for ln in f:
                     if not colors_defined and ln.startswith('Shape { geometry IndexedFaceSet'):
@@ -344,11 +384,14 @@ class Base3DOptions(VariantOptions):
                                                           'RES-BAR-%02d' % bar if st % 2 else 'RES-THT-01', index)
                         points = None
                     prev_ln = ln
+            os.replace(tmp_name, name)
         # Copy the STEP model (no colors)
         step_ori = os.path.splitext(ori)[0]+'.step'
         if os.path.isfile(step_ori):
             step_name = os.path.splitext(name)[0]+'.step'
-            copy2(step_ori, step_name)
+            tmp_name = GS.tmp_file(dir=dest_dir, suffix='.step')
+            copy2(step_ori, tmp_name)
+            os.replace(tmp_name, step_name)
         else:
             logger.warning(W_MISS3D+'Missing 3D model {}'.format(step_ori))
 
@@ -428,12 +471,20 @@ class Base3DOptions(VariantOptions):
             self.widths[-3] = self.widths[-1]+self.widths[-2]+self.widths[-3]
             self.widths = self.widths[:-2]
         # Create the name in the cache
-        cache_name = self.colored_tht_resistor_name(name, bars)
-        if os.path.isfile(cache_name) and GS.global_cache_3d_resistors:
-            status = 'cached'
+        hash = self.model_hash(name)
+        key = (hash, tuple(bars), r_len)
+        cache_name = COLORED_RESISTORS.get(key)
+        if cache_name is not None and os.path.isfile(cache_name):
+            # Already generated during this run, maybe by another output
+            status = 'reused'
         else:
-            status = 'created'
-            self.create_colored_tht_resistor(name, cache_name, bars, r_len)
+            cache_name = self.colored_tht_resistor_name(name, bars, hash)
+            if os.path.isfile(cache_name) and GS.global_cache_3d_resistors:
+                status = 'cached'
+            else:
+                status = 'created'
+                self.create_colored_tht_resistor(name, cache_name, bars, r_len)
+            COLORED_RESISTORS[key] = cache_name
         changed[0] = True
         # Show the result
         logger.debug('- {} {} {}% {} ({})'.format(c.ref, c.value, tol, bars, status))
@@ -448,6 +499,34 @@ class Base3DOptions(VariantOptions):
         m3d.m_Filename = new_name
         self.models_replaced = True
 
+    def fetch_model(self, model, full_name, comps, lcsc_field, rel_dirs, force_wrl):
+        """ Try to get a missing 3D model, from KiCad git or LCSC.
+            `comps` is the list of components using it, we try all the LCSC codes.
+            Runs in a worker thread, so it doesn't touch the board """
+        downloaded = set()
+        replace = self.try_download_kicad(model, full_name, downloaded, rel_dirs, force_wrl)
+        if replace is None and self.download_lcsc:
+            for sch_comp in comps:
+                replace = self.try_download_easyeda(model, full_name, downloaded, sch_comp, lcsc_field)
+                if replace:
+                    break
+        return replace
+
+    def fetch_models(self, missing, lcsc_field, rel_dirs, force_wrl):
+        """ Fetch the missing 3D models using a pool of workers.
+            `missing` is a dict full_name -> (model, [components]).
+            Returns a dict full_name -> local file (or None) """
+        if not missing:
+            return {}
+        workers = min(self.download_workers, len(missing))
+        logger.debug(f'Fetching {len(missing)} missing 3D models using {workers} workers')
+        if workers == 1:
+            return {k: self.fetch_model(v[0], k, v[1], lcsc_field, rel_dirs, force_wrl) for k, v in missing.items()}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {k: executor.submit(self.fetch_model, v[0], k, v[1], lcsc_field, rel_dirs, force_wrl)
+                       for k, v in missing.items()}
+            return {k: f.result() for k, f in futures.items()}
+
     def download_models(self, rename_filter=None, rename_function=None, rename_data=None, force_wrl=False, all_comps=None):
         """ Check we have the 3D models.
             Inform missing models.
@@ -456,8 +535,7 @@ class Base3DOptions(VariantOptions):
         self.models_replaced = False
         # Load KiCad configuration so we can expand the 3D models path
         KiConf.init(GS.pcb_file)
-        # List of models we already downloaded
-        downloaded = set()
+        LibIndex.update_env()
         # For the mode where we copy the 3D models
         self.source_models = set()
         is_copy_mode = rename_filter is not None
@@ -477,7 +555,12 @@ class Base3DOptions(VariantOptions):
                 self._tmp_dir = os.path.abspath(self._tmp_dir)
             rel_dirs.append(self._tmp_dir)
             logger.debug('Using `{}` as dir for downloaded 3D models'.format(self._tmp_dir))
-        # Look for all the footprints
+        # Solve the names for all the 3D models, collecting the missing ones
+        # Missing models: full_name -> (model, [components])
+        missing = {}
+        # The footprints and its models: (footprint, ref, models container, models, [(model, full name, used_extra,
+        #                                                                             component, found)])
+        footprints = []
         for m in GS.get_modules():
             ref = m.GetReference()
             lib_id = m.GetFPID()
@@ -488,6 +571,7 @@ class Base3DOptions(VariantOptions):
             models_l = []
             while not models.empty():
                 models_l.append(models.pop())
+            solved = []
             # Look for all the 3D models for this footprint
             for m3d in models_l:
                 if m3d.m_Filename.endswith(DISABLE_3D_MODEL_TEXT):
@@ -499,18 +583,31 @@ class Base3DOptions(VariantOptions):
                     # Skip filtered footprints
                     continue
                 used_extra = [False]
-                full_name = do_expand_env(m3d.m_Filename, used_extra, extra_debug, lib_nickname)
-                if not os.path.isfile(full_name):
+                full_name = LibIndex.solve_3d_model(m3d.m_Filename, lib_nickname, used_extra,
+                                                    lambda n, u: do_expand_env(n, u, extra_debug, lib_nickname))
+                found = os.path.isfile(full_name)
+                if not found:
                     logger.debugl(2, 'Missing 3D model file {} ({})'.format(full_name, m3d.m_Filename))
-                    # Missing 3D model
                     if self.download:
-                        replace = self.try_download_kicad(m3d.m_Filename, full_name, downloaded, rel_dirs, force_wrl)
-                        if replace is None and self.download_lcsc:
-                            replace = self.try_download_easyeda(m3d.m_Filename, full_name, downloaded, sch_comp, lcsc_field)
-                        if replace:
-                            replace = self.do_colored_tht_resistor(replace, sch_comp, used_extra)
-                            self.replace_model(replace, m3d, force_wrl, is_copy_mode, rename_function, rename_data)
-                    if full_name not in downloaded:
+                        comps = missing.setdefault(full_name, (m3d.m_Filename, []))[1]
+                        if sch_comp is not None:
+                            comps.append(sch_comp)
+                solved.append((m3d, full_name, used_extra, sch_comp, found))
+            footprints.append((m, ref, models, models_l, solved))
+        # Get the missing models, this is I/O bound, so we do it in parallel
+        fetched = self.fetch_models(missing, lcsc_field, rel_dirs, force_wrl)
+        # List of models we downloaded
+        downloaded = {k for k, v in fetched.items() if v}
+        # Now apply the changes
+        for m, ref, models, models_l, solved in footprints:
+            for m3d, full_name, used_extra, sch_comp, found in solved:
+                if not found:
+                    # Missing 3D model
+                    replace = fetched.get(full_name)
+                    if replace:
+                        replace = self.do_colored_tht_resistor(replace, sch_comp, used_extra)
+                        self.replace_model(replace, m3d, force_wrl, is_copy_mode, rename_function, rename_data)
+                    else:
                         logger.warning(W_MISS3D+'Missing 3D model for {}: `{}`'.format(ref, full_name))
                 else:  # File was found
                     replace = self.do_colored_tht_resistor(full_name, sch_comp, used_extra)
@@ -525,6 +622,7 @@ class Base3DOptions(VariantOptions):
                 models.append(model)
         if downloaded:
             logger.warning(W_DOWN3D+' {} 3D models downloaded or cached'.format(len(downloaded)))
+        LibIndex.report()
         return self.models_replaced if not is_copy_mode else list(self.source_models)
 
     def list_models(self, even_missing=False):
@@ -10,7 +10,10 @@ Dependencies:
     version: 3.4.0
   - from: ImageMagick
     role: Automatically crop images
+  - from: Pillow
+    role: Faster crop, no ImageMagick needed
 """
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 import re
@@ -18,6 +21,7 @@ from tempfile import NamedTemporaryFile, TemporaryDirectory
 from .error import KiPlotConfigurationError
 from .kiplot import get_output_targets, run_output, run_command, register_xmp_import, config_output, configure_and_run
 from .gs import GS
+from .image_ops import trim, process_images, needs_convert
 from .misc import BLENDER_ERROR, MISSING_TOOL
 from .optionable import Optionable, BaseOptions
 from .out_base_3d import Base3D, Base3DOptionsWithHL
@@ -361,6 +365,11 @@ class Blender_ExportOptions(BaseOptions):
             """ *[dict={}] Controls how the render is done for the `render` output type """
             self.point_of_view = BlenderPointOfViewOptions
             """ *[dict|list(dict)] How the object is viewed by the camera """
+            self.workers = 1
+            """ [0,64] Number of Blender instances used to render the points of view. The points of view are
+                split in consecutive groups, each instance imports the PCB3D file once and renders one group.
+                The CPU threads are distributed among the instances. Useful for animations (i.e. `steps`) using
+                the CPU for the render. Use 0 to use one instance for each CPU """
         super().__init__()
         self._expand_id = '3D_blender'
         self._unknown_is_error = True
@@ -551,7 +560,7 @@ class Blender_ExportOptions(BaseOptions):
         if self.render_options.auto_crop:
             # Avoid a gradient
             self.render_options.background2 = self.render_options.background1
-            convert_command = self.ensure_tool('ImageMagick')
+            convert_command = self.ensure_tool('ImageMagick') if needs_convert() else None
         # Create a JSON with the scene information
         with NamedTemporaryFile(mode='w', suffix='.json') as f:
             scene = {}
@@ -603,7 +612,14 @@ class Blender_ExportOptions(BaseOptions):
             f.flush()
             # Create the command line
             script = os.path.join(os.path.dirname(__file__), 'blender_scripts', 'blender_export.py')
-            cmd = [command, '-b', '--factory-startup', '-P', script, '--']
+            # Points of view for each Blender instance, consecutive groups
+            n_views = sum(pov.steps for pov in point_of_view)
+            workers = min(self.workers or os.cpu_count() or 1, n_views)
+            shards = [list(range(n*n_views//workers, (n+1)*n_views//workers)) for n in range(workers)]
+            cmd = [command, '-b']
+            if workers > 1:
+                cmd.extend(['--threads', str(max((os.cpu_count() or 1)//workers, 1))])
+            cmd.extend(['--factory-startup', '-P', script, '--'])
             pi = self.pcb_import
             if not pi.components:
                 cmd.append('--no_components')
@@ -623,38 +639,47 @@ class Blender_ExportOptions(BaseOptions):
                 cmd.append('--dont_stack_boards')
             if self.render_options.no_denoiser:
                 cmd.append('--no_denoiser')
-            cmd.append('--format')
-            for pov in point_of_view:
-                for _ in range(pov.steps):
-                    for o in outputs:
-                        cmd.append(o.type)
-            cmd.append('--output')
+            # The formats and names for each point of view
+            views = []
             names = set()
             order = 1
             for pov in point_of_view:
                 for _ in range(pov.steps):
+                    view = []
                     for o in outputs:
                         name = self.get_output_filename(o, self._parent.output_dir, pov, order)
                         if name in names:
                             raise KiPlotConfigurationError('Repeated name (use `file_id`): '+name)
-                        cmd.append(name)
+                        view.append((o.type, name))
                         names.add(name)
                         os.makedirs(os.path.dirname(name), exist_ok=True)
+                    views.append(view)
                     order += 1
-            cmd.extend(['--scene', f.name])
-            cmd.append(pcb3d_file)
-            # Execute the command
-            self.analyze_errors(run_command(cmd))
+            cmds = []
+            for shard in shards:
+                s_cmd = cmd.copy()
+                s_cmd.append('--format')
+                s_cmd.extend(t for n in shard for t, _ in views[n])
+                s_cmd.append('--output')
+                s_cmd.extend(name for n in shard for _, name in views[n])
+                if workers > 1:
+                    s_cmd.append('--views')
+                    s_cmd.extend(str(n) for n in shard)
+                s_cmd.extend(['--scene', f.name])
+                s_cmd.append(pcb3d_file)
+                cmds.append(s_cmd)
+            # Execute the command/s
+            if workers == 1:
+                self.analyze_errors(run_command(cmds[0]))
+            else:
+                logger.debug(f'Rendering {n_views} points of view using {workers} Blender instances')
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for res in list(executor.map(run_command, cmds)):
+                        self.analyze_errors(res)
         if self.render_options.auto_crop:
-            order = 1
-            for pov in point_of_view:
-                for _ in range(pov.steps):
-                    for o in outputs:
-                        if o.type != 'render':
-                            continue
-                        name = self.get_output_filename(o, self._parent.output_dir, pov, order)
-                        run_command([convert_command, name, '-trim', '+repage', '-trim', '+repage', name])
-                    order += 1
+            # Crop all the renders, in parallel
+            process_images(trim, [name for view in views for t, name in view if t == 'render'], convert_command,
+                           double=True)
 
 
 @output_class
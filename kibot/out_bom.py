@@ -21,7 +21,7 @@ Dependencies:
     downloader: python
 """
 import csv
-from copy import deepcopy
+from copy import copy, deepcopy
 import os
 import re
 from .gs import GS
@@ -264,6 +264,10 @@ class BoMHTML(BoMLinkable):
             self.style = 'modern-blue'
             """ Page style. Internal styles: modern-blue, modern-green, modern-red and classic.
                 Or you can provide a CSS file name. Please use .css as file extension. """
+            self.page_size = 0
+            """ [0,1000000] Rows per page for the component tables. Bigger tables are shown in pages, using a small
+                JavaScript loader, so the browser only renders the rows of the current page.
+                Use 0 to show all the rows. Useful for very big BoMs """
 
     def config(self, parent):
         super().config(parent)
@@ -338,6 +342,10 @@ class BoMXLSX(BoMLinkable):
         with document:
             self.max_col_width = 60
             """ [20,999] Maximum column width (characters) """
+            self.constant_memory = False
+            """ Write each row as soon as it's generated, instead of keeping the whole spreadsheet in memory.
+                Useful for very big BoMs, i.e. aggregating many projects.
+                Not used when `kicost` is enabled, KiCost needs to access the cells in arbitrary order """
             self.style = 'modern-blue'
             """ Head style: modern-blue, modern-green, modern-red and classic """
             self.kicost = False
@@ -467,6 +475,17 @@ class BoMOptions(BaseOptions):
                 compatibility with KiBoM. Note that this output has default filters that behaves like KiBoM.
                 The combination between the default for this option and the defaults for the filters provides
                 a behavior that mimics KiBoM default behavior """
+            self.variants = Optionable
+            """ [string|list(string)=[]] {comma_sep} List of variants to generate in one run.
+                The components are loaded and filtered once, then each variant is applied to them.
+                When used the `variant` option is only used for the %v and %V expansions of the `columns` mode.
+                See `variants_mode` """
+            self.variants_mode = 'separated'
+            """ [separated,columns] How the BoM for the `variants` is generated.
+                *separated* creates one file for each variant, use %v or %V in `output` to get different names.
+                *columns* creates one file, the groups are computed once using the components fitted in any of the
+                variants. A column with the quantity per PCB is added for each variant.
+                The *columns* mode doesn't support variants that transform the fields (`pre_transform`) """
             self.output = GS.def_global_output
             """ *filename for the output (%i=bom)"""
             self.format = 'Auto'
@@ -715,14 +734,23 @@ class BoMOptions(BaseOptions):
         self.exclude_filter = BaseFilter.solve_filter(self.exclude_filter, 'exclude_filter')
         self.dnf_filter = BaseFilter.solve_filter(KiBoM.fix_dnx_filter(self.dnf_filter, self.fit_field), 'dnf_filter')
         self.dnc_filter = BaseFilter.solve_filter(KiBoM.fix_dnx_filter(self.dnc_filter, self.fit_field), 'dnc_filter')
+        # Variants generated in one run
+        self._variants = [RegOutput.check_variant(v) for v in self.variants]
+        self._variants_qty = []
+        if self.variants_mode == 'columns':
+            for v in self._variants:
+                if v.pre_transform is not None:
+                    raise KiPlotConfigurationError(f'The `{v.name}` variant transforms the fields, this isn\'t '
+                                                   'supported by the `columns` mode')
         # Fields excluded from conflict warnings
         if isinstance(self.no_conflict, type):
             no_conflict = set()
             no_conflict.add(self.fit_field)
             no_conflict.add('part')
-            var_field = self.variant.get_variant_field() if self.variant else None
-            if var_field is not None:
-                no_conflict.add(var_field.lower())
+            for var in [self.variant]+self._variants:
+                var_field = var.get_variant_field() if var else None
+                if var_field is not None:
+                    no_conflict.add(var_field.lower())
         else:
             no_conflict = set(self.no_conflict)
         self._no_conflict = no_conflict
@@ -887,20 +915,9 @@ class BoMOptions(BaseOptions):
             self.xlsx.logo = png
         return png
 
-    def run(self, output):
-        format = self._format
-        if format == 'xlsx':
-            if self.xlsx.kicost:
-                self.ensure_tool('KiCost')
-            self.ensure_tool('XLSXWriter')
-        # Add some info needed for the output to the config object.
-        # So all the configuration is contained in one object.
-        self.source = GS.sch_basename
-        self.date = GS.sch_date
-        self.revision = GS.sch_rev
-        self.debug_level = GS.debug_level
-        self.kicad_version = GS.kicad_version
-        self.conv_units = GS.unit_name_to_scale_factor(self.units)
+    def load_components(self):
+        """ Components from the schematic, and the aggregated projects, with the filters applied.
+            The variant isn't applied """
         # Get the components list from the schematic
         # We use a copy because we could expand the field values using ${VAR}
         comps = expand_fields(GS.sch.get_components())
@@ -928,14 +945,18 @@ class BoMOptions(BaseOptions):
         apply_exclude_filter(comps, self.exclude_filter)
         apply_fitted_filter(comps, self.dnf_filter)
         apply_fixed_filter(comps, self.dnc_filter)
-        # Apply the variant
-        if self.variant:
-            comps = self.variant.filter(comps)
-        # Now expand the text variables, the user can disable it and insert a customized filter
-        # in the variant or even before.
+        return comps
+
+    def expand_text_vars_filter(self, comps):
+        """ Now expand the text variables, the user can disable it and insert a customized filter
+            in the variant or even before. """
         if self.expand_text_vars:
             comps = apply_pre_transform(comps, BaseFilter.solve_filter('_expand_text_vars', 'KiCad 6 text vars',
                                                                        is_transform=True))
+        return comps
+
+    def generate(self, output, format, comps):
+        """ Groups the components and writes the BoM """
         # We will manipulate the aggregate list, so we use a copy
         real_aggregate = self.aggregate
         self.aggregate = real_aggregate.copy()
@@ -963,14 +984,146 @@ class BoMOptions(BaseOptions):
                     self.html.logo = self._old_logo
                 elif self._format == 'xlsx':
                     self.xlsx.logo = self._old_logo
-        # Undo the reference prefix
+
+    @staticmethod
+    def get_states(comps):
+        return [(c.included, c.fitted, c.fixed) for c in comps]
+
+    @staticmethod
+    def set_states(comps, states):
+        for c, (included, fitted, fixed) in zip(comps, states):
+            c.included = included
+            c.fitted = fitted
+            c.fixed = fixed
+
+    def solve_variants(self, comps):
+        """ Applies each variant to the shared list of components.
+            Returns a list with the state (included, fitted, fixed) of the components for each variant.
+            Variants that transform the fields need its own list of components, in this case we return None """
+        base = self.get_states(comps)
+        states = []
+        for var in self._variants:
+            if var.pre_transform is None:
+                var.filter(comps)
+                states.append(self.get_states(comps))
+                self.set_states(comps, base)
+            else:
+                states.append(None)
+        return states
+
+    def undo_ref_prefix(self, comps):
         if self.ref_id:
             l_id = len(self.ref_id)
             for c in filter(lambda c: c.project == GS.sch_basename, comps):
                 c.ref = c.ref[l_id:]
                 c.ref_id = ''
 
+    def run_separated(self, format, comps, states):
+        """ One file for each variant.
+            Returns the last list of components """
+        targets = self.get_variants_targets(self._parent.output_dir)
+        todo = list(zip(self._variants, targets, states))
+        # First the variants using the shared components
+        for var, output, var_states in todo:
+            if var_states is not None:
+                logger.debug(f'Generating the BoM for the `{var.name}` variant')
+                self.variant = var
+                self.set_states(comps, var_states)
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+                self.generate(output, format, comps)
+        # Now the variants that change the fields, we must load the components again
+        for var, output, var_states in todo:
+            if var_states is None:
+                logger.debug(f'Generating the BoM for the `{var.name}` variant (transforms the fields)')
+                self.variant = var
+                self.undo_ref_prefix(comps)
+                comps = self.expand_text_vars_filter(var.filter(self.load_components()))
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+                self.generate(output, format, comps)
+        return comps
+
+    def run_columns(self, output, format, comps, states):
+        """ One file, with a quantity column for each variant """
+        # The groups are created using the components used by any of the variants
+        columns = []
+        for c, c_states in zip(comps, zip(*states)):
+            c.included = any(s[0] for s in c_states)
+            c.fitted = any(s[0] and s[1] for s in c_states)
+            c.fixed = any(s[0] and s[2] for s in c_states)
+        for var, var_states in zip(self._variants, states):
+            fitted = {id(c) for c, s in zip(comps, var_states) if s[0] and s[1]}
+            columns.append((ColumnList.COL_GRP_QUANTITY+' '+var.name, fitted))
+        self._variants_qty = columns
+        self._columns += [c[0] for c in columns]
+        self._column_levels += [0]*len(columns)
+        self._column_comments += ['']*len(columns)
+        # Shown as the variant name
+        self.variant = copy(self._variants[0])
+        self.variant.name = ', '.join(v.name for v in self._variants)
+        try:
+            self.generate(output, format, comps)
+        finally:
+            n = len(columns)
+            del self._columns[-n:]
+            del self._column_levels[-n:]
+            del self._column_comments[-n:]
+            self._variants_qty = []
+
+    def run(self, output):
+        format = self._format
+        if format == 'xlsx':
+            if self.xlsx.kicost:
+                self.ensure_tool('KiCost')
+            self.ensure_tool('XLSXWriter')
+        # Add some info needed for the output to the config object.
+        # So all the configuration is contained in one object.
+        self.source = GS.sch_basename
+        self.date = GS.sch_date
+        self.revision = GS.sch_rev
+        self.debug_level = GS.debug_level
+        self.kicad_version = GS.kicad_version
+        self.conv_units = GS.unit_name_to_scale_factor(self.units)
+        comps = self.load_components()
+        if self._variants:
+            # Apply the variants to the same components, the text variables are expanded once
+            states = self.solve_variants(comps)
+            comps = self.expand_text_vars_filter(comps)
+            variant = self.variant
+            try:
+                if self.variants_mode == 'columns':
+                    self.run_columns(output, format, comps, states)
+                else:
+                    comps = self.run_separated(format, comps, states)
+            finally:
+                self.variant = variant
+        else:
+            # Apply the variant
+            if self.variant:
+                comps = self.variant.filter(comps)
+            comps = self.expand_text_vars_filter(comps)
+            self.generate(output, format, comps)
+        # Undo the reference prefix
+        self.undo_ref_prefix(comps)
+
+    def get_variants_targets(self, out_dir):
+        """ Names for the `separated` mode """
+        variant = self.variant
+        targets = []
+        try:
+            for var in self._variants:
+                self.variant = var
+                target = self._parent.expand_filename(out_dir, self.output)
+                if target in targets:
+                    raise KiPlotConfigurationError(f'The `{var.name}` variant uses the same file name than other variant '
+                                                   f'(`{target}`), use %v or %V in `output`')
+                targets.append(target)
+        finally:
+            self.variant = variant
+        return targets
+
     def get_targets(self, out_dir):
+        if self._variants and self.variants_mode == 'separated':
+            return self.get_variants_targets(out_dir)
         return [self._parent.expand_filename(out_dir, self.output)]
 
 
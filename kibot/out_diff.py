@@ -19,7 +19,7 @@ Dependencies:
     role: Compare schematics
     version: 2.2.0
 """
-from hashlib import sha1
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations
 import os
 import re
@@ -27,11 +27,12 @@ from shutil import rmtree, copy2
 from subprocess import CalledProcessError
 from .error import KiPlotConfigurationError
 from .gs import GS
-from .kiplot import load_any_sch, run_command, config_output, get_output_dir, run_output
+from .kiplot import run_command, config_output, get_output_dir, run_output
 from .layer import Layer
 from .misc import DIFF_TOO_BIG, FAILED_EXECUTE
 from .registrable import RegOutput
 from .out_any_diff import AnyDiffOptions
+from .render_cache import RenderCache, MISSING
 from .macros import macros, document, output_class  # noqa: F401
 from . import log
 
@@ -112,6 +113,9 @@ class DiffOptions(AnyDiffOptions):
             """ Color used for the added stuff in the '2color' mode """
             self.color_removed = '#FF0000'
             """ Color used for the removed stuff in the '2color' mode """
+            self.workers = 0
+            """ [0,64] Number of comparisons done at the same time when using `multivar`.
+                Use 0 to use the number of CPUs """
         super().__init__()
         self.add_to_doc("zones", "Be careful with the cache when changing this setting")
 
@@ -132,18 +136,6 @@ class DiffOptions(AnyDiffOptions):
     def get_targets(self, out_dir):
         return [self._parent.expand_filename(out_dir, self.output)]
 
-    def get_digest(self, file_path, restart=True):
-        logger.debug('Hashing '+file_path)
-        if restart:
-            self.h = sha1()
-        with open(file_path, 'rb') as file:
-            while True:
-                chunk = file.read(self.h.block_size)
-                if not chunk:
-                    break
-                self.h.update(chunk)
-        return self.h.hexdigest()
-
     def cache_pcb(self, name, force_exist):
         if name:
             if not os.path.isfile(name) and not force_exist:
@@ -156,7 +148,7 @@ class DiffOptions(AnyDiffOptions):
                 raise KiPlotConfigurationError('Missing file to compare: `{}`'.format(name))
             name, to_remove = self.write_empty_file(name, create_tmp=True)
             self._to_remove.extend(to_remove)
-        hash = self.get_digest(name)
+        hash = self.content_hash(pcb=name)
         self.add_to_cache(name, hash)
         return hash
 
@@ -173,13 +165,7 @@ class DiffOptions(AnyDiffOptions):
             name, to_remove = self.write_empty_file(name, create_tmp=True)
             self._to_remove.extend(to_remove)
         # Schematics can have sub-sheets
-        sch = load_any_sch(name, os.path.splitext(os.path.basename(name))[0])
-        files = sch.get_files()
-        hash = self.get_digest(files[0])
-        if len(files) > 1:
-            for f in files[1:]:
-                hash = self.get_digest(f, restart=False)
-        hash = 'sch'+hash
+        hash = 'sch'+self.content_hash(sch=name)
         self.add_to_cache(name, hash)
         return hash
 
@@ -308,6 +294,34 @@ class DiffOptions(AnyDiffOptions):
                     name += '-dirty'
         return '{}({})'.format(self.run_git(['rev-parse', '--short', 'HEAD'], cwd=cwd), name)
 
+    def get_git_rev_desc(self, user_name, rev):
+        """ Same as get_git_point_desc for a detached checkout of `rev`, but without the checkout """
+        name = None
+        for ops in (['describe', '--exact-match', '--tags'], ['describe', '--tags']):
+            try:
+                name = self.run_git(ops+[rev], just_raise=True)
+                break
+            except CalledProcessError:
+                logger.debug("Can't find a tag name")
+        return '{}({})'.format(self.run_git(['rev-parse', '--short', rev]), name or user_name)
+
+    def cache_git_rendered(self, name_ori, rev):
+        """ Checks if the file at the `rev` point is already rendered, so we don't need a checkout """
+        if not RenderCache.enabled():
+            return None
+        fname = os.path.basename(self.file)
+        if self.pcb:
+            hash = self.git_content_hash(rev, pcb=fname)
+        else:
+            hash = 'sch'+self.git_content_hash(rev, sch=fname)
+        pro = self.git_blob_id(rev, self.pro_name(fname))
+        if MISSING in hash or not RenderCache.has(self.render_key(hash, pro)):
+            return None
+        logger.debug(f'- {rev} already rendered, no checkout needed')
+        self.add_to_cache(self.file, hash, pro)
+        self.git_hash = self.get_git_rev_desc(name_ori, rev)
+        return hash
+
     def cache_git_use_stash(self, name):
         self.stashed = False
         self.checkedout = False
@@ -369,6 +383,9 @@ class DiffOptions(AnyDiffOptions):
             # Checkout the target
             name_ori = name
             name = self.solve_git_name(name)
+            hash = self.cache_git_rendered(name_ori, name)
+            if hash is not None:
+                return hash
             git_tmp_wd = GS.mkdtemp('diff-checkout')
             logger.debug('Checking out '+name+' to '+git_tmp_wd)
             self.run_git(['worktree', 'add', '--detach', '--force', git_tmp_wd, name])
@@ -449,16 +466,52 @@ class DiffOptions(AnyDiffOptions):
     def create_layers_incl(self, layers):
         return self.save_layers_incl(Layer.solve(layers)) if self.pcb else None
 
+    def cache_obj_once(self, name, type):
+        """ Populates the cache for an object only once.
+            Returns the hash, the name for the link and the file used for the cache """
+        key = (name, type)
+        res = self._cached_objs.get(key)
+        if res is None:
+            hash = self.cache_obj(name, type)
+            res = self._cached_objs[key] = (hash, self.git_hash, self.name_used_for_cache)
+        return res
+
     def do_compare(self, old, old_type, new, new_type, name, name_ori):
+        # Populate the cache
+        old_data = self.cache_obj_once(old, old_type)
+        new_data = self.cache_obj_once(new, new_type)
+        self.run_compare(old_data, new_data, name, name_ori)
+
+    def do_compare_list(self, comparisons, name_ori):
+        """ Compares a list of (old, old_type, new, new_type, name, description).
+            The caches are populated in order, only once for each object, then the comparisons are done in parallel """
+        jobs = [(self.cache_obj_once(c[0], c[1]), self.cache_obj_once(c[2], c[3]), c[4], c[5]) for c in comparisons]
+        workers = min(self.workers or os.cpu_count() or 1, len(jobs))
+        logger.debug(f'Doing {len(jobs)} comparisons using {workers} workers')
+        if workers <= 1:
+            for old_data, new_data, name, desc in jobs:
+                logger.info(desc)
+                self.run_compare(old_data, new_data, name, name_ori)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for old_data, new_data, name, desc in jobs:
+                logger.info(desc)
+                futures.append(executor.submit(self.run_compare, old_data, new_data, name, name_ori))
+            try:
+                for f in futures:
+                    f.result()
+            except BaseException:
+                for f in futures:
+                    f.cancel()
+                raise
+
+    def run_compare(self, old_data, new_data, name, name_ori):
+        """ Runs KiDiff using the cached data """
         dir_name = os.path.dirname(name)
         file_name = os.path.basename(name)
-        # Populate the cache
-        old_hash = self.cache_obj(old, old_type)
-        gh1 = self.git_hash
-        name_used_for_old = self.name_used_for_cache
-        new_hash = self.cache_obj(new, new_type)
-        gh2 = self.git_hash
-        name_used_for_new = self.name_used_for_cache
+        old_hash, gh1, name_used_for_old = old_data
+        new_hash, gh2, name_used_for_new = new_data
         # Compute the diff using the cache
         cmd = [self.command, '--no_reader', '--new_file_hash', new_hash, '--old_file_hash', old_hash,
                '--cache_dir', self.cache_dir, '--output_dir', dir_name, '--output_name', file_name,
@@ -496,7 +549,8 @@ class DiffOptions(AnyDiffOptions):
                 os.symlink(os.path.basename(name), target)
 
     def run(self, name):
-        self.command = self.ensure_tool('KiDiff')
+        self.command, self._kidiff_version = self.ensure_tool_get_ver('KiDiff')
+        self._cached_objs = {}
         self._to_remove = []
         self._worktrees_to_remove = []
         if self.old_type == 'git' or self.new_type == 'git':
@@ -517,23 +571,26 @@ class DiffOptions(AnyDiffOptions):
             if self.new_type == 'multivar' and self.old_type != 'multivar':
                 # Special case, we generate various files
                 base_id = self._expand_id
+                comparisons = []
                 for pair in combinations(self.new, 2):
                     logger.debug('Using variants '+str(pair))
-                    logger.info(' - {} vs {}'.format(pair[0], pair[1]))
                     self._expand_id = '{}_variants_{}_VS_{}'.format(base_id, pair[0], pair[1])
                     name = self._parent.expand_filename(self._parent.output_dir, self.output)
-                    self.do_compare(pair[0], 'output', pair[1], 'output', name, name_ori)
+                    comparisons.append((pair[0], 'output', pair[1], 'output', name, ' - {} vs {}'.format(pair[0], pair[1])))
                 self._expand_id = base_id
+                self.do_compare_list(comparisons, name_ori)
             elif self.new_type == 'multivar' and self.old_type == 'multivar':
                 # Special case, we generate various files
                 base_id = self._expand_id
+                comparisons = []
+                ref_name = self.old if self.old else 'current'
                 for new_variant in self.new:
-                    ref_name = self.old if self.old else 'current'
-                    logger.info(' - {} vs {}'.format(ref_name, new_variant))
                     self._expand_id = '{}_variant_{}'.format(base_id, new_variant)
                     name = self._parent.expand_filename(self._parent.output_dir, self.output)
-                    self.do_compare(self.old, 'file', new_variant, 'output', name, name_ori)
+                    comparisons.append((self.old, 'file', new_variant, 'output', name,
+                                        ' - {} vs {}'.format(ref_name, new_variant)))
                 self._expand_id = base_id
+                self.do_compare_list(comparisons, name_ori)
             else:
                 self.do_compare(self.old, self.old_type, self.new, self.new_type, name, name_ori)
         finally:
@@ -547,6 +604,7 @@ class DiffOptions(AnyDiffOptions):
             # Remove any git worktree that we created
             for w in self._worktrees_to_remove:
                 self.remove_git_worktree(w)
+            RenderCache.evict()
 
 
 @output_class
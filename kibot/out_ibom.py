@@ -183,12 +183,8 @@ class IBoMOptions(VariantOptions):
             # Write a custom netlist to a temporal dir
             prj_name = os.path.basename(self.expand_filename('', self.forced_name, 'ibom', '')) if self.forced_name \
                        else GS.pcb_basename
+            self.extra_data_file = self.get_netlist(prj_name)
             net_dir = GS.mkdtemp('ibom')
-            netlist = os.path.join(net_dir, prj_name+'.xml')
-            self.extra_data_file = netlist
-            logger.debug('Creating variant netlist `{}`'.format(netlist))
-            with open(netlist, 'wb') as f:
-                GS.sch.save_netlist(f, self._comps)
             # Write a board with the filtered values applied
             self.filter_pcb_components()
             pcb_name, _ = self.save_tmp_dir_board('ibom', force_dir=net_dir, forced_name=prj_name)
@@ -238,7 +234,7 @@ class IBoMOptions(VariantOptions):
                                 "Update Interactive HTML BoM your version doesn't support KiCad 6 files")])
         finally:
             if net_dir:
-                logger.debug('Removing temporal variant dir `{}`'.format(net_dir))
+                logger.debug('Removing temporal board dir `{}`'.format(net_dir))
                 rmtree(net_dir)
             # Restore the real name selected
             self.extra_data_file = ori_extra_data_file
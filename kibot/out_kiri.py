@@ -19,6 +19,7 @@ Dependencies:
     role: Compare schematics
     version: 2.2.0
 """
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
 import glob
 try:
@@ -27,8 +28,9 @@ try:
 except Exception:
     pass
 import os
-from shutil import copy2, rmtree
+from shutil import copy2, copytree, rmtree
 from subprocess import CalledProcessError
+from threading import Lock
 from .error import KiPlotConfigurationError
 from .gs import GS
 from .kicad.color_theme import load_color_theme
@@ -36,6 +38,7 @@ from .kiplot import load_any_sch, run_command
 from .layer import Layer
 from .misc import W_NOTHCMP
 from .out_any_diff import AnyDiffOptions
+from .render_cache import RenderCache, file_blob_id
 from .macros import macros, document, output_class  # noqa: F401
 from . import log
 
@@ -72,6 +75,9 @@ class KiRiOptions(AnyDiffOptions):
                 Note that this can be a revision-range, consult the gitrevisions manual for more information """
             self.keep_generated = False
             """ *Avoid PCB and SCH images regeneration. Useful for incremental usage """
+            self.workers = 0
+            """ [0,64] Number of commits rendered at the same time. Each one uses its own git worktree.
+                Use 0 to use the number of CPUs """
         super().__init__()
         self.add_to_doc("zones", "Be careful with the *keep_generated* option when changing this setting")
         self._kiri_mode = True
@@ -246,7 +252,7 @@ class KiRiOptions(AnyDiffOptions):
 
     def init_tools(self, out_dir):
         self.cache_dir = out_dir
-        self.command = self.ensure_tool('KiDiff')
+        self.command, self._kidiff_version = self.ensure_tool_get_ver('KiDiff')
         self.git_command = self.ensure_tool('Git')
         # Only needed for schematic
         self.ensure_tool('KiAuto')
@@ -272,6 +278,96 @@ class KiRiOptions(AnyDiffOptions):
         pcb_dirty = self.git_dirty(GS.pcb_file)
         return hashes, sch_dirty, pcb_dirty, sch_files
 
+    def render_key(self, hash):
+        """ Key for the content addressed cache. Computed from the files content, not the commit """
+        if not RenderCache.enabled():
+            return None
+        pcb = os.path.relpath(GS.pcb_file, self.repo_dir)
+        sch = os.path.basename(GS.sch_file)
+        pro = os.path.relpath(GS.pro_file, self.repo_dir) if GS.pro_file else None
+        if hash == HASH_LOCAL:
+            content = self.content_hash(pcb=GS.pcb_file, sch=GS.sch_file)
+            pro = file_blob_id(GS.pro_file) if pro else None
+        else:
+            content = self.git_content_hash(hash, pcb=pcb, sch=sch)
+            pro = self.git_blob_id(hash, pro) if pro else None
+        return super().render_key(RenderCache.make_key(content, pro, GS.sch_basename))
+
+    def render_commit(self, hash):
+        """ Generates the SVGs for one commit, using a temporal worktree """
+        git_tmp_wd = GS.mkdtemp('kiri-checkout')
+        try:
+            # Git operations on the same repo and the schematic loader aren't thread safe
+            with self._lock:
+                logger.debug('Checking out '+hash+' to '+git_tmp_wd)
+                self.run_git(['worktree', 'add', '--detach', '--force', git_tmp_wd, hash])
+                self.run_git(['submodule', 'update', '--init', '--recursive'], cwd=git_tmp_wd)
+            # Generate SVGs for the schematic
+            name_sch = self.do_cache(self.sch_rel_name, git_tmp_wd, hash)
+            # Generate SVGs for the PCB
+            self.do_cache(self.pcb_rel_name, git_tmp_wd, hash)
+            with self._lock:
+                # List of layers
+                self.save_pcb_layers(hash)
+                # Schematic hierarchy
+                self.save_sch_sheet(hash, name_sch)
+        finally:
+            with self._lock:
+                self.remove_git_worktree(git_tmp_wd)
+
+    def render_commits(self, hashes):
+        """ Generates the SVGs for the commits, using a pool of workers """
+        to_render = []
+        for hash in hashes:
+            dst_dir = os.path.join(self.cache_dir, hash[:7])
+            already_generated = os.path.isdir(dst_dir)
+            if self.keep_generated and already_generated:
+                logger.debug(f'- Images for {hash} already generated')
+                continue
+            if already_generated:
+                rmtree(dst_dir)
+            to_render.append(hash)
+        # Commits with the same files content are rendered only once, and only if they aren't in the cache
+        groups = {}
+        for hash in to_render:
+            key = self.render_key(hash)
+            if key and RenderCache.fetch(key, os.path.join(self.cache_dir, hash[:7])):
+                logger.debug(f'- Images for {hash} found in the cache')
+                continue
+            groups.setdefault(key or hash, []).append(hash)
+        total = len(groups)
+        if not total:
+            return
+        workers = min(self.workers or os.cpu_count() or 1, total)
+        logger.debug(f'Rendering {total} commits using {workers} workers')
+        self._lock = Lock()
+        if workers == 1:
+            for n, (key, hashes) in enumerate(groups.items()):
+                self.render_group(key, hashes)
+                logger.info(f' - [{n+1}/{total}] {hashes[0][:7]}')
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.render_group, key, hashes): hashes[0] for key, hashes in groups.items()}
+            try:
+                for n, f in enumerate(as_completed(futures)):
+                    f.result()
+                    logger.info(f' - [{n+1}/{total}] {futures[f][:7]}')
+            except BaseException:
+                # Don't start new renders, the running ones will finish
+                for f in futures:
+                    f.cancel()
+                raise
+
+    def render_group(self, key, hashes):
+        """ Renders the first commit and copies the result for the rest, they have the same content """
+        self.render_commit(hashes[0])
+        src = os.path.join(self.cache_dir, hashes[0][:7])
+        if key != hashes[0]:
+            RenderCache.store(key, src)
+        for hash in hashes[1:]:
+            logger.debug(f'- Images for {hash} are the same used for {hashes[0]}')
+            copytree(src, os.path.join(self.cache_dir, hash[:7]), symlinks=True)
+
     def run(self, name):
         self.init_tools(self._parent.output_dir)
         hashes, sch_dirty, pcb_dirty, sch_files = self.collect_hashes()
@@ -284,34 +380,7 @@ class KiRiOptions(AnyDiffOptions):
         self.create_layers_incl(self.layers)
         self.solve_layer_colors()
         try:
-            git_tmp_wd = None
-            try:
-                for h in hashes:
-                    hash = h[0]
-                    dst_dir = os.path.join(self.cache_dir, hash[:7])
-                    already_generated = os.path.isdir(dst_dir)
-                    if self.keep_generated and already_generated:
-                        logger.debug(f'- Images for {hash} already generated')
-                        continue
-                    if already_generated:
-                        rmtree(dst_dir)
-                    git_tmp_wd = GS.mkdtemp('kiri-checkout')
-                    logger.debug('Checking out '+hash+' to '+git_tmp_wd)
-                    self.run_git(['worktree', 'add', '--detach', '--force', git_tmp_wd, hash])
-                    self.run_git(['submodule', 'update', '--init', '--recursive'], cwd=git_tmp_wd)
-                    # Generate SVGs for the schematic
-                    name_sch = self.do_cache(self.sch_rel_name, git_tmp_wd, hash)
-                    # Generate SVGs for the PCB
-                    self.do_cache(self.pcb_rel_name, git_tmp_wd, hash)
-                    # List of layers
-                    self.save_pcb_layers(hash)
-                    # Schematic hierarchy
-                    self.save_sch_sheet(hash, name_sch)
-                    self.remove_git_worktree(git_tmp_wd)
-                    git_tmp_wd = None
-            finally:
-                if git_tmp_wd:
-                    self.remove_git_worktree(git_tmp_wd)
+            self.render_commits([h[0] for h in hashes])
             # Do we have modifications?
             if sch_dirty or pcb_dirty:
                 # Include the current files
@@ -322,10 +391,14 @@ class KiRiOptions(AnyDiffOptions):
                 else:
                     if already_generated:
                         rmtree(dst_dir)
-                    name_sch = self.do_cache(GS.sch_file, GS.sch_dir, HASH_LOCAL)
-                    self.save_sch_sheet(HASH_LOCAL, name_sch)
-                    self.do_cache(GS.pcb_file, GS.pcb_dir, HASH_LOCAL)
-                    self.save_pcb_layers(HASH_LOCAL)
+                    key = self.render_key(HASH_LOCAL)
+                    if not key or not RenderCache.fetch(key, dst_dir):
+                        name_sch = self.do_cache(GS.sch_file, GS.sch_dir, HASH_LOCAL)
+                        self.save_sch_sheet(HASH_LOCAL, name_sch)
+                        self.do_cache(GS.pcb_file, GS.pcb_dir, HASH_LOCAL)
+                        self.save_pcb_layers(HASH_LOCAL)
+                        if key:
+                            RenderCache.store(key, dst_dir)
                 hashes.insert(0, (HASH_LOCAL, datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S'), get_cur_user(),
                               'Local changes not committed'))
                 if pcb_dirty:
@@ -335,6 +408,7 @@ class KiRiOptions(AnyDiffOptions):
         finally:
             if self.incl_file:
                 os.remove(self.incl_file)
+        RenderCache.evict()
         self.create_kiri_files()
         self.save_commits(hashes)
         self.save_project_data()
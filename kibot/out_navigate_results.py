@@ -17,24 +17,33 @@ Dependencies:
     role: Create outputs preview
   - from: ImageMagick
     role: Create outputs preview
+  - from: Pillow
+    role: Faster outputs preview (PNG, JPG and SVG)
   - from: Git
     role: Find origin url
 """
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from hashlib import sha1
+from io import StringIO
 import os
 import subprocess
 import pprint
 from shutil import copy2
 from math import ceil
 from struct import unpack
+from threading import Lock
 from .bom.kibot_logo import KIBOT_LOGO, KIBOT_LOGO_W, KIBOT_LOGO_H
 from .error import KiPlotConfigurationError
 from .gs import GS
+from .image_ops import compose_icon, needs_convert, backend
 from .optionable import Optionable, BaseOptions
 from .kiplot import config_output, get_output_dir, run_command
 from .misc import W_NOTYET, W_MISSTOOL, W_NOOUTPUTS, read_png, force_list
 from .pre_base import BasePreFlight
 from .registrable import RegOutput
+from .render_cache import file_blob_id
 from .macros import macros, document, output_class  # noqa: F401
 from . import log, __version__
 
@@ -115,6 +124,8 @@ IMAGEABLES_SIMPLE = {'png', 'jpg'}
 IMAGEABLES_GS = {'pdf', 'eps', 'ps'}
 IMAGEABLES_SVG = {'svg'}
 TITLE_HEIGHT = 30
+# Maximum number of converted images we keep between runs
+MAX_CACHED_IMAGES = 4096
 STYLE = """
 .cat-table { margin-left: auto; margin-right: auto; }
 .cat-table td { padding: 20px 24px; }
@@ -255,14 +266,114 @@ def _run_command(cmd):
 
 
 def get_png_size(file):
-    with open(file, 'rb') as f:
-        s = f.read()
+    try:
+        with open(file, 'rb') as f:
+            s = f.read(24)
+    except OSError:
+        return 0, 0
     if not (s[:8] == b'\x89PNG\r\n\x1a\n' and (s[12:16] == b'IHDR')):
         return 0, 0
     w, h = unpack('>LL', s[16:24])
     return int(w), int(h)
 
 
+def get_images_cache_dir():
+    root = os.environ.get('KIBOT_NAVIGATE_CACHE')
+    if root is None:
+        root = os.path.join(os.path.expanduser('~'), '.cache', 'kibot', 'navigate')
+    return os.path.abspath(root)
+
+
+class ConversionPool(object):
+    """ Image conversions for the navigation pages.
+        While `collecting` the conversions are just registered and reported as successful.
+        Then `run` does them concurrently and the results are used for the next requests.
+        Repeated conversions are done once, and the results are cached between runs, using the content of the
+        sources, the parameters and the converters as key """
+    def __init__(self, workers, use_cache):
+        self.collecting = True
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_dir = get_images_cache_dir() if use_cache else None
+        # Destination -> (phase, key, sources, function, arguments)
+        self.jobs = {}
+        # Destination -> result
+        self.results = {}
+        self.hits = 0
+        self.lock = Lock()
+
+    def request(self, dst, phase, key, sources, func, *args):
+        """ Creates `dst` using `func(*args)`.
+            The `phase` is used to solve dependencies, `key` describes the conversion and `sources` are the files used """
+        if self.collecting:
+            if dst not in self.jobs:
+                self.jobs[dst] = (phase, key, sources, func, args)
+            return True
+        res = self.results.get(dst)
+        if res is None:
+            # Not collected, just do it
+            res = self.results[dst] = self.do_job(dst, key, sources, func, args)
+        return res
+
+    def do_job(self, dst, key, sources, func, args):
+        cached = None
+        if self.cache_dir is not None:
+            key = sha1(repr((key, [file_blob_id(f) for f in sources])).encode()).hexdigest()
+            cached = os.path.join(self.cache_dir, key+'.png')
+            if os.path.isfile(cached):
+                logger.debug(f'- Using cached image for {dst}')
+                copy2(cached, dst)
+                # Mark it as recently used
+                os.utime(cached)
+                with self.lock:
+                    self.hits += 1
+                return True
+        res = func(*args)
+        if res and cached is not None and os.path.isfile(dst):
+            # Copy to a temporal and then rename, the cache can be shared by concurrent runs
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = GS.tmp_file(suffix='.png', dir=self.cache_dir)
+            copy2(dst, tmp)
+            os.replace(tmp, cached)
+        return res
+
+    def run(self):
+        """ Does all the collected conversions """
+        self.collecting = False
+        total = len(self.jobs)
+        if not total:
+            return
+        workers = min(self.workers, total)
+        logger.debug(f'Converting {total} images using {workers} workers')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for phase in sorted({j[0] for j in self.jobs.values()}):
+                jobs = [(dst, j) for dst, j in self.jobs.items() if j[0] == phase]
+                futures = [executor.submit(self.do_job, dst, j[1], j[2], j[3], j[4]) for dst, j in jobs]
+                for (dst, _), future in zip(jobs, futures):
+                    self.results[dst] = future.result()
+        logger.debug(f'- {self.hits} images from the cache')
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used images """
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            fname = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.stat(fname).st_mtime, fname))
+            except OSError:
+                pass
+        if len(entries) <= MAX_CACHED_IMAGES:
+            return
+        entries.sort()
+        for _, fname in entries[:len(entries)-MAX_CACHED_IMAGES]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+
 class Navigate_ResultsOptions(BaseOptions):
     def __init__(self):
         with document:
@@ -288,6 +399,11 @@ class Navigate_ResultsOptions(BaseOptions):
             """ Add a side navigation bar to quickly access to the outputs """
             self.header = True
             """ Add a header containing information for the project """
+            self.workers = 0
+            """ [0,64] Number of images converted at the same time. Use 0 to use the number of CPUs """
+            self.cache_images = True
+            """ Keep the converted images in a cache, so they aren't converted again if the source didn't change.
+                The cache is stored in `~/.cache/kibot/navigate`, use `KIBOT_NAVIGATE_CACHE` to change it """
         super().__init__()
         self._expand_id = 'navigate'
         self._expand_ext = 'html'
@@ -341,7 +457,8 @@ class Navigate_ResultsOptions(BaseOptions):
         src = os.path.join(self.img_src_dir, img+'.svg') if not img.endswith('.svg') else img
         dst = os.path.join(self.out_dir, 'images', img_w)
         id = img_w
-        if self.rsvg_command is not None and self.svg_to_png(src, dst+'.png', width):
+        if self.rsvg_command is not None and self._pool.request(dst+'.png', 0, ('rsvg', self.rsvg_command, width), [src],
+                                                                self.svg_to_png, src, dst+'.png', width):
             img_w += '.png'
         else:
             copy2(src, dst+'.svg')
@@ -357,7 +474,7 @@ class Navigate_ResultsOptions(BaseOptions):
         if ext in IMAGEABLES_GS and not self.ps2img_avail:
             logger.warning(W_MISSTOOL+"Missing PS/PDF to PNG converter")
             return False
-        if ext in IMAGEABLES_SIMPLE and self.convert_command is None:
+        if ext in IMAGEABLES_SIMPLE and self.convert_command is None and needs_convert():
             logger.warning(W_MISSTOOL+"Missing ImageMagick converter")
             return False
         return ext in IMAGEABLES_SVG or ext in IMAGEABLES_GS or ext in IMAGEABLES_SIMPLE
@@ -365,7 +482,7 @@ class Navigate_ResultsOptions(BaseOptions):
     def get_image_for_cat(self, cat):
         img = None
         # Check if we have an output that can represent this category
-        if cat in CAT_REP and self.convert_command is not None:
+        if cat in CAT_REP and (self.convert_command is not None or not needs_convert()):
             outs_rep = CAT_REP[cat]
             rep_file = None
             # Look in all outputs
@@ -397,13 +514,20 @@ class Navigate_ResultsOptions(BaseOptions):
         if not os.path.isfile(file):
             logger.warning(W_NOTYET+"{} not yet generated, using an icon".format(os.path.relpath(file)))
             return False, None, None
-        if self.convert_command is None:
+        if self.convert_command is None and (needs_convert() or ext in IMAGEABLES_GS):
             return False, None, None
         # Create a unique name using the output name and the generated file name
         bfname = os.path.splitext(os.path.basename(file))[0]
         fname = os.path.join(self.out_dir, 'images', out_name+'_'+bfname+'.png')
         # Full path for the icon image
         icon = os.path.join(self.out_dir, img)
+        # The icons are created in the first phase
+        key = ('compose', self.convert_command, backend(), self.rsvg_command, ext, no_icon, BIG_ICON)
+        res = self._pool.request(fname, 1, key, [file] if no_icon else [file, icon], self.do_compose_image, file, ext,
+                                 icon, fname, no_icon)
+        return res, fname, os.path.relpath(fname, start=self.out_dir)
+
+    def do_compose_image(self, file, ext, icon, fname, no_icon):
         if ext == 'pdf':
             # Only page 1
             file += '[0]'
@@ -411,27 +535,36 @@ class Navigate_ResultsOptions(BaseOptions):
             tmp_name = GS.tmp_file(suffix='.png')
             logger.debug('Temporal convert: {} -> {}'.format(file, tmp_name))
             if not self.svg_to_png(file, tmp_name, BIG_ICON):
-                return False, None, None
+                return False
             file = tmp_name
-        cmd = [self.convert_command, file,
-               # Size for the big icons (width)
-               '-resize', str(BIG_ICON)+'x']
-        if ext == 'ps':
-            # ImageMagick 6.9.11 (and also the one in Debian 11) rotates the PS
-            cmd.extend(['-rotate', '90'])
-        if not no_icon:
-            cmd.extend([  # Add the file type icon
-                        icon,
-                        # At the bottom right
-                        '-gravity', 'south-east',
-                        # This is a composition, not 2 images
-                        '-composite'])
-        cmd.append(fname)
-        res = _run_command(cmd)
+        if ext not in IMAGEABLES_GS and not needs_convert():
+            # In-process, no need to run ImageMagick
+            res = True
+            try:
+                compose_icon(file, BIG_ICON, None if no_icon else icon, fname)
+            except OSError as e:
+                logger.non_critical_error(f'Failed to create a preview for {file}: {e}')
+                res = False
+        else:
+            cmd = [self.convert_command, file,
+                   # Size for the big icons (width)
+                   '-resize', str(BIG_ICON)+'x']
+            if ext == 'ps':
+                # ImageMagick 6.9.11 (and also the one in Debian 11) rotates the PS
+                cmd.extend(['-rotate', '90'])
+            if not no_icon:
+                cmd.extend([  # Add the file type icon
+                            icon,
+                            # At the bottom right
+                            '-gravity', 'south-east',
+                            # This is a composition, not 2 images
+                            '-composite'])
+            cmd.append(fname)
+            res = _run_command(cmd)
         if ext == 'svg':
             logger.debug('Removing temporal {}'.format(tmp_name))
             os.remove(tmp_name)
-        return res, fname, os.path.relpath(fname, start=self.out_dir)
+        return res
 
     def get_image_for_file(self, file, out_name, no_icon=False, image=None):
         ext = os.path.splitext(file)[1][1:].lower()
@@ -493,9 +626,18 @@ class Navigate_ResultsOptions(BaseOptions):
         f.write(self.top_menu)
         f.write('<div id="main">\n')
 
+    @contextmanager
+    def open_page(self, name):
+        """ The pages are discarded while collecting the images """
+        if self._pool.collecting:
+            yield StringIO()
+            return
+        with open(os.path.join(self.out_dir, name), 'wt') as f:
+            yield f
+
     def generate_cat_page_for(self, name, node, prev, category):
         logger.debug('- Categories: '+str(node.keys()))
-        with open(os.path.join(self.out_dir, name), 'wt') as f:
+        with self.open_page(name) as f:
             self.write_head(f, category)
             name, ext = os.path.splitext(name)
             # Limit to 5 categories by row
@@ -578,7 +720,7 @@ class Navigate_ResultsOptions(BaseOptions):
 
     def generate_end_page_for(self, name, node, prev, category):
         logger.debug('- Outputs: '+str(node.keys()))
-        with open(os.path.join(self.out_dir, name), 'wt') as f:
+        with self.open_page(name) as f:
             self.write_head(f, category)
             name, ext = os.path.splitext(name)
             self.generate_outputs(f, node)
@@ -724,12 +866,17 @@ class Navigate_ResultsOptions(BaseOptions):
                 if res:
                     self.title_url = res
 
+    def generate_pages(self, o_tree, name):
+        self.copied_images = {}
+        self.back_img = self.copy('back', MID_ICON)
+        self.home_img = self.copy('home', MID_ICON)
+        self.generate_page_for(o_tree, name)
+
     def run(self, name):
         self.out_dir = os.path.dirname(name)
         self.img_src_dir = GS.get_resource_path('images')
         self.img_dst_dir = os.path.join(self.out_dir, 'images')
         os.makedirs(self.img_dst_dir, exist_ok=True)
-        self.copied_images = {}
         name = os.path.basename(name)
         # Create a tree with all the outputs
         o_tree = self.create_tree()
@@ -746,10 +893,7 @@ class Navigate_ResultsOptions(BaseOptions):
         self.rsvg_command = self.check_tool('rsvg1')
         self.convert_command = self.check_tool('ImageMagick')
         self.ps2img_avail = self.check_tool('Ghostscript')
-        # Create the pages
         self.home = name
-        self.back_img = self.copy('back', MID_ICON)
-        self.home_img = self.copy('home', MID_ICON)
         copy2(os.path.join(self.img_src_dir, 'favicon.ico'), os.path.join(self.out_dir, 'favicon.ico'))
         # Copy the logo image
         if self.logo is not None and self.header:
@@ -758,7 +902,11 @@ class Navigate_ResultsOptions(BaseOptions):
         self.solve_title()
         self.navbar = self.generate_navbar(o_tree, name) if self.nav_bar else ''
         self.top_menu = self.generate_top_menu() if self.nav_bar or self.header else ''
-        self.generate_page_for(o_tree, name)
+        # Collect the images we need, convert them and then create the pages
+        self._pool = ConversionPool(self.workers, self.cache_images)
+        self.generate_pages(o_tree, name)
+        self._pool.run()
+        self.generate_pages(o_tree, name)
         # Link it?
         if self.link_from_root:
             redir_file = os.path.join(GS.out_dir, self.link_from_root)
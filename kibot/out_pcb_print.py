@@ -13,6 +13,8 @@ Dependencies:
     role: Create PNG, PS and EPS formats
   - from: ImageMagick
     role: Create monochrome prints and scaled PNG files
+  - from: Pillow
+    role: Faster monochrome prints and scaled PNG files, no ImageMagick needed
   # The plot_frame_gui() needs KiAuto to print the frame
   - from: KiAuto
     command: pcbnew_do
@@ -37,6 +39,7 @@ from pcbnew import B_Cu, B_Mask, F_Cu, F_Mask, FromMM, IsCopperLayer, LSET, PLOT
 from shutil import rmtree
 from .error import KiPlotConfigurationError
 from .gs import GS
+from .image_ops import gray, resize_width, process_images, needs_convert
 from .optionable import Optionable
 from .out_base import VariantOptions
 from .kicad.color_theme import load_color_theme
@@ -526,30 +529,53 @@ class PCB_PrintOptions(VariantOptions):
         vars['PAPER'] = self.paper
         return vars
 
-    def plot_frame_internal(self, pc, po, p, page, pages):
-        """ Here we plot the frame manually """
+    def load_worksheet(self):
+        """ Loads the WKS, only once for each output """
+        if self._worksheet is None:
+            error = None
+            try:
+                self._worksheet = kicad_worksheet.Worksheet.load(self.layout)
+            except (kicad_worksheet.WksError, SchError) as e:
+                error = str(e)
+            if error:
+                raise KiPlotConfigurationError('Error reading `{}` ({})'.format(self.layout, error))
+        return self._worksheet
+
+    def plot_worksheet(self, pc, po, p, page, pages, ws, dynamic):
         self.clear_layer('Edge.Cuts')
         po.SetPlotFrameRef(False)
         po.SetScale(1.0)
         po.SetNegative(False)
         pc.SetLayer(self.cleared_layer)
-        # Load the WKS
-        error = None
-        try:
-            ws = kicad_worksheet.Worksheet.load(self.layout)
-        except (kicad_worksheet.WksError, SchError) as e:
-            error = str(e)
-        if error:
-            raise KiPlotConfigurationError('Error reading `{}` ({})'.format(self.layout, error))
         tb_vars = self.fill_kicad_vars(page, pages, p)
-        ws.draw(GS.board, self.cleared_layer, page, self.paper_w, self.paper_h, tb_vars)
+        ws.draw(GS.board, self.cleared_layer, page, self.paper_w, self.paper_h, tb_vars, dynamic)
         pc.OpenPlotfile('frame', PLOT_FORMAT_SVG, p.sheet)
         pc.PlotLayer()
         pc.ClosePlot()
         ws.undraw(GS.board)
         self.restore_layer()
-        # We need to plot the images in a separated pass
-        self.last_worksheet = ws
+        return pc.GetPlotFileName()
+
+    def plot_frame_internal(self, pc, po, p, page, pages):
+        """ Here we plot the frame manually.
+            The static part is plotted once, only the texts using variables are plotted for each page.
+            Returns the list of SVG files for the frame """
+        ws = self.load_worksheet()
+        # The first page can be different
+        key = page == 1 if ws.page_dependent else True
+        static = self._frame_static.get(key)
+        if static is None:
+            name = os.path.join(self._frame_dir, f'{GS.pcb_basename}-static{len(self._frame_static)}-frame.svg')
+            os.replace(self.plot_worksheet(pc, po, p, page, pages, ws, False), name)
+            # We need to plot the images in a separated pass
+            static = self._frame_static[key] = (name, ws.images)
+        else:
+            logger.debug('- Using the already plotted frame')
+        files = [static[0]]
+        self._frame_images = static[1]
+        if ws.has_dynamic:
+            files.append(self.plot_worksheet(pc, po, p, page, pages, ws, True))
+        return files
 
     def plot_frame_gui(self, dir_name, layer='Edge.Cuts'):
         """ KiCad 5 crashes if we try to print the frame.
@@ -721,20 +747,21 @@ class PCB_PrintOptions(VariantOptions):
         filelist.append((pc.GetPlotFileName(), via_c))
 
     def add_frame_images(self, svg, monochrome):
-        if (not self.plot_sheet_reference or not self.frame_plot_mechanism == 'internal' or
-           not self.last_worksheet.has_images):
+        if not self.plot_sheet_reference or not self.frame_plot_mechanism == 'internal' or not self._frame_images:
             return
         if monochrome:
-            convert_command = self.ensure_tool('ImageMagick')
-            for img in self.last_worksheet.images:
+            convert_command = self.ensure_tool('ImageMagick') if needs_convert() else None
+            for img in self._frame_images:
+                if img.gray_data is not None:
+                    continue
                 fname = GS.tmp_file(content=img.data, suffix='.png', binary=True)
                 dest = fname.replace('.png', '_gray.png')
-                _run_command([convert_command, fname, '-set', 'colorspace', 'Gray', '-separate', '-average', dest])
+                gray(fname, dest, convert_command, err_lvl=PDF_PCB_PRINT)
                 with open(dest, 'rb') as f:
-                    img.data = f.read()
+                    img.gray_data = f.read()
                 os.remove(fname)
                 os.remove(dest)
-        self.last_worksheet.add_images_to_svg(svg, self.svg_precision)
+        self._worksheet.add_images_to_svg(svg, self.svg_precision, self._frame_images, monochrome)
 
     def fill_polygons(self, svg, color):
         """ I don't know how to generate filled polygons on KiCad 5.
@@ -1070,12 +1097,9 @@ class PCB_PrintOptions(VariantOptions):
         self.run_gs(pdf_file, output, 'png16m', use_dpi=True)
         if self.png_width:
             # Adjust the width
-            convert_command = self.ensure_tool('ImageMagick')
-            size = str(self.png_width)+'x'
-            for n in range(len(self._pages)):
-                file = output % (n+1)
-                cmd = [convert_command, file, '-resize', size, file]
-                _run_command(cmd)
+            convert_command = self.ensure_tool('ImageMagick') if needs_convert() else None
+            process_images(resize_width, [output % (n+1) for n in range(len(self._pages))], self.png_width,
+                           convert_command=convert_command, err_lvl=PDF_PCB_PRINT)
 
     def create_pdf_from_svg_pages(self, input_folder, input_files, output_fn):
         """ Convert individual SVG files into individual PDF files using 360 dpi.
@@ -1165,6 +1189,10 @@ class PCB_PrintOptions(VariantOptions):
             layout = os.path.abspath(os.path.join(GS.get_resource_path('kicad_layouts'), 'default.kicad_wks'))
         logger.debug('- Using layout: '+layout)
         self.layout = layout
+        self._worksheet = None
+        self._frame_static = {}
+        self._frame_dir = temp_dir_base
+        self._frame_images = []
         # Memorize the list of visible layers
         old_visible = GS.board.GetVisibleLayers()
         # Plot options
@@ -1267,14 +1295,15 @@ class PCB_PrintOptions(VariantOptions):
             po.SetMirror(False)
             if self.plot_sheet_reference:
                 logger.debug('- Plotting the frame')
+                frame_files = [GS.pcb_basename+"-frame.svg"]
                 if self.frame_plot_mechanism == 'gui':
                     self.plot_frame_gui(temp_dir)
                 elif self.frame_plot_mechanism == 'plot':
                     self.plot_frame_api(pc, po, p)
                 else:   # internal
-                    self.plot_frame_internal(pc, po, p, len(pages)+1, len(self._pages))
+                    frame_files = self.plot_frame_internal(pc, po, p, len(pages)+1, len(self._pages))
                 color = p.sheet_reference_color if p.sheet_reference_color else self._color_theme.pcb_frame
-                filelist.append((GS.pcb_basename+"-frame.svg", color))
+                filelist.extend((f, color) for f in frame_files)
             # 3) Stack all layers in one file
             if self.format == 'SVG':
                 id, ext = self.get_id_and_ext(n, p.page_id)
@@ -1357,7 +1386,7 @@ class PCB_Print(BaseOutput):  # noqa: F821
         if GS.check_tool(name, 'Ghostscript') is None:
             logger.warning(W_MISSTOOL+'Disabling postscript/PDF printed format')
             disabled |= {'PDF', 'PNG', 'EPS', 'PS'}
-        if GS.check_tool(name, 'ImageMagick') is None:
+        if needs_convert() and GS.check_tool(name, 'ImageMagick') is None:
             disabled |= {'PNG'}
         # Generate one output for each format
         for fmt in ['PDF', 'SVG', 'PNG', 'EPS', 'PS']:
@@ -18,9 +18,6 @@ Dependencies:
     downloader: python
     role: Automatically adjust SVG margin
 """
-PROFILE_PLOT = False
-if PROFILE_PLOT:
-    import cProfile
 import os
 # Here we import the whole module to make monkeypatch work
 from .error import KiPlotConfigurationError
@@ -254,6 +251,8 @@ class PcbDrawOptions(VariantOptions):
                 The value is how much zeros has the multiplier (1 mm = 10 power `svg_precision` units).
                 Note that for an A4 paper Firefox 91 and Chrome 105 can't handle more than 5 """
         super().__init__()
+        # Board and components plotted for each side, only when used as renderer
+        self._layers = None
 
     def config(self, parent):
         self._filters_to_expand = False
@@ -316,6 +315,8 @@ class PcbDrawOptions(VariantOptions):
         self.old_bottom = self.bottom
         self.old_add_to_variant = self.add_to_variant
         self.old_output = self.output
+        # The board is the same for all the images, just the components change
+        self._layers = {}
 
     def restore_renderer_options(self):
         """ Restore the renderer settings """
@@ -323,6 +324,7 @@ class PcbDrawOptions(VariantOptions):
         self.bottom = self.old_bottom
         self.add_to_variant = self.old_add_to_variant
         self.output = self.old_output
+        self._layers = None
 
     def expand_filtered_components(self, components):
         """ Expands references to filters in show_components """
@@ -412,9 +414,60 @@ class PcbDrawOptions(VariantOptions):
             plot_components.highlight = lambda ref: ref in highlight_set
         return plot_components
 
+    def create_plotter(self, board, components):
+        from .PcbDraw.plot import PcbPlotter, PlotPaste, PlotPlaceholders, PlotSubstrate, PlotVCuts
+        plotter = PcbPlotter(board)
+        # Read libs from KiBot resources
+        plotter.setup_arbitrary_data_path(GS.get_resource_path('pcbdraw'))
+        # Libs indicated by PCBDRAW_LIB_PATH
+        plotter.setup_env_data_path()
+        # Libs from the user HOME and the system (for pcbdraw)
+        plotter.setup_global_data_path()
+        logger.debugl(3, 'PcbDraw data path: {}'.format(plotter.data_path))
+        plotter.yield_warning = pcbdraw_warnings
+        plotter.libs = self.libs
+        plotter.render_back = self.bottom
+        plotter.mirror = self.mirror
+        plotter.margin = self._margin
+        plotter.svg_precision = self.svg_precision
+        if self._style:
+            if isinstance(self._style, str):
+                plotter.resolve_style(self._style)
+            else:
+                plotter.style = self._style
+        plotter.plot_plan = [PlotSubstrate(drill_holes=not self.no_drillholes, outline_width=mm2ki(self.outline_width))]
+        if self.show_solderpaste:
+            plotter.plot_plan.append(PlotPaste())
+        if self.vcuts:
+            plotter.plot_plan.append(PlotVCuts(layer=self._vcuts_layer))
+        if components is not None:
+            plotter.plot_plan.append(components)
+        if self.placeholder:
+            plotter.plot_plan.append(PlotPlaceholders())
+        plotter.compute_bbox = self.size_detection == 'svg_paths'
+        # Make sure we can use svgpathtools
+        if plotter.compute_bbox:
+            self.ensure_tool('numpy')
+        plotter.kicad_bb_only_edge = self.size_detection == 'kicad_edge'
+        return plotter
+
+    def compose_image(self, board, components):
+        """ Used when we create various images for the same board (populate).
+            The board and all the components are plotted once for each side, then we just pick the components """
+        cache = self._layers.get(self.bottom)
+        if cache is None:
+            logger.debug('Plotting the {} side layers'.format('bottom' if self.bottom else 'top'))
+            all_components = self.build_plot_components()
+            all_components.filter = lambda ref: True
+            plotter = self.create_plotter(board, all_components)
+            cache = self._layers[self.bottom] = (plotter, plotter.plot_layers())
+        plotter, layers = cache
+        if components is None:
+            return plotter.compose(layers, lambda ref: False, lambda ref: False)
+        return plotter.compose(layers, components.filter, components.highlight)
+
     def create_image(self, name, board):
         self.ensure_tool('LXML')
-        from .PcbDraw.plot import PcbPlotter, PlotPaste, PlotPlaceholders, PlotSubstrate, PlotVCuts
         # Select a name and format that PcbDraw can handle
         svg_save_output_name = save_output_name = name
         self.rsvg_command = None
@@ -430,30 +483,6 @@ class PcbDrawOptions(VariantOptions):
                 save_output_name = GS.tmp_file(suffix='.png')
 
         try:
-            plotter = PcbPlotter(board)
-            # Read libs from KiBot resources
-            plotter.setup_arbitrary_data_path(GS.get_resource_path('pcbdraw'))
-            # Libs indicated by PCBDRAW_LIB_PATH
-            plotter.setup_env_data_path()
-            # Libs from the user HOME and the system (for pcbdraw)
-            plotter.setup_global_data_path()
-            logger.debugl(3, 'PcbDraw data path: {}'.format(plotter.data_path))
-            plotter.yield_warning = pcbdraw_warnings
-            plotter.libs = self.libs
-            plotter.render_back = self.bottom
-            plotter.mirror = self.mirror
-            plotter.margin = self._margin
-            plotter.svg_precision = self.svg_precision
-            if self._style:
-                if isinstance(self._style, str):
-                    plotter.resolve_style(self._style)
-                else:
-                    plotter.style = self._style
-            plotter.plot_plan = [PlotSubstrate(drill_holes=not self.no_drillholes, outline_width=mm2ki(self.outline_width))]
-            if self.show_solderpaste:
-                plotter.plot_plan.append(PlotPaste())
-            if self.vcuts:
-                plotter.plot_plan.append(PlotVCuts(layer=self._vcuts_layer))
             # Adjust the show_components option if needed
             if self.add_to_variant:
                 # Enable the old behavior
@@ -461,25 +490,11 @@ class PcbDrawOptions(VariantOptions):
                     # A variant automatically adds their components
                     # So `none` becomes `all`
                     self.show_components = []
-            if self.show_components is not None:
-                plotter.plot_plan.append(self.build_plot_components())
-            if self.placeholder:
-                plotter.plot_plan.append(PlotPlaceholders())
-            plotter.compute_bbox = self.size_detection == 'svg_paths'
-            # Make sure we can use svgpathtools
-            if plotter.compute_bbox:
-                self.ensure_tool('numpy')
-            plotter.kicad_bb_only_edge = self.size_detection == 'kicad_edge'
-            # Plot it
-            if PROFILE_PLOT:
-                logger.error('Start')
-                with cProfile.Profile() as pr:
-                    image = plotter.plot()
-                    pr.print_stats(sort='time')
-                    pr.print_stats(sort='cumulative')
-                logger.error('End')
+            components = self.build_plot_components() if self.show_components is not None else None
+            if self._layers is None:
+                image = self.create_plotter(board, components).plot()
             else:
-                image = plotter.plot()
+                image = self.compose_image(board, components)
         # Most errors are reported as RuntimeError
         # When the PCB can't be loaded we get IOError
         # When the SVG contains errors we get SyntaxError
@@ -56,6 +56,35 @@ def compute_size(qr, is_sch=True, use_mm=True):
     return qrc, size, full_size, center, size_rect
 
 
+def qr_rectangles(qrc, size, negative=0, geometry='modules'):
+    """ Rectangles covering the dark modules, as (x, y, width, height) in modules.
+        For `rectangles` we join the modules, first horizontally and then vertically """
+    dark = [[qrc.get_module(x-negative, y-negative) ^ negative for x in range(size)] for y in range(size)]
+    if geometry == 'modules':
+        return [(x, y, 1, 1) for y in range(size) for x in range(size) if dark[y][x]]
+    rects = []
+    for y in range(size):
+        row = dark[y]
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            # Widest run starting here
+            w = 1
+            while x+w < size and row[x+w]:
+                w += 1
+            # Extend it down while the rows below are fully dark
+            h = 1
+            while y+h < size and all(dark[y+h][x:x+w]):
+                h += 1
+            for yy in range(y, y+h):
+                dark[yy][x:x+w] = [False]*w
+            rects.append((x, y, w, h))
+            x += w
+    return rects
+
+
 class QRCodeOptions(Optionable):
     """ A QR code """
     def __init__(self, field=None):
@@ -77,6 +106,10 @@ class QRCodeOptions(Optionable):
             """ *[silk,copper] Layer for the footprint """
             self.pcb_negative = False
             """ Generate a negative image for the PCB """
+            self.geometry = 'modules'
+            """ [modules,rectangles] How the QR is drawn. `modules` uses a square for each dark module.
+                `rectangles` joins the modules in rectangles, the result is the same, but the libs, the
+                PCB and the schematic are much smaller and faster to plot """
         self._unknown_is_error = True
 
     def config(self, parent):
@@ -135,12 +168,13 @@ class QR_LibOptions(BaseOptions):
         f.write('F7 "{}" 0 0 50 H I C CNN "qr_mask"\n'.format(qrc.get_mask()))
         f.write('F8 "{}" 0 0 50 H I C CNN "qr_text"\n'.format(qr._text_sch.replace('"', '\"')))
         f.write("DRAW\n")
-        for y in range(size):
-            for x in range(size):
-                if qrc.get_module(x, y):
-                    x_pos = round(x*size_rect-center)
-                    y_pos = round(center-y*size_rect)
-                    f.write('S {} {} {} {} 0 0 1 F\n'.format(x_pos, y_pos, round(x_pos+size_rect), round(y_pos+size_rect)))
+        for x, y, w, h in qr_rectangles(qrc, size, geometry=qr.geometry):
+            # Computed as for individual modules, using the corner ones
+            x_pos = round(x*size_rect-center)
+            y_pos = round(center-(y+h-1)*size_rect)
+            x_pos2 = round(round((x+w-1)*size_rect-center)+size_rect)
+            y_pos2 = round(round(center-y*size_rect)+size_rect)
+            f.write('S {} {} {} {} 0 0 1 F\n'.format(x_pos, y_pos, x_pos2, y_pos2))
         f.write("ENDDRAW\n")
         f.write("ENDDEF\n")
 
@@ -162,51 +196,49 @@ class QR_LibOptions(BaseOptions):
         fld.append(Sep())
         return fld
 
-    def qr_draw_fp(self, size, size_rect, center, qrc, negative, layer, do_sep=True):
+    def qr_draw_fp(self, size, size_rect, center, qrc, negative, layer, do_sep=True, geometry='modules'):
         mod = []
         is_bottom = layer[0] == 'B'
-        for y in range(size):
-            for x in range(size):
-                if qrc.get_module(x-negative, y-negative) ^ negative:
-                    x_pos = round(x*size_rect-center, 2)
-                    y_pos = round(y*size_rect-center, 2)
-                    x_pos2 = round(x_pos+size_rect, 2)
-                    y_pos2 = round(y_pos+size_rect, 2)
-                    rect = [Symbol('fp_poly')]  # fp_rect not in v5
-                    pts = [Symbol('pts')]
-                    if is_bottom:
-                        y_pos = -y_pos
-                        y_pos2 = -y_pos2
-                    pts.append([Symbol('xy'), x_pos, y_pos])
-                    pts.append([Symbol('xy'), x_pos, y_pos2])
-                    pts.append([Symbol('xy'), x_pos2, y_pos2])
-                    pts.append([Symbol('xy'), x_pos2, y_pos])
-                    rect.append(pts)
-                    if layer:
-                        rect.append([Symbol('layer'), Symbol(layer)])
-                    rect.append([Symbol('width'), 0])
-                    mod.append(rect)
-                    if do_sep:
-                        mod.append(Sep())
+        for x, y, w, h in qr_rectangles(qrc, size, negative, geometry):
+            # The end is computed using the last module, so joined modules are exactly the same
+            x_pos = round(x*size_rect-center, 2)
+            y_pos = round(y*size_rect-center, 2)
+            x_pos2 = round(round((x+w-1)*size_rect-center, 2)+size_rect, 2)
+            y_pos2 = round(round((y+h-1)*size_rect-center, 2)+size_rect, 2)
+            rect = [Symbol('fp_poly')]  # fp_rect not in v5
+            pts = [Symbol('pts')]
+            if is_bottom:
+                y_pos = -y_pos
+                y_pos2 = -y_pos2
+            pts.append([Symbol('xy'), x_pos, y_pos])
+            pts.append([Symbol('xy'), x_pos, y_pos2])
+            pts.append([Symbol('xy'), x_pos2, y_pos2])
+            pts.append([Symbol('xy'), x_pos2, y_pos])
+            rect.append(pts)
+            if layer:
+                rect.append([Symbol('layer'), Symbol(layer)])
+            rect.append([Symbol('width'), 0])
+            mod.append(rect)
+            if do_sep:
+                mod.append(Sep())
         return mod
 
-    def qr_draw_sym(self, size, size_rect, center, qrc, do_sep=True):
+    def qr_draw_sym(self, size, size_rect, center, qrc, do_sep=True, geometry='modules'):
         mod = []
-        for y in range(size):
-            for x in range(size):
-                if qrc.get_module(x, y):
-                    x_pos = round(x*size_rect-center, 2)
-                    y_pos = round(center-y*size_rect, 2)
-                    rect = DrawRectangleV6()
-                    rect.start = PointXY(x_pos, y_pos)
-                    rect.end = PointXY(round(x_pos+size_rect, 2), round(y_pos-size_rect, 2))
-                    rect.stroke = Stroke()
-                    rect.stroke.width = 0.001
-                    rect.fill = Fill()
-                    rect.fill.type = 'outline'
-                    mod.append(rect.write())
-                    if do_sep:
-                        mod.append(Sep())
+        for x, y, w, h in qr_rectangles(qrc, size, geometry=geometry):
+            x_pos = round(x*size_rect-center, 2)
+            y_pos = round(center-y*size_rect, 2)
+            rect = DrawRectangleV6()
+            rect.start = PointXY(x_pos, y_pos)
+            rect.end = PointXY(round(round((x+w-1)*size_rect-center, 2)+size_rect, 2),
+                               round(round(center-(y+h-1)*size_rect, 2)-size_rect, 2))
+            rect.stroke = Stroke()
+            rect.stroke.width = 0.001
+            rect.fill = Fill()
+            rect.fill.type = 'outline'
+            mod.append(rect.write())
+            if do_sep:
+                mod.append(Sep())
         return mod
 
     def footprint(self, dir, qr):
@@ -245,7 +277,7 @@ class QR_LibOptions(BaseOptions):
         mod.append(self.fp_field(center, 'user', qr._text_pcb, qr.layer, 6))
         mod.append(Sep())
         # The QR itself
-        mod.extend(self.qr_draw_fp(size, size_rect, center, qrc, qr.pcb_negative, qr.layer))
+        mod.extend(self.qr_draw_fp(size, size_rect, center, qrc, qr.pcb_negative, qr.layer, geometry=qr.geometry))
         with open(fname, 'wt') as f:
             f.write(dumps(mod))
             f.write('\n')
@@ -312,7 +344,7 @@ class QR_LibOptions(BaseOptions):
             if GS.ki7:
                 sym.append(self.sym_field(center, 'Sim.Enable', "0", 9))
                 sym.append(Sep())
-            sym.extend(self.qr_draw_sym(size, size_rect, center, qrc))
+            sym.extend(self.qr_draw_sym(size, size_rect, center, qrc, geometry=qr.geometry))
             lib.append(sym)
             lib.append(Sep())
         with open(output, 'wt') as f:
@@ -343,7 +375,8 @@ class QR_LibOptions(BaseOptions):
         # Remove old drawing
         sexp[:] = list(filter(lambda s: not is_symbol('fp_poly', s), sexp))
         # Add the new drawings
-        sexp.extend(self.qr_draw_fp(size, size_rect, center, qrc, qr.pcb_negative, layer, do_sep=False))
+        sexp.extend(self.qr_draw_fp(size, size_rect, center, qrc, qr.pcb_negative, layer, do_sep=False,
+                                    geometry=qr.geometry))
         # Update the fields
         for s in sexp:
             if (is_symbol('fp_text', s) and len(s) > 2 and isinstance(s[1], Symbol) and s[1].value() == 'user' and
@@ -390,7 +423,7 @@ class QR_LibOptions(BaseOptions):
         # Create the new drawings
         sub_unit_name = c_name+"_1_1"
         sub_unit_sexp = [Symbol('symbol'), sub_unit_name]
-        sub_unit_sexp.extend(self.qr_draw_sym(size, size_rect, center, qrc, do_sep=False))
+        sub_unit_sexp.extend(self.qr_draw_sym(size, size_rect, center, qrc, do_sep=False, geometry=qr.geometry))
         # Replace the old one
         for s in sexp_iter(sexp, 'symbol'):
             if len(s) >= 2 and isinstance(s[1], str) and s[1] == sub_unit_name:
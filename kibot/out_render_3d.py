@@ -11,24 +11,22 @@ Dependencies:
     version: 2.3.1
   - from: ImageMagick
     role: Automatically crop images
+  - from: Pillow
+    role: Faster crop and transparent background (also needs NumPy), no ImageMagick needed
 """
 import os
 from .error import KiPlotConfigurationError
 from .misc import (RENDER_3D_ERR, PCB_MAT_COLORS, PCB_FINISH_COLORS, SOLDER_COLORS, SILK_COLORS,
                    KICAD_VERSION_6_0_2, MISSING_TOOL, W_INV3DLAYER, W_NEEDSK8, W_NEEDSK6, W_DEPR)
 from .gs import GS
+from .image_ops import trim, chroma_key, needs_convert
 from .out_base_3d import Base3DOptionsWithHL, Base3D
-from .kiplot import run_command
 from .macros import macros, document, output_class  # noqa: F401
 from . import log
 
 logger = log.get_logger()
 
 
-def _run_command(cmd):
-    run_command(cmd, err_lvl=RENDER_3D_ERR)
-
-
 class Render3DOptions(Base3DOptionsWithHL):
     _colors = {'background1': 'bg_color_1',
                'background2': 'bg_color_2',
@@ -115,7 +113,8 @@ class Render3DOptions(Base3DOptionsWithHL):
                 In this mode the `background2` is changed to be the same as `background1` """
             self.enable_crop_workaround = False
             """ Some versions of Image Magick (i.e. the one in Debian 11) needs two passes to crop.
-                Enable it to force a double pass. It was the default in KiBot 1.7.0 and older """
+                Enable it to force a double pass. It was the default in KiBot 1.7.0 and older.
+                Not needed when the crop is done using Pillow """
             self.transparent_background = False
             """ When enabled the image will be post-processed to make the background transparent.
                 In this mode the `background1` and `background2` colors are ignored """
@@ -309,13 +308,16 @@ class Render3DOptions(Base3DOptionsWithHL):
             GS.exit_with_error("3D Viewer not supported for KiCad 6.0.0/1\n"
                                "Please upgrade KiCad to 6.0.2 or newer", MISSING_TOOL)
         command = self.ensure_tool('KiAuto')
+        convert_command = None
         if self.transparent_background:
             # Use the chroma key color
             self.background1 = self.background2 = self.transparent_background_color
-            convert_command = self.ensure_tool('ImageMagick')
+            if needs_convert(chroma_key=True):
+                convert_command = self.ensure_tool('ImageMagick')
         elif self.auto_crop:
             # Avoid a gradient
             self.background2 = self.background1
+        if self.auto_crop and convert_command is None and needs_convert():
             convert_command = self.ensure_tool('ImageMagick')
         # Base command with overwrite
         cmd = [command, '--rec_w', str(self.width+2), '--rec_h', str(self.height+85),
@@ -329,14 +331,10 @@ class Render3DOptions(Base3DOptionsWithHL):
         # Execute it
         self.exec_with_retry(self.add_extra_options(cmd), RENDER_3D_ERR)
         if self.auto_crop:
-            cmd = [convert_command, output, '-trim', '+repage']
-            if self.enable_crop_workaround:
-                cmd.extend(['-trim', '+repage'])
-            cmd.append(output)
-            _run_command(cmd)
+            trim(output, convert_command, double=self.enable_crop_workaround, err_lvl=RENDER_3D_ERR)
         if self.transparent_background:
-            _run_command([convert_command, output, '-fuzz', str(self.transparent_background_fuzz)+'%', '-transparent',
-                          self.color_str_to_rgb(self.transparent_background_color), output])
+            chroma_key(output, self.parse_one_color(self.transparent_background_color, scale=1)[:3],
+                       self.transparent_background_fuzz, convert_command, err_lvl=RENDER_3D_ERR)
 
 
 @output_class
@@ -128,6 +128,7 @@ class Annotate_PCB(BasePreFlight):  # noqa: F821
         super().__init__()
         self._sch_related = True
         self._pcb_related = True
+        self._reads = self._writes = {'sch', 'pcb'}
         with document:
             self.annotate_pcb = Annotate_PCBOptions
             """ [dict={}]  Options for the `annotate_pcb` preflight """
@@ -21,6 +21,7 @@ class Annotate_Power(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._sch_related = True
+        self._reads = self._writes = {'sch'}
         with document:
             self.annotate_power = False
             """ Enable this preflight """
@@ -97,6 +97,8 @@ class XRC(BasePreFlight):
     def __init__(self, cls):
         super().__init__()
         self._opts_cls = cls
+        self._writes = set()
+        self._concurrent = True
 
     def __str__(self):
         return f'{self.type}: {self._enabled} ({self._format})'
@@ -271,13 +273,17 @@ class XRC(BasePreFlight):
         html += '</table>\n'
         return html
 
-    def run(self):
-        # Differences between ERC and DRC
+    def prepare_run(self):
+        super().prepare_run()
+        # Done here because run() can be executed by a worker thread
         if GS.sch_file:
             # May be needed by DRC when checking parity?
             KiConf.check_sym_lib_table()
         if GS.pcb_file:
             KiConf.check_fp_lib_table()
+
+    def run(self):
+        # Differences between ERC and DRC
         if self._sch_related:
             nm = 'ERC'
             err = ERC_ERROR
@@ -300,13 +306,11 @@ class XRC(BasePreFlight):
         cmd = self.get_command(output)
         logger.info(f'- Running the {nm}')
         # Introduced in 8.0.4: translated messages
-        if self._force_english:
-            old_lang = os.environ.get('LANG')
-            if old_lang:
-                os.environ['LANG'] = 'en'
-        run_command(cmd)
-        if self._force_english and old_lang:
-            os.environ['LANG'] = old_lang
+        # Note: we don't change os.environ, other preflights could be running at the same time
+        env = None
+        if self._force_english and os.environ.get('LANG'):
+            env = dict(os.environ, LANG='en')
+        run_command(cmd, env=env)
         # Read the result
         with open(output, 'rt') as f:
             raw = f.read()
@@ -3,6 +3,7 @@
 # Copyright (c) 2020-2024 Instituto Nacional de Tecnología Industrial
 # License: AGPL-3.0
 # Project: KiBot (formerly KiPlot)
+from concurrent.futures import ThreadPoolExecutor
 import os
 from shutil import rmtree
 from .gs import GS
@@ -11,8 +12,11 @@ from .optionable import Optionable
 from .error import PlotError, KiPlotConfigurationError
 from .misc import PLOT_ERROR, EXIT_BAD_CONFIG, W_KEEPTMP
 from .log import get_logger
+from .profiler import Profiler
 
 logger = get_logger(__name__)
+# Things a preflight can read or modify, used to know which ones can run at the same time
+ALL_RESOURCES = frozenset(('sch', 'pcb', 'pro'))
 
 
 class BasePreFlight(Optionable, Registrable):
@@ -32,6 +36,12 @@ class BasePreFlight(Optionable, Registrable):
         self._expand_ext = ''
         self._files_to_remove = []
         self._category = None
+        # Resources ('sch', 'pcb' and/or 'pro') read and modified by this preflight.
+        # None means we don't know, so we assume all of them.
+        self._reads = None
+        self._writes = None
+        # True if run() can be executed in a separated thread, i.e. just runs KiCad using KiAuto
+        self._concurrent = False
         self.type = self.__class__.__name__.lower()
 
     # Compatibility with outputs for navigate_results
@@ -139,6 +149,53 @@ class BasePreFlight(Optionable, Registrable):
             GS.exit_with_error("In preflight `"+str(k)+"`: "+str(e), EXIT_BAD_CONFIG)
         BasePreFlight._configured = True
 
+    @staticmethod
+    def run_one(k, v):
+        try:
+            logger.debug('Preflight run '+k)
+            with Profiler.measure('preflight', k):
+                v.run()
+        except PlotError as e:
+            GS.exit_with_error("In preflight `"+str(k)+"`: "+str(e), PLOT_ERROR)
+        except KiPlotConfigurationError as e:
+            GS.exit_with_error("In preflight `"+str(k)+"`: "+str(e), EXIT_BAD_CONFIG)
+
+    @staticmethod
+    def wait_for(pending, preflights):
+        """ Waits until the `preflights` finish, also checks the ones that finished with errors """
+        for p in list(pending):
+            k, v, future = p
+            if v in preflights or future.done():
+                # Errors are reported by the worker, here we just exit
+                future.result()
+                pending.remove(p)
+
+    @staticmethod
+    def run_all(to_run):
+        """ Runs the preflights in order.
+            The ones that can run concurrently are executed by a pool of threads, the rest by the main thread.
+            Before running a preflight we wait for the running ones that modify what it reads, or read what it
+            modifies. """
+        # Opt-in: the concurrent preflights start various KiCad instances for the same project and user config
+        workers = 1 if GS.global_preflight_workers is None else GS.global_preflight_workers
+        workers = min(workers or os.cpu_count() or 1, len(to_run))
+        if workers <= 1 or sum(v._concurrent for _, v in to_run) < 2:
+            for k, v in to_run:
+                v.prepare_run()
+                BasePreFlight.run_one(k, v)
+            return
+        logger.debug(f'Running the preflights using {workers} workers')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = []
+            for k, v in to_run:
+                BasePreFlight.wait_for(pending, [p[1] for p in pending if v.conflicts_with(p[1])])
+                v.prepare_run()
+                if v._concurrent:
+                    pending.append((k, v, executor.submit(BasePreFlight.run_one, k, v)))
+                else:
+                    BasePreFlight.run_one(k, v)
+            BasePreFlight.wait_for(pending, [p[1] for p in pending])
+
     @staticmethod
     def run_enabled(targets):
         BasePreFlight._targets = targets
@@ -150,15 +207,15 @@ class BasePreFlight(Optionable, Registrable):
                     if v.is_pcb():
                         GS.check_pcb()
                     logger.debug('Preflight apply '+k)
-                    v.apply()
-            for k, v in BasePreFlight._in_use.items():
-                if v._enabled:
-                    logger.debug('Preflight run '+k)
-                    v.run()
+                    with Profiler.measure('preflight', k+' (apply)'):
+                        v.apply()
         except PlotError as e:
             GS.exit_with_error("In preflight `"+str(k)+"`: "+str(e), PLOT_ERROR)
         except KiPlotConfigurationError as e:
             GS.exit_with_error("In preflight `"+str(k)+"`: "+str(e), EXIT_BAD_CONFIG)
+        # Skip the ones that only use the apply stage
+        BasePreFlight.run_all([(k, v) for k, v in BasePreFlight._in_use.items()
+                               if v._enabled and type(v).run is not BasePreFlight.run])
 
     def disable(self):
         self._enabled = False
@@ -185,6 +242,33 @@ class BasePreFlight(Optionable, Registrable):
         """ Returns a YAML value for the example config """
         return 'true'
 
+    def get_reads(self):
+        """ Resources read by this preflight """
+        return ALL_RESOURCES if self._reads is None else self._reads
+
+    def get_writes(self):
+        """ Resources modified by this preflight """
+        return ALL_RESOURCES if self._writes is None else self._writes
+
+    def conflicts_with(self, other):
+        """ True if this preflight and `other` can't run at the same time """
+        reads = self.get_reads()
+        writes = self.get_writes()
+        o_writes = other.get_writes()
+        return bool(writes & (other.get_reads() | o_writes) or o_writes & reads)
+
+    def prepare_run(self):
+        """ Executed by the main thread before run().
+            Loads the schematic and/or PCB, so concurrent preflights don't try to load them """
+        if not self._concurrent:
+            return
+        from .kiplot import load_sch, load_board
+        reads = self.get_reads()
+        if self._sch_related and 'sch' in reads:
+            load_sch()
+        if self._pcb_related and 'pcb' in reads:
+            load_board()
+
     def run(self):
         pass
 
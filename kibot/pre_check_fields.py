@@ -88,6 +88,8 @@ class Check_Fields(BasePreFlight):  # noqa: F821
         In this case a field must declare the temperature range """
     def __init__(self):
         super().__init__()
+        self._reads = {'sch'}
+        self._writes = set()
         with document:
             self.check_fields = FieldCheck
             """ [dict|list(dict)=[]] One or more check rules """
@@ -14,6 +14,7 @@ class Check_Zone_Fills(BasePreFlight):  # noqa: F821
         creates significant changes to a layer use the CheckZoneFill internal template """
     def __init__(self):
         super().__init__()
+        self._reads = self._writes = set()
         with document:
             self.check_zone_fills = False
             """ Enable this preflight """
@@ -435,6 +435,7 @@ class Draw_Stackup(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._pcb_related = True
+        self._writes = {'pcb'}
         with document:
             self.draw_stackup = DrawStackupOptions
             """ [boolean|dict=false] Use a boolean for simple cases or fine-tune its behavior """
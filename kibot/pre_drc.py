@@ -28,6 +28,8 @@ class DRC(XRC):  # noqa: F821
     def __init__(self):
         super().__init__(DRCOptions)
         self._pcb_related = True
+        # The schematic is used for the parity check
+        self._reads = {'sch', 'pcb', 'pro'}
         self._expand_id = 'drc'
         self._category = 'PCB/docs'
         with document:
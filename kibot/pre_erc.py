@@ -23,6 +23,7 @@ class ERC(XRC):  # noqa: F821
     def __init__(self):
         super().__init__(ERCOptions)
         self._sch_related = True
+        self._reads = {'sch', 'pro'}
         self._expand_id = 'erc'
         self._category = 'Schematic/docs'
         with document:
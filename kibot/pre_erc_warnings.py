@@ -16,6 +16,7 @@ class ERC_Warnings(BasePreFlight):  # noqa: F821
         Use the `warnings_as_errors` option from `run_erc`/`erc` instead """
     def __init__(self):
         super().__init__()
+        self._reads = self._writes = set()
         with document:
             self.erc_warnings = False
             """ Enable this preflight """
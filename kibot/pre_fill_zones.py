@@ -16,6 +16,7 @@ class Fill_Zones(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._pcb_related = True
+        self._writes = {'pcb'}
         with document:
             self.fill_zones = False
             """ Enable this preflight """
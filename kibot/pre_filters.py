@@ -100,6 +100,7 @@ class Filters(BasePreFlight, FiltersOptions):  # noqa: F821
         To farther ignore these warnings use the `filters` option in the `global` section """
     def __init__(self):
         super().__init__()
+        self._reads = self._writes = set()
         self.set_doc('filters', "[list(dict)=[]] One or more filters")
 
     def __str__(self):
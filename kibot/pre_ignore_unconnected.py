@@ -17,6 +17,7 @@ class Ignore_Unconnected(BasePreFlight):  # noqa: F821
         Use the `ignore_unconnected` option from `run_drc`/`drc` instead """
     def __init__(self):
         super().__init__()
+        self._reads = self._writes = set()
         with document:
             self.ignore_unconnected = False
             """ Enable this preflight """
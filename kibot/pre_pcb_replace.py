@@ -42,6 +42,7 @@ class PCB_Replace(Base_Replace):  # noqa: F821
 
     def __init__(self):
         super().__init__()
+        self._writes = {'pcb'}
         with document:
             self.pcb_replace = PCB_ReplaceOptions
             """ [dict={}] Options for the `pcb_replace` preflight """
@@ -50,6 +50,9 @@ class Run_DRC(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._pcb_related = True
+        self._reads = {'pcb', 'pro'}
+        self._writes = set()
+        self._concurrent = True
         self._expand_id = 'drc'
         self._expand_ext = 'txt'
         with document:
@@ -76,13 +79,18 @@ class Run_DRC(BasePreFlight):  # noqa: F821
             out_dir = os.path.join(out_dir, self.expand_dirname(GS.global_dir))
         return [os.path.abspath(os.path.join(out_dir, self._dir, name))]
 
+    def prepare_run(self):
+        super().prepare_run()
+        if GS.ki7:
+            # KiCad 7 can do some library parity checks, but we need to be sure that the KICAD7* vars are defined
+            # Done here because run() can be executed by a worker thread
+            KiConf.init(GS.pcb_file)
+
     def run(self):
         if GS.ki8:
             logger.warning(W_DEPR+'For KiCad 8 use the `drc` preflight instead of `run_drc`')
         command = self.ensure_tool('KiAuto')
         if GS.ki7:
-            # KiCad 7 can do some library parity checks, but we need to be sure that the KICAD7* vars are defined
-            KiConf.init(GS.pcb_file)
             if GS.kicad_version_n < KICAD_VERSION_7_0_1_1:
                 logger.warning(W_DRC7BUG+"KiCad 7.0.0/1 fails to load the global footprints table. "
                                "You may get a lot of `lib_footprint_issues` reports. "
@@ -46,6 +46,9 @@ class Run_ERC(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._sch_related = True
+        self._reads = {'sch', 'pro'}
+        self._writes = set()
+        self._concurrent = True
         self._expand_id = 'erc'
         self._expand_ext = 'txt'
         with document:
@@ -46,6 +46,7 @@ class SCH_Replace(Base_Replace):  # noqa: F821
 
     def __init__(self):
         super().__init__()
+        self._writes = {'sch'}
         with document:
             self.sch_replace = SCH_ReplaceOptions
             """ [dict={}] Options for the `sch_replace` preflight """
@@ -76,6 +76,8 @@ class Set_Text_Variables(BasePreFlight):  # noqa: F821
         Warning:     don't use `-s all` or this preflight will be skipped """
     def __init__(self):
         super().__init__()
+        # The variables are stored in the project, and the PCB is updated
+        self._writes = {'pro', 'pcb'}
         with document:
             self.set_text_variables = KiCadVariable
             """ [dict|list(dict)=[]] One or more variable definition """
@@ -21,6 +21,7 @@ class Update_Footprint(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._pcb_related = True
+        self._writes = {'pcb'}
         with document:
             self.update_footprint = Optionable
             """ [string|list(string)=''] {comma_sep} One or more component references """
@@ -60,6 +60,7 @@ class Update_PCB_Characteristics(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._pcb_related = True
+        self._writes = {'pcb'}
         with document:
             self.update_pcb_characteristics = False
             """ Enable this preflight """
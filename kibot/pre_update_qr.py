@@ -20,6 +20,7 @@ class Update_QR(BasePreFlight):  # noqa: F821
         super().__init__()
         self._sch_related = True
         self._pcb_related = True
+        self._reads = self._writes = {'sch', 'pcb'}
         with document:
             self.update_qr = False
             """ Enable this preflight """
@@ -239,6 +239,7 @@ class Update_Stackup(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._pcb_related = True
+        self._writes = {'pcb'}
         with document:
             self.update_stackup = False
             """ Enable this preflight """
@@ -16,7 +16,7 @@ import xml.etree.ElementTree as ET
 from .macros import macros, document, pre_class  # noqa: F401
 from .error import KiPlotConfigurationError
 from .gs import GS
-from .kiplot import load_board
+from .kiplot import load_board, load_sch
 from .misc import BOM_ERROR, KICAD_VERSION_7_0_1, MISSING_TOOL, MOD_BOARD_ONLY, NETLIST_DIFF, W_NOTINBOM, W_PARITY
 from .log import get_logger
 from .optionable import Optionable
@@ -40,6 +40,12 @@ class Update_XMLOptions(Optionable):
                 these components won't be included in the generated XML, so we can't check its parity """
             self.as_warnings = False
             """ Inform the problems as warnings and don't stop """
+            self.mode = 'kicad'
+            """ [kicad,internal] How the XML is created. *kicad* runs eeschema using KiAuto.
+                *internal* computes the nets from the schematic, no need to run KiCad, so it's much faster.
+                Only the data in the schematic is used, things that KiCad could take from the installed libs,
+                like descriptions missing in the schematic, won't be included.
+                The *internal* mode is only available for KiCad 6 and newer """
 
 
 @pre_class
@@ -52,7 +58,10 @@ class Update_XML(BasePreFlight):  # noqa: F821
     def __init__(self):
         super().__init__()
         self._check_pcb_parity = False
+        self._internal = False
         self._sch_related = True
+        self._reads = {'sch', 'pro'}
+        self._writes = set()
         with document:
             self.update_xml = Update_XMLOptions
             """ [boolean|dict=false] Use a boolean for simple cases or fine-tune its behavior """
@@ -69,6 +78,12 @@ class Update_XML(BasePreFlight):  # noqa: F821
             self._enabled = self.update_xml.enabled
             self._check_pcb_parity = self.update_xml.check_pcb_parity
             self._pcb_related = True
+            self._reads = {'sch', 'pcb', 'pro'}
+            self._internal = self.update_xml.mode == 'internal'
+            if self._internal and GS.ki5:
+                raise KiPlotConfigurationError('The `internal` mode of `update_xml` needs KiCad 6 or newer')
+        # The internal mode is fast and uses the loaded schematic, no point in using another thread
+        self._concurrent = not self._internal
 
     def get_targets(self):
         """ Returns a list of targets generated by this preflight """
@@ -214,7 +229,17 @@ class Update_XML(BasePreFlight):  # noqa: F821
             else:
                 GS.exit_with_error(errors, NETLIST_DIFF)
 
-    def run(self):
+    def create_xml(self):
+        """ Creates the XML using our own connectivity """
+        load_sch()
+        fname = GS.sch_no_ext+'.xml'
+        logger.info('- Updating BoM in XML format (internal)')
+        logger.debug('Creating netlist `{}`'.format(fname))
+        with open(fname, 'wb') as f:
+            comps = [c for c in GS.sch.get_components() if c.ref[0] != '#']
+            GS.sch.save_netlist(f, comps, excluded=True, fitted=False, complete=True)
+
+    def run_kicad(self):
         command = self.ensure_tool('KiAuto')
         out_dir = self.expand_dirname(GS.out_dir)
         cmd = [command, 'bom_xml', GS.sch_file, out_dir]
@@ -227,5 +252,11 @@ class Update_XML(BasePreFlight):  # noqa: F821
             self._files_to_remove.append(side_effect_file)
         logger.info('- Updating BoM in XML format')
         self.exec_with_retry(cmd, BOM_ERROR)
+
+    def run(self):
+        if self._internal:
+            self.create_xml()
+        else:
+            self.run_kicad()
         if self._check_pcb_parity:
             self.check_pcb_parity()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# Copyright (c) 2024 Instituto Nacional de Tecnología Industrial
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+"""
+Profiling support, enabled using `--profile` or the `profile` global option.
+Collects the time and memory used by the preflights, outputs, loads and external commands.
+"""
+from contextlib import contextmanager
+import json
+import os
+import sys
+from threading import local, Lock
+from time import perf_counter, process_time
+import tracemalloc
+try:
+    import resource
+except ImportError:  # pragma: no cover (Windows)
+    resource = None
+from .gs import GS
+from . import log
+
+logger = log.get_logger()
+LEVELS = ['no', 'yes', 'memory', 'cprofile']
+JSON_NAME = 'kibot_profile.json'
+TEXT_NAME = 'kibot_profile.txt'
+CPROFILE_DIR = 'kibot_profile'
+# Python 3.9+
+HAS_RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+
+def get_max_rss(who):
+    """ Peak RSS in KiB """
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux uses KiB, macOS uses bytes
+    return rss//1024 if sys.platform == 'darwin' else rss
+
+
+def children_time():
+    t = os.times()
+    return t.children_user+t.children_system
+
+
+class Profiler(object):
+    """ Static class, just a placeholder for the collected data """
+    level = 0
+    # List of dicts, one for each measured step
+    records = []
+    # Nesting level for each thread
+    _tls = local()
+    _start = None
+    # Python memory peak for the open steps, the tracemalloc peak is reset at the start of each step
+    _mem_peaks = {}
+    _mem_lock = Lock()
+    # Only one cProfile can be active
+    _cprofile_active = False
+
+    @staticmethod
+    def enable(level):
+        """ Enables the profiler. The level can only be incremented """
+        level = LEVELS.index(level)
+        if level <= Profiler.level:
+            return
+        if not Profiler.level:
+            Profiler._start = perf_counter()
+        Profiler.level = level
+        logger.debug('Profiling level: '+LEVELS[level])
+        if level >= 2 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @staticmethod
+    @contextmanager
+    def measure(kind, name):
+        """ Measures the time and memory used by the enclosed block """
+        if not Profiler.level:
+            yield
+            return
+        tls = Profiler._tls
+        depth = getattr(tls, 'depth', 0)
+        tls.depth = depth+1
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            token = object()
+            with Profiler._mem_lock:
+                mem_start, peak = tracemalloc.get_traced_memory()
+                if HAS_RESET_PEAK:
+                    # Keep the peak for the steps that contain this one
+                    for k, v in Profiler._mem_peaks.items():
+                        Profiler._mem_peaks[k] = max(v, peak)
+                    Profiler._mem_peaks[token] = 0
+                    tracemalloc.reset_peak()
+        child_start = children_time()
+        cpu_start = process_time()
+        wall_start = perf_counter()
+        try:
+            yield
+        finally:
+            wall = perf_counter()-wall_start
+            cpu = process_time()-cpu_start
+            child = children_time()-child_start
+            tls.depth = depth
+            rec = {'kind': kind, 'name': name, 'depth': depth, 'start': round(wall_start-Profiler._start, 4),
+                   'wall': round(wall, 4), 'cpu': round(cpu, 4), 'children': round(child, 4)}
+            if tracing:
+                with Profiler._mem_lock:
+                    cur, peak = tracemalloc.get_traced_memory()
+                    if HAS_RESET_PEAK:
+                        peak = max(Profiler._mem_peaks.pop(token), peak)
+                rec['py_mem_delta_kb'] = (cur-mem_start)//1024
+                if HAS_RESET_PEAK:
+                    # Peak during this step, relative to the memory used at the start
+                    rec['py_mem_peak_kb'] = (peak-mem_start)//1024
+            Profiler.records.append(rec)
+
+    @staticmethod
+    @contextmanager
+    def output(name):
+        """ Measures an output, also collects cProfile stats when requested.
+            Outputs that run other outputs are profiled as a whole, the stats go to the top level output """
+        with Profiler.measure('run', name):
+            if Profiler.level < 3 or Profiler._cprofile_active:
+                yield
+                return
+            import cProfile
+            pr = cProfile.Profile()
+            pr.enable()
+            Profiler._cprofile_active = True
+            try:
+                yield
+            finally:
+                pr.disable()
+                Profiler._cprofile_active = False
+                dest = os.path.join(GS.out_dir, CPROFILE_DIR)
+                os.makedirs(dest, exist_ok=True)
+                fname = os.path.join(dest, name+'.prof')
+                pr.dump_stats(fname)
+                logger.debug('cProfile stats for `{}` saved to {}'.format(name, fname))
+
+    @staticmethod
+    def summary():
+        """ Human readable summary """
+        recs = Profiler.records
+        total = perf_counter()-Profiler._start
+        lines = ['KiBot profile', '', 'Total wall time: {:.3f} s'.format(total)]
+        if resource:
+            rss = get_max_rss(resource.RUSAGE_SELF)
+            lines.append('Process peak RSS: {} KiB (children: {} KiB)'.format(rss, get_max_rss(resource.RUSAGE_CHILDREN)))
+        lines.append('')
+        # Totals by kind, only top level steps to avoid counting twice
+        kinds = {}
+        for r in recs:
+            if not r['depth']:
+                k = kinds.setdefault(r['kind'], [0, 0.0, 0.0, 0.0])
+                k[0] += 1
+                k[1] += r['wall']
+                k[2] += r['cpu']
+                k[3] += r['children']
+        fmt = '{:<12} {:>6} {:>10} {:>10} {:>10}'
+        lines.append(fmt.format('Kind', 'Count', 'Wall [s]', 'CPU [s]', 'Child [s]'))
+        for kind, v in sorted(kinds.items(), key=lambda x: x[1][1], reverse=True):
+            lines.append(fmt.format(kind, v[0], '{:.3f}'.format(v[1]), '{:.3f}'.format(v[2]), '{:.3f}'.format(v[3])))
+        lines.append('')
+        # All the steps, slower first
+        fmt = '{:<10} {:<40} {:>10} {:>10} {:>10} {:>12} {:>13}'
+        lines.append(fmt.format('Kind', 'Name', 'Wall [s]', 'CPU [s]', 'Child [s]', 'Py mem [KiB]', 'Py peak [KiB]'))
+        for r in sorted(recs, key=lambda x: x['wall'], reverse=True):
+            name = ' '*r['depth']+r['name']
+            if len(name) > 40:
+                name = name[:37]+'...'
+            lines.append(fmt.format(r['kind'], name, '{:.3f}'.format(r['wall']), '{:.3f}'.format(r['cpu']),
+                                    '{:.3f}'.format(r['children']), str(r.get('py_mem_delta_kb', '-')),
+                                    str(r.get('py_mem_peak_kb', '-'))))
+        return '\n'.join(lines)+'\n'
+
+    @staticmethod
+    def save():
+        """ Writes the JSON data and the human readable summary to the output dir """
+        if not Profiler.level:
+            return
+        os.makedirs(GS.out_dir, exist_ok=True)
+        data = {'level': LEVELS[Profiler.level], 'total_wall': round(perf_counter()-Profiler._start, 4),
+                'steps': Profiler.records}
+        if resource:
+            # Process wide peaks, getrusage can't measure a step
+            data['max_rss_kb'] = get_max_rss(resource.RUSAGE_SELF)
+            data['children_max_rss_kb'] = get_max_rss(resource.RUSAGE_CHILDREN)
+        fname = os.path.join(GS.out_dir, JSON_NAME)
+        with open(fname, 'wt') as f:
+            json.dump(data, f, indent=2)
+        with open(os.path.join(GS.out_dir, TEXT_NAME), 'wt') as f:
+            f.write(Profiler.summary())
+        logger.info('Profiling data saved to '+fname)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# Copyright (c) 2024 Instituto Nacional de Tecnología Industrial
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+"""
+Content addressed cache for the PCB/SCH renders used by the `diff` and `kiri` outputs.
+The entries are keyed by the git blob ids of the files involved (PCB, every sub-sheet and the project),
+so we don't need a checkout to know if something was already rendered.
+The same key is computed for files outside the repo, so renders are shared between commits, files, variants
+and runs.
+"""
+from hashlib import sha1
+import os
+import re
+from shutil import copytree, rmtree
+from .gs import GS
+from . import log
+
+logger = log.get_logger()
+# Sub-sheets in KiCad 6+ (`Sheet file` for 6 and `Sheetfile` for 7+) and KiCad 5 schematics
+SHEET_V6 = re.compile(r'\(property\s+"Sheet ?file"\s+"((?:[^"\\]|\\.)*)"')
+SHEET_V5 = re.compile(r'^F1\s+"([^"]*)"', re.MULTILINE)
+MISSING = 'missing'
+
+
+def blob_id(data):
+    """ The id git uses for a blob with this content """
+    h = sha1(b'blob %d\0' % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+def file_blob_id(fname):
+    """ Git blob id for a file in the file system """
+    try:
+        with open(fname, 'rb') as f:
+            return blob_id(f.read())
+    except OSError:
+        return MISSING
+
+
+def sch_sheets(fname, read):
+    """ Names of all the sheets used by a schematic, starting with `fname`.
+        `read` is a function returning the text for a file name, or None if missing.
+        This is much faster than loading the schematic, we just need the names """
+    files = []
+    pending = [os.path.normpath(fname)]
+    while pending:
+        name = pending.pop(0)
+        if name in files:
+            continue
+        files.append(name)
+        text = read(name)
+        if not text:
+            continue
+        reg = SHEET_V5 if name.endswith('.sch') else SHEET_V6
+        base_dir = os.path.dirname(name)
+        for sub in reg.findall(text):
+            pending.append(os.path.normpath(os.path.join(base_dir, sub.replace('\\"', '"'))))
+    return files
+
+
+def read_text(fname):
+    try:
+        with open(fname, 'rt', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class RenderCache(object):
+    """ Static class, just a placeholder for the cache functions """
+    # Keys used during this run, never evicted
+    used = set()
+
+    @staticmethod
+    def enabled():
+        return bool(GS.global_diff_cache_size)
+
+    @staticmethod
+    def get_root():
+        root = os.environ.get('KIBOT_DIFF_CACHE')
+        if root is None:
+            root = os.path.join(os.path.expanduser('~'), '.cache', 'kibot', 'diff')
+        return os.path.abspath(root)
+
+    @staticmethod
+    def make_key(*parts):
+        return sha1('\n'.join(map(str, parts)).encode()).hexdigest()
+
+    @staticmethod
+    def fetch(key, dest):
+        """ Copies the entry for `key` to `dest`. Returns False if we don't have it """
+        entry = os.path.join(RenderCache.get_root(), key)
+        if not os.path.isdir(entry):
+            return False
+        logger.debug(f'- Using cached render {key} for {dest}')
+        if os.path.isdir(dest):
+            rmtree(dest)
+        copytree(entry, dest, symlinks=True)
+        # Mark it as recently used
+        os.utime(entry)
+        RenderCache.used.add(key)
+        return True
+
+    @staticmethod
+    def has(key):
+        return os.path.isdir(os.path.join(RenderCache.get_root(), key))
+
+    @staticmethod
+    def store(key, src):
+        """ Stores a copy of the `src` dir using `key` """
+        if not os.path.isdir(src):
+            return
+        root = RenderCache.get_root()
+        entry = os.path.join(root, key)
+        RenderCache.used.add(key)
+        if os.path.isdir(entry):
+            return
+        os.makedirs(root, exist_ok=True)
+        # Copy to a temporal and then rename, the cache can be shared by concurrent runs
+        tmp = os.path.join(root, '.tmp-'+key+'-'+str(os.getpid()))
+        copytree(src, tmp, symlinks=True)
+        try:
+            os.rename(tmp, entry)
+            logger.debug(f'- Render for {src} cached as {key}')
+        except OSError:
+            # Another process stored it
+            rmtree(tmp, ignore_errors=True)
+
+    @staticmethod
+    def evict():
+        """ Removes the least recently used entries until we are below the size limit """
+        root = RenderCache.get_root()
+        if not RenderCache.enabled() or not os.path.isdir(root):
+            return
+        limit = GS.global_diff_cache_size*1024*1024
+        entries = []
+        total = 0
+        for name in os.listdir(root):
+            entry = os.path.join(root, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = 0
+            for dirpath, _, files in os.walk(entry):
+                for f in files:
+                    try:
+                        size += os.lstat(os.path.join(dirpath, f)).st_size
+                    except OSError:
+                        pass
+            entries.append((os.stat(entry).st_mtime, name, size))
+            total += size
+        logger.debug(f'Diff renders cache: {len(entries)} entries, {total//1024} KiB')
+        if total <= limit:
+            return
+        for _, name, size in sorted(entries):
+            if name in RenderCache.used:
+                continue
+            logger.debug(f'- Removing cached render {name} ({size//1024} KiB)')
+            rmtree(os.path.join(root, name), ignore_errors=True)
+            total -= size
+            if total <= limit:
+                break
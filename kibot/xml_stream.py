@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024 Salvador E. Tropea
+# Copyright (c) 2024 Instituto Nacional de Tecnología Industrial
+# License: AGPL-3.0
+# Project: KiBot (formerly KiPlot)
+"""
+Streaming XML writer.
+Generates the same output as `xml.dom.minidom` `toprettyxml`, but without keeping the document in memory.
+Elements are written as soon as we know if they have children, the text is only allowed for elements without children.
+"""
+from contextlib import contextmanager
+# Flush the buffer when it gets this size (characters)
+BUFFER_SIZE = 65536
+
+
+def escape(text):
+    """ The escaping used by minidom, for attributes and text """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+class XMLWriter(object):
+    def __init__(self, fhandle, indent='\t', encoding='utf-8'):
+        """ `fhandle` is a binary file """
+        super().__init__()
+        self.f = fhandle
+        self.indent = indent
+        self.encoding = encoding
+        self.buffer = []
+        self.size = 0
+        # Stack of open elements: [tag, has_children]
+        self.stack = []
+        self.write(f'<?xml version="1.0" encoding="{encoding}"?>\n')
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.f.write(''.join(self.buffer).encode(self.encoding, 'xmlcharrefreplace'))
+            self.buffer = []
+            self.size = 0
+
+    def _open_tag(self, tag, attrs):
+        """ Writes the opening tag, without the final `>`. Also closes the opening tag of the parent """
+        if self.stack:
+            parent = self.stack[-1]
+            if not parent[1]:
+                parent[1] = True
+                self.write('>\n')
+        self.write(self.indent*len(self.stack)+'<'+tag)
+        if attrs:
+            for name, value in (attrs.items() if isinstance(attrs, dict) else attrs):
+                self.write(' '+name+'="'+escape(value)+'"')
+
+    def start(self, tag, attrs=None):
+        """ Opens an element that can have children, `attrs` is a dict or a list of (name, value) """
+        self._open_tag(tag, attrs)
+        self.stack.append([tag, False])
+
+    def end(self):
+        """ Closes the last element opened by `start` """
+        tag, has_children = self.stack.pop()
+        if has_children:
+            self.write(self.indent*len(self.stack)+'</'+tag+'>\n')
+        else:
+            self.write('/>\n')
+
+    def element(self, tag, text=None, attrs=None):
+        """ Writes an element without children """
+        self._open_tag(tag, attrs)
+        if text:
+            self.write('>'+escape(text)+'</'+tag+'>\n')
+        else:
+            self.write('/>\n')
+
+    @contextmanager
+    def tag(self, tag, attrs=None):
+        """ `with` wrapper for `start`/`end` """
+        self.start(tag, attrs)
+        yield self
+        self.end()
+
+    def close(self):
+        """ Closes all the open elements and writes the pending data """
+        while self.stack:
+            self.end()
+        self.flush()
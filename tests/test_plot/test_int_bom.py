@@ -447,6 +447,13 @@ def test_int_bom_simple_html_colored_rows(test_dir):
     ctx.search_in_file(outf, ['Color reference for rows'], sub=True)
 
 
+def test_int_bom_simple_html_page_size(test_dir):
+    """ The big tables are shown in pages, the content is the same """
+    (rows, headers, sh_head), prj, ctx = simple_html_setup(test_dir, 'int_bom_simple_html_page_size')
+    ctx.search_in_file(prj+'-bom.html', [r'\}\)\(document, 2\)', 'page-nav'], sub=True)
+    simple_html_test(ctx, rows, headers, sh_head, prj)
+
+
 def adapt_xml(h):
     h = h.replace(' ', '_')
     h = h.replace('"', '')
@@ -490,6 +497,13 @@ def test_int_bom_simple_xlsx_1(test_dir):
     simple_xlsx_verify(ctx, prj, extra_info=['Extra 1: '+prj, 'Extra 2: 2020-03-12'])
 
 
+def test_int_bom_simple_xlsx_constant_memory(test_dir):
+    """ Same as test_int_bom_simple_xlsx_1, but writing the rows in order """
+    prj = 'kibom-test'
+    ctx = context.TestContextSCH(test_dir, prj, 'int_bom_simple_xlsx_constant_memory', BOM_DIR)
+    simple_xlsx_verify(ctx, prj, extra_info=['Extra 1: '+prj, 'Extra 2: 2020-03-12'])
+
+
 def get_column(rows, col, split=True):
     components = []
     for r in rows:
@@ -1348,6 +1362,32 @@ def test_int_bom_variant_t1(test_dir):
     ctx.clean_up()
 
 
+def test_int_bom_variant_t1_variants(test_dir):
+    """ All the variants from one output, same results as test_int_bom_variant_t1 """
+    prj = 'kibom-variante'
+    ctx = context.TestContextSCH(test_dir, prj, 'int_bom_var_t1_variants_csv', BOM_DIR)
+    ctx.run()
+    rows, header, info = ctx.load_csv(prj+'-bom_(V1).csv')
+    ref_column = header.index(REF_COLUMN_NAME)
+    check_kibom_test_netlist(rows, ref_column, 2, ['R3', 'R4'], ['R1', 'R2'])
+    VARIANTE_PRJ_INFO[1] = 't1_v1'
+    check_csv_info(info, VARIANTE_PRJ_INFO, [4, 20, 2, 1, 2])
+    rows, header, info = ctx.load_csv(prj+'-bom_(V2).csv')
+    check_kibom_test_netlist(rows, ref_column, 1, ['R2', 'R4'], ['R1', 'R3'])
+    VARIANTE_PRJ_INFO[1] = 't1_v2'
+    check_csv_info(info, VARIANTE_PRJ_INFO, [3, 20, 2, 1, 2])
+    rows, header, info = ctx.load_csv(prj+'-bom_V3.csv')
+    check_kibom_test_netlist(rows, ref_column, 1, ['R2', 'R3'], ['R1', 'R4'])
+    rows, header, info = ctx.load_csv(prj+'-bom_bla_bla.csv')
+    check_kibom_test_netlist(rows, ref_column, 1, ['R2', 'R3'], ['R1', 'R4'])
+    # One file with the quantities for each variant
+    rows, header, info = ctx.load_csv(prj+'-bom_columns.csv')
+    check_kibom_test_netlist(rows, ref_column, 2, None, ['R1', 'R2', 'R3', 'R4'])
+    qtys = {r[ref_column]: r[-4:] for r in rows}
+    assert qtys == {'R1 R3 R4': ['1', '2', '2', '2'], 'R2': ['1', '0', '0', '0']}
+    ctx.clean_up()
+
+
 def check_value(rows, r_col, ref, v_col, val):
     for r in rows:
         refs = r[r_col].split(' ')
@@ -2058,3 +2058,61 @@ def test_report_variant_t1(test_dir):
     ctx.search_in_file(prj+'-report.txt', [r'|\s+Total\s+|\s+40\s+|\s+52'])
     ctx.search_in_file(prj+'-report_(V1).txt', [r'|\s+Total\s+|\s+4\s+|\s+5\.'])
     ctx.clean_up()
+
+
+def test_profile(test_dir):
+    prj = '3Rs'
+    ctx = context.TestContext(test_dir, prj, 'pre_and_position', POS_DIR)
+    ctx.run(extra=['--profile', '-s', 'all', 'pos_ascii'])
+    ctx.expect_out_file(['kibot_profile.json', 'kibot_profile.txt'])
+    ctx.search_in_file('kibot_profile.txt', [r'run\s+pos_ascii', r'load\s+PCB 3Rs'])
+    ctx.clean_up()
+
+
+def read_tree(path):
+    """ Content of all the files inside `path` """
+    files = {}
+    for dir, _, names in os.walk(path):
+        for name in names:
+            fname = os.path.join(dir, name)
+            with open(fname, 'rb') as f:
+                files[os.path.relpath(fname, path)] = f.read()
+    return files
+
+
+def test_navigate_results_cache(test_dir):
+    """ Navigate Results using the images cache. The second run must use the cached images and create the same
+        pages. A broken image must fallback to the file type icon """
+    prj = 'bom'
+    ctx = context.TestContext(test_dir, prj, 'navigate_results_cache', 'Browse')
+    src = ctx.get_out_path('src')
+    os.makedirs(src, exist_ok=True)
+    shutil.copy2(os.path.join('tests', 'reference', '7_0_0', 'kibom-variant_3-top.png'), os.path.join(src, 'ok.png'))
+    with open(os.path.join(src, 'bad.png'), 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\nNot really a PNG')
+    cache = ctx.get_out_path('cache')
+    browse = ctx.get_out_path('Browse')
+    os.environ['KIBOT_NAVIGATE_CACHE'] = cache
+    try:
+        ctx.run()
+        first = read_tree(browse)
+        cached = sorted(os.listdir(cache))
+        assert cached
+        # Make the cached images old, using them marks them as recently used
+        for name in cached:
+            os.utime(os.path.join(cache, name), (1, 1))
+        shutil.rmtree(browse)
+        ctx.run()
+    finally:
+        del os.environ['KIBOT_NAVIGATE_CACHE']
+    # All the images came from the cache
+    assert sorted(os.listdir(cache)) == cached
+    for name in cached:
+        assert os.path.getmtime(os.path.join(cache, name)) > 1
+    assert read_tree(browse) == first
+    # The good image is converted, the broken one uses the icon
+    pages = [n for n in first.keys() if n.endswith('.html')]
+    html = ''.join(first[n].decode() for n in pages)
+    assert re.search(r'<img src="images/cat_images_ok.png" alt="ok.png"', html)
+    assert re.search(r'<img src="images/file_png_64.(png|svg)" alt="bad.png"', html)
+    ctx.clean_up()
@@ -4,27 +4,44 @@ import re
 import pytest
 import coverage
 import logging
+import math
 import requests
 import subprocess
 import sys
+import threading
+import time
+import urllib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from . import context
 from kibot.layer import Layer
 from kibot.pre_base import BasePreFlight
-from kibot.out_base import BaseOutput
+from kibot.error import PlotError
+from kibot.out_base import BaseOutput, VariantOptions
 from kibot.gs import GS
 from kibot.kiplot import load_actions, _import, load_board, generate_makefile
 from kibot.dep_downloader import search_as_plugin
 from kibot.registrable import RegOutput, RegFilter
-from kibot.misc import (WRONG_INSTALL, BOM_ERROR, DRC_ERROR, ERC_ERROR, PDF_PCB_PRINT, KICAD2STEP_ERR)
+from kibot.misc import (WRONG_INSTALL, BOM_ERROR, DRC_ERROR, ERC_ERROR, PDF_PCB_PRINT, KICAD2STEP_ERR, PLOT_ERROR)
 from kibot.bom.columnlist import ColumnList
 from kibot.bom.units import get_prefix, comp_match
 import kibot.bom.units as units
+import kibot.bom.electro_grammar as electro_grammar
+import kibot.kicad.v6_sch as v6_sch
 from kibot.bom.electro_grammar import parse
 from kibot.__main__ import detect_kicad
 from kibot.kicad.config import KiConf
 from kibot.globals import Globals
 from kibot.PcbDraw.unit import read_resistance
+from kibot.PcbDraw.plot import PcbPlotter, PlotComponents
+from kibot.PcbDraw.pcbnew_transition import pcbnew
 from kibot.out_download_datasheets import Download_Datasheets_Options
+from kibot.out_base_3d import Base3DOptions
+from kibot.kicad.v5_sch import SchematicComponent, SchematicField
+from kibot.kicad.lib_index import LibIndex
+from kibot.profiler import Profiler
+from kibot import __version__ as kibot_version
+from kibot.render_cache import RenderCache, blob_id, file_blob_id, read_text, sch_sheets, MISSING
+import kibot.kicad.lib_index as lib_index
 
 cov = coverage.Coverage()
 mocked_check_output_FNF = True
@@ -414,6 +431,25 @@ def test_units_1():
         assert a.extra['tolerance'] == 1
 
 
+@pytest.mark.indep
+def test_units_cache(test_dir, monkeypatch):
+    ctx = context.TestContext(test_dir, 'test_v5', 'empty_zip', '')
+    monkeypatch.setenv('KIBOT_VALUES_CACHE', ctx.get_out_path('values.json'))
+    values = ["3k3 1% 0805", "0R5", "1/8", "100nF 10% 50V X7R", "bogus"]
+    with context.cover_it(cov):
+        monkeypatch.setattr(units, 'parser_cache', None)
+        monkeypatch.setattr(units, 'parser_cache_changed', False)
+        ref = [comp_match(v, 'R') for v in values]
+        units.save_parser_cache()
+        # Load it from disk
+        monkeypatch.setattr(units, 'parser_cache', None)
+        monkeypatch.setattr(units, 'parse_value', None)
+        for v, r in zip(values, ref):
+            c = comp_match(v, 'R')
+            assert (c is None and r is None) or (str(c) == str(r) and c.extra == r.extra)
+    ctx.clean_up()
+
+
 @pytest.mark.indep
 def test_read_resistance():
     with context.cover_it(cov):
@@ -565,6 +601,34 @@ def test_electro_grammar_1():
                 logging.debug(c+" Ok")
 
 
+@pytest.mark.indep
+def test_electro_grammar_fast(test_dir, monkeypatch):
+    """ The LALR subset must give the same result as the full grammar """
+    ctx = context.TestContext(test_dir, 'test_v5', 'empty_zip', '')
+    monkeypatch.setenv('KIBOT_GRAMMAR_CACHE', ctx.get_out_path('electro_lalr.cache'))
+    values = ['C 100nF 10% 50V X7R 0603', 'C 100p 0805 NPO 50V', 'C 1uF, 0603; ±30%', 'C 1n5F 0603 c0g/np0', 'C 4.7uF 6V3',
+              'R 12k 1% 0402 1/8W', 'R 0.01 5%', 'R 1M 10%', 'R 4k7 250mW 1206', 'R 1meg 2512', 'R 10Ω 3216 1W',
+              'L 3n3 0603 10%', 'L 1nH 100V', 'L 10uH 1008']
+    with context.cover_it(cov):
+        monkeypatch.setattr(electro_grammar, 'fast_parser', None)
+        electro_grammar.initialize()
+        assert os.path.isfile(ctx.get_out_path('electro_lalr.cache'))
+        # Load it from the cache
+        monkeypatch.setattr(electro_grammar, 'fast_parser', None)
+        electro_grammar.initialize()
+        for v in values:
+            electro_grammar.fast_parser.parse(v)
+            full = electro_grammar.ComponentTransformer()
+            full.transform(electro_grammar.get_parser().parse(v))
+            full.parsed.update(full.extra)
+            assert parse(v, with_extra=True) == full.parsed, v
+        # Not in the subset
+        with pytest.raises(Exception):
+            electro_grammar.fast_parser.parse('C 100 nF 0603')
+        assert parse('C 100 nF 0603') == {'type': 'capacitor', 'capacitance': 100e-9, 'size': '0603'}
+    ctx.clean_up()
+
+
 class Comp:
     def __init__(self):
         self.ref = 'R1'
@@ -633,3 +697,784 @@ def test_ds_net_error(test_dir, caplog, monkeypatch):
             caplog.clear()
             o.download(c, '6', 'pp', '1N1234', None)
             assert 'Hello!' in caplog.text
+
+
+def raster_rects(rects, x0, y0, step, n):
+    """ Rasterizes rectangles, a pixel is set if its center is inside a rectangle """
+    img = [bytearray(n) for _ in range(n)]
+    for xa, ya, xb, yb in rects:
+        xa, xb = sorted((xa, xb))
+        ya, yb = sorted((ya, yb))
+        c0 = max(0, math.ceil((xa-x0)/step-0.5))
+        c1 = min(n, math.ceil((xb-x0)/step-0.5))
+        for r in range(max(0, math.ceil((ya-y0)/step-0.5)), min(n, math.ceil((yb-y0)/step-0.5))):
+            img[r][c0:c1] = b'\x01'*(c1-c0)
+    return img
+
+
+def qr_fp_rects(mod):
+    rects = []
+    for poly in mod:
+        xs = [p[1] for p in poly[1][1:]]
+        ys = [p[2] for p in poly[1][1:]]
+        rects.append((min(xs), min(ys), max(xs), max(ys)))
+    return rects
+
+
+def qr_sym_rects(mod):
+    rects = []
+    for rect in mod:
+        start = next(e for e in rect if isinstance(e, list) and e[0].value() == 'start')
+        end = next(e for e in rect if isinstance(e, list) and e[0].value() == 'end')
+        rects.append((start[1], start[2], end[1], end[2]))
+    return rects
+
+
+@pytest.mark.indep
+def test_qr_lib_rectangles(monkeypatch):
+    """ The QR drawn using rectangles must be the same we get using one square for each module """
+    qrcodegen = pytest.importorskip('qrcodegen')
+    with context.cover_it(cov):
+        load_actions()
+        o = RegOutput.get_class_for('qr_lib')().options()
+        # A version 40 QR
+        qrc = qrcodegen.QrCode.encode_text('KiBot '*480, qrcodegen.QrCode.Ecc.LOW)
+        assert qrc.get_version() == 40
+        full_size = 15
+        step = 0.02
+        n = round(full_size/step)+8
+        for negative in (False, True):
+            size = qrc.get_size()+2*negative
+            size_rect = round(full_size/size, 2)
+            center = round(full_size/2, 2)
+            modules = o.qr_draw_fp(size, size_rect, center, qrc, negative, 'F.SilkS', do_sep=False)
+            rects = o.qr_draw_fp(size, size_rect, center, qrc, negative, 'F.SilkS', do_sep=False, geometry='rectangles')
+            logging.debug(f'Footprint polygons: {len(modules)} -> {len(rects)}')
+            assert len(rects) < len(modules)/2
+            img_modules = raster_rects(qr_fp_rects(modules), -center-4*step, -center-4*step, step, n)
+            assert any(any(r) for r in img_modules)
+            assert img_modules == raster_rects(qr_fp_rects(rects), -center-4*step, -center-4*step, step, n)
+        # The symbols are written using the KiCad 7 format
+        monkeypatch.setattr(v6_sch, 'version', v6_sch.KICAD_7_VER)
+        size = qrc.get_size()
+        size_rect = round(full_size/size, 2)
+        center = round(full_size/2, 2)
+        modules = o.qr_draw_sym(size, size_rect, center, qrc, do_sep=False)
+        rects = o.qr_draw_sym(size, size_rect, center, qrc, do_sep=False, geometry='rectangles')
+        logging.debug(f'Symbol rectangles: {len(modules)} -> {len(rects)}')
+        assert len(rects) < len(modules)/2
+        img_modules = raster_rects(qr_sym_rects(modules), -center-4*step, -center-4*step, step, n)
+        assert img_modules == raster_rects(qr_sym_rects(rects), -center-4*step, -center-4*step, step, n)
+
+
+@pytest.mark.indep
+def test_image_ops(test_dir):
+    """ In-process crop and chroma key, as done by ImageMagick """
+    Image = pytest.importorskip('PIL.Image')
+    pytest.importorskip('numpy')
+    ctx = context.TestContext(test_dir, 'test_v5', 'empty_zip', '')
+    with context.cover_it(cov):
+        from kibot import image_ops
+        assert not image_ops.needs_convert(chroma_key=True)
+        fname = ctx.get_out_path('image_ops.png')
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        img = Image.new('RGB', (200, 100), (0, 255, 0))
+        img.paste((200, 30, 30), (50, 20, 121, 71))
+        # A region close to the chroma key color
+        img.paste((20, 240, 20), (60, 30, 71, 41))
+        img.save(fname)
+        image_ops.trim(fname)
+        img = Image.open(fname)
+        assert img.size == (71, 51)
+        image_ops.chroma_key(fname, (0, 255, 0), 15)
+        img = Image.open(fname)
+        assert img.mode == 'RGBA'
+        assert img.getpixel((0, 0)) == (200, 30, 30, 255)
+        assert img.getpixel((15, 15))[3] == 0
+        image_ops.resize_width(fname, 142)
+        assert Image.open(fname).size == (142, 102)
+        # Transparent background
+        img = Image.new('RGBA', (50, 50), (0, 0, 0, 0))
+        img.paste((1, 2, 3, 255), (10, 10, 20, 30))
+        img.save(fname)
+        image_ops.trim(fname)
+        assert Image.open(fname).size == (10, 20)
+    ctx.clean_up()
+
+
+@pytest.mark.indep
+def test_xml_stream():
+    """ The streaming XML writer must generate the same as minidom """
+    from io import BytesIO
+    from xml.etree.ElementTree import Element, SubElement, tostring
+    from xml.dom import minidom
+    with context.cover_it(cov):
+        from kibot.xml_stream import XMLWriter
+        root = Element('export')
+        root.set('version', 'E')
+        comps = SubElement(root, 'components')
+        SubElement(comps, 'empty')
+        comp = SubElement(comps, 'comp')
+        comp.set('ref', 'R<1> & "2"')
+        SubElement(comp, 'value').text = '10k & <ñ>'
+        SubElement(comp, 'datasheet').text = ''
+        SubElement(SubElement(comp, 'fields'), 'field').set('name', 'x')
+        SubElement(root, 'nets')
+        ref = minidom.parseString(tostring(root, encoding='utf8').decode('utf8')).toprettyxml(indent="  ", encoding='UTF-8')
+        f = BytesIO()
+        xml = XMLWriter(f, indent='  ', encoding='UTF-8')
+        with xml.tag('export', {'version': 'E'}):
+            xml.start('components')
+            xml.start('empty')
+            xml.end()
+            xml.start('comp', (('ref', 'R<1> & "2"'),))
+            xml.element('value', '10k & <ñ>')
+            xml.element('datasheet', '')
+            with xml.tag('fields'):
+                xml.element('field', attrs=(('name', 'x'),))
+            xml.end()
+            xml.end()
+            xml.start('nets')
+        xml.close()
+    assert f.getvalue() == ref
+
+
+class FakeBBox(object):
+    def __init__(self, w, h):
+        self.w = w
+        self.h = h
+
+    def GetX(self):
+        return 0
+
+    def GetY(self):
+        return 0
+
+    def GetWidth(self):
+        return self.w
+
+    def GetHeight(self):
+        return self.h
+
+
+class FakeBoard(object):
+    def ComputeBoundingBox(self, aBoardEdgesOnly=False):
+        return FakeBBox(pcbnew.FromMM(10), pcbnew.FromMM(10))
+
+
+@pytest.mark.indep
+def test_pcbdraw_compose(test_dir):
+    """ The images composed from the cached layers must have the same size as the ones from plot().
+        Here the second instance of a footprint hangs past the board edge, and we only show it """
+    lib = os.path.join(test_dir, 'pcbdraw_compose', 'default', 'test')
+    os.makedirs(lib, exist_ok=True)
+    with open(os.path.join(lib, 'big.svg'), 'wt') as f:
+        f.write('<?xml version="1.0" standalone="no"?>\n'
+                '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="30mm" height="10mm" viewBox="0 0 30 10">\n'
+                ' <path d="M 0 0 L 30 0 L 30 10 L 0 10 Z" style="fill:#000000"/>\n'
+                ' <rect id="origin" x="0" y="0" width="0" height="0"/>\n'
+                '</svg>\n')
+    components = [('test', 'big', 'R1', '1k', (0, 0, 0)), ('test', 'big', 'R2', '1k', (pcbnew.FromMM(50), 0, 0))]
+
+    def create_plotter(components_filter):
+        plotter = PcbPlotter(FakeBoard())
+        plotter.data_path = [os.path.dirname(os.path.dirname(lib))]
+        plotter.libs = ['default']
+        plotter.compute_bbox = True
+        plotter.plot_plan = [PlotComponents(filter=components_filter)]
+        plotter.walk_components = lambda invert_side, callback: [callback(*c) for c in components if not invert_side]
+        return plotter
+
+    def only_r2(ref):
+        return ref == 'R2'
+
+    with context.cover_it(cov):
+        plotter = create_plotter(lambda ref: True)
+        layers = plotter.plot_layers()
+        composed = plotter.compose(layers, only_r2, lambda ref: False)
+        plotted = create_plotter(only_r2).plot()
+    view_box = composed.getroot().attrib['viewBox']
+    logging.debug(f'compose: {view_box} plot: {plotted.getroot().attrib["viewBox"]}')
+    assert view_box == plotted.getroot().attrib['viewBox']
+    # Only the 30 mm wide R2 (at 50 mm) is drawn, no substrate in the plan
+    assert [round(float(v)) for v in view_box.split()] == [50, 0, 30, 10]
+
+
+class StubPreFlight(BasePreFlight):
+    """ A preflight that just logs when it starts and ends """
+    def __init__(self, name, log, reads=None, writes=None, concurrent=False, barrier=None, fail=False):
+        super().__init__()
+        self.type = name
+        self._reads = reads
+        self._writes = writes
+        self._concurrent = concurrent
+        self._log = log
+        self._barrier = barrier
+        self._fail = fail
+
+    def run(self):
+        self._log.append('+'+self.type)
+        if self._barrier is not None:
+            # Both preflights must be running at the same time to pass it
+            self._barrier.wait(timeout=10)
+        if self._fail:
+            raise PlotError('Stub failure')
+        self._log.append('-'+self.type)
+
+
+def run_stub_preflights(workers, pres):
+    old_workers = GS.global_preflight_workers
+    GS.global_preflight_workers = workers
+    try:
+        with context.cover_it(cov):
+            BasePreFlight.run_all([(p.type, p) for p in pres])
+    finally:
+        GS.global_preflight_workers = old_workers
+
+
+@pytest.mark.indep
+def test_preflight_conflicts():
+    log = []
+    erc = StubPreFlight('erc', log, reads={'sch', 'pro'}, writes=set())
+    drc = StubPreFlight('drc', log, reads={'pcb', 'pro'}, writes=set())
+    annotate = StubPreFlight('annotate_power', log, reads={'sch'}, writes={'sch'})
+    unknown = StubPreFlight('unknown', log)
+    filters = StubPreFlight('filters', log, reads=set(), writes=set())
+    with context.cover_it(cov):
+        # Readers of different things, or readers of the same thing, can run together
+        assert not erc.conflicts_with(drc)
+        assert not erc.conflicts_with(erc)
+        # Modifying what the other reads
+        assert erc.conflicts_with(annotate)
+        assert annotate.conflicts_with(erc)
+        assert not drc.conflicts_with(annotate)
+        # Undeclared preflights conflict with anything that uses the files
+        assert unknown.conflicts_with(erc)
+        assert drc.conflicts_with(unknown)
+        assert unknown.conflicts_with(unknown)
+        assert not unknown.conflicts_with(filters)
+
+
+@pytest.mark.indep
+def test_preflight_run_all():
+    log = []
+    barrier = threading.Barrier(2)
+    pres = [StubPreFlight('erc', log, reads={'sch', 'pro'}, writes=set(), concurrent=True, barrier=barrier),
+            StubPreFlight('drc', log, reads={'pcb', 'pro'}, writes=set(), concurrent=True, barrier=barrier),
+            StubPreFlight('unknown', log),
+            StubPreFlight('update_xml', log, reads={'sch', 'pro'}, writes=set(), concurrent=True)]
+    run_stub_preflights(4, pres)
+    # erc and drc run at the same time (the barrier), the undeclared one waits for them and blocks update_xml
+    assert sorted(log[:2]) == ['+drc', '+erc']
+    assert sorted(log[2:4]) == ['-drc', '-erc']
+    assert log[4:] == ['+unknown', '-unknown', '+update_xml', '-update_xml']
+    # The default is to run them in order
+    log.clear()
+    for p in pres:
+        p._barrier = None
+    run_stub_preflights(None, pres)
+    assert log == ['+erc', '-erc', '+drc', '-drc', '+unknown', '-unknown', '+update_xml', '-update_xml']
+
+
+@pytest.mark.indep
+def test_preflight_run_all_error():
+    """ An error in a worker thread stops the run with the proper exit code """
+    log = []
+    pres = [StubPreFlight('erc', log, reads={'sch', 'pro'}, writes=set(), concurrent=True, fail=True),
+            StubPreFlight('drc', log, reads={'pcb', 'pro'}, writes=set(), concurrent=True),
+            StubPreFlight('unknown', log)]
+    with pytest.raises(SystemExit) as e:
+        run_stub_preflights(2, pres)
+    assert e.value.code == PLOT_ERROR
+    # The undeclared preflight must wait for erc, so it never runs
+    assert '+unknown' not in log
+    assert '-erc' not in log
+
+
+class ModelsServer(BaseHTTPRequestHandler):
+    """ Serves the `files` dict, counting the requests and how many are served at the same time """
+    files = {}
+    requests = {}
+    running = [0, 0]  # Current and maximum
+    lock = threading.Lock()
+
+    def do_GET(self):
+        name = urllib.parse.unquote_plus(self.path[1:])
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0)+1
+            self.running[0] += 1
+            self.running[1] = max(self.running)
+        # Give time to the other workers
+        time.sleep(0.1)
+        content = self.files.get(name)
+        self.send_response(200 if content is not None else 404)
+        self.end_headers()
+        if content is not None:
+            self.wfile.write(content)
+        with self.lock:
+            self.running[0] -= 1
+
+    def log_message(self, format, *args):
+        logging.debug('HTTP server: '+(format % args))
+
+
+@pytest.mark.indep
+def test_3d_fetch_models(test_dir, caplog):
+    """ Download the missing 3D models using various workers """
+    models = ['Resistor_SMD.3dshapes/R_0805_2012Metric', 'Capacitor_SMD.3dshapes/C_0805_2012Metric',
+              'Diode_SMD.3dshapes/D_0805_2012Metric', 'LED_SMD.3dshapes/LED_0805_2012Metric']
+    files = {}
+    for n, m in enumerate(models):
+        # Big enough to need more than one write
+        files[m+'.wrl'] = bytes([n])*300000
+        files[m+'.step'] = bytes([n+100])*300000
+    ModelsServer.files = files
+    ModelsServer.requests = {}
+    ModelsServer.running = [0, 0]
+    # Missing models: full name -> (model, [components])
+    missing = {'/kicad6/'+m+'.wrl': ('${KICAD6_3DMODEL_DIR}/'+m+'.wrl', []) for m in models}
+    # The same model using another alias, must be downloaded once
+    missing['/kicad7/'+models[0]+'.wrl'] = ('${KICAD7_3DMODEL_DIR}/'+models[0]+'.wrl', [])
+    # Not in the server
+    missing['/kicad6/None.3dshapes/None.wrl'] = ('${KICAD6_3DMODEL_DIR}/None.3dshapes/None.wrl', [])
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ModelsServer)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    cache = os.path.join(test_dir, '3d_cache')
+    try:
+        with context.cover_it(cov):
+            o = Base3DOptions()
+            o._tmp_dir = cache
+            o.kicad_3d_url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+            o.download_workers = 4
+            o.download_lcsc = False
+            res = o.fetch_models(missing, '', [], False)
+            assert ModelsServer.running[1] > 1
+            # Already in the cache
+            res2 = o.fetch_models(missing, '', [], False)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert res == res2
+    assert res.pop('/kicad6/None.3dshapes/None.wrl') is None
+    assert 'Failed to download' in caplog.text
+    for k, v in res.items():
+        assert v == os.path.join(cache, k[8:])
+    # Each file requested only once, the second run used the cache
+    assert ModelsServer.requests == {**{k: 1 for k in files.keys()}, 'None.3dshapes/None.wrl': 2}
+    # Complete files and no temporal files left
+    for name, content in files.items():
+        with open(os.path.join(cache, name), 'rb') as f:
+            assert f.read() == content
+    for m in models:
+        dir = os.path.join(cache, os.path.dirname(m))
+        assert sorted(os.listdir(dir)) == sorted([os.path.basename(m)+'.step', os.path.basename(m)+'.wrl'])
+
+
+def make_comp(ref, value, fields):
+    c = SchematicComponent()
+    c.ref = ref
+    c.ref_prefix = ref.rstrip('0123456789')
+    c.value = value
+    for n, (name, val) in enumerate([('Reference', ref), ('Value', value), ('Footprint', ''), ('Datasheet', '')] +
+                                    list(fields.items())):
+        f = SchematicField()
+        f.number = n
+        f.name = name
+        f.value = val
+        c.add_field(f)
+    return c
+
+
+def reg_match(c, reg):
+    """ Applies one regex, like the filter does when no joining is possible """
+    column = reg['column'].lower()
+    if column == 'references':
+        column = 'reference'
+    if reg.get('skip_if_no_field') and not c.is_field(column):
+        return False
+    if (reg.get('match_if_field') and c.is_field(column)) or (reg.get('match_if_no_field') and not c.is_field(column)):
+        return True
+    return (re.search(reg['regex'], c.get_field_value(column), re.I) is not None) != reg.get('invert', False)
+
+
+def reg_filter(c, tree):
+    """ Reference result for a `generic` filter using only regexs """
+    exclude = ((tree.get('include_only') and not any(reg_match(c, r) for r in tree['include_only'])) or
+               any(reg_match(c, r) for r in tree.get('exclude_any', [])))
+    return bool(exclude) == tree.get('invert', False)
+
+
+@pytest.mark.indep
+def test_generic_filter_regexs():
+    """ The joined regexs and the filter cache must give the same results as applying each regex """
+    trees = [  # Joined references, value alone
+             ({'exclude_any': [{'column': 'References', 'regex': '^R'}, {'column': 'references', 'regex': '^C'},
+                               {'column': 'Value', 'regex': '^10k$'}]}, 0, 2),
+             # A back-reference can't be joined, the manufacturers are joined
+             ({'include_only': [{'column': 'Value', 'regex': '^(l)ed'}, {'column': 'Value', 'regex': r'(\d)\1'},
+                                {'column': 'Manufacturer', 'regex': 'murata|tdk'},
+                                {'column': 'manufacturer', 'regex': '^yageo'}],
+               'exclude_any': [{'column': 'Config', 'regex': 'dnp', 'skip_if_no_field': True}]}, 3, 1),
+             # Special options aren't joined
+             ({'exclude_any': [{'column': 'MPN', 'regex': '.', 'match_if_no_field': True},
+                               {'column': 'Value', 'regex': '^1', 'invert': True}, {'column': 'Value', 'regex': '^4'},
+                               {'column': 'Reference', 'regex': '^C2$'}]}, 0, 4)]
+    # The same with `invert`
+    trees.append(({'invert': True, **trees[1][0]}, 3, 1))
+    comps = [make_comp('R1', '10k', {'Manufacturer': 'Yageo'}),
+             make_comp('R2', '100k', {'Config': 'DNP'}),
+             make_comp('R3', '220', {}),
+             make_comp('C1', '4u7', {'Manufacturer': 'Murata', 'MPN': 'GRM188'}),
+             make_comp('C2', '100n', {'manufacturer': 'TDK', 'Config': 'dnp'}),
+             make_comp('U1', 'STM32', {}),
+             make_comp('D1', 'LED', {'MPN': 'X1'})]
+    with context.cover_it(cov):
+        load_actions()
+        filters = []
+        for tree, n_inc, n_exc in trees:
+            f = RegFilter.get_class_for('generic')()
+            f.set_tree({'name': 'test', 'type': 'generic', **tree})
+            f.config(None)
+            assert len(f._include_only) == n_inc
+            assert len(f._exclude_any) == n_exc
+            filters.append(f)
+            for c in comps:
+                # The second call uses the cache
+                assert f.filter(c) == reg_filter(c, tree)
+                assert f.filter(c) == reg_filter(c, tree)
+        # Changes in the fields between evaluations
+        f = filters[1]
+        tree = trees[1][0]
+        u1 = comps[5]
+        assert not f.filter(u1)
+        u1.set_field('Manufacturer', 'TDK')
+        assert f.filter(u1) and reg_filter(u1, tree)
+        u1.rename_field('Manufacturer', 'Maker')
+        assert not f.filter(u1) and not reg_filter(u1, tree)
+        u1.set_field('Maker', 'Murata')
+        assert not f.filter(u1)
+        u1.rename_field('Maker', 'manufacturer')
+        assert f.filter(u1)
+        u1.set_field('Config', 'dnp')
+        assert not f.filter(u1) and not reg_filter(u1, tree)
+        # Inverted
+        assert filters[3].filter(u1) and reg_filter(u1, trees[3][0])
+
+
+class FakeLibAlias(object):
+    def __init__(self, uri):
+        self.uri = uri
+
+
+def write_footprint(dir, name, text=''):
+    fname = os.path.join(dir, name+'.kicad_mod')
+    with open(fname, 'wt') as f:
+        f.write('(footprint "{}" (layer "F.Cu"){})\n'.format(name, text))
+    return fname
+
+
+@pytest.mark.indep
+def test_lib_index(test_dir, monkeypatch):
+    """ Footprints LRU, invalidation and the 3D models memo """
+    lib = os.path.join(test_dir, 'lib_index.pretty')
+    os.makedirs(lib, exist_ok=True)
+    alias = FakeLibAlias(lib)
+    names = [write_footprint(lib, 'FP'+str(n)) for n in range(3)]
+    os.symlink(os.path.join(lib, 'None.kicad_mod'), os.path.join(lib, 'Broken.kicad_mod'))
+    with context.cover_it(cov):
+        monkeypatch.setattr(lib_index, 'MAX_FOOTPRINTS', 2)
+        LibIndex.dirs.clear()
+        LibIndex.footprints.clear()
+        LibIndex.models_3d.clear()
+        for v in LibIndex.stats.values():
+            v[:] = [0, 0]
+        # Names
+        assert LibIndex.footprint_name(alias, 'FP0') == names[0]
+        assert LibIndex.footprint_name(alias, 'FP9') is None
+        assert LibIndex.footprint_name(alias, 'Broken') is None
+        # A new footprint, even when the dir looks the same
+        st = os.stat(lib)
+        names.append(write_footprint(lib, 'FP3'))
+        os.utime(lib, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert LibIndex.footprint_name(alias, 'FP3') == names[3]
+        # LRU bounded to 2 footprints
+        for n in names[:3]:
+            LibIndex.load_footprint(n)
+        assert list(LibIndex.footprints.keys()) == names[1:3]
+        LibIndex.load_footprint(names[1])
+        LibIndex.load_footprint(names[0])
+        assert list(LibIndex.footprints.keys()) == [names[1], names[0]]
+        assert LibIndex.stats['footprints'] == [1, 4]
+        # We get a copy
+        fp = LibIndex.load_footprint(names[0])
+        fp[0].append('changed')
+        assert LibIndex.load_footprint(names[0]) != fp
+        # Changed file, different size
+        write_footprint(lib, 'FP0', ' (descr "x")')
+        assert len(LibIndex.load_footprint(names[0])[0]) == 4
+        # Changed file, same size
+        st = os.stat(names[0])
+        write_footprint(lib, 'FP0', ' (descr "y")')
+        os.utime(names[0], ns=(st.st_atime_ns, st.st_mtime_ns+1000000000))
+        assert LibIndex.load_footprint(names[0])[0][3][1] == 'y'
+        assert LibIndex.stats['footprints'] == [3, 6]
+        # 3D models
+        calls = []
+
+        def solver(name, used_extra):
+            calls.append(name)
+            used_extra[0] = name.startswith('${')
+            return os.path.expandvars(name)
+
+        monkeypatch.setenv('KIBOT_LIB_INDEX', 'a')
+        monkeypatch.setattr(GS, 'pro_file', None)
+        monkeypatch.setattr(GS, 'pro_variables', None)
+        LibIndex.update_env()
+        for _ in range(2):
+            used_extra = [False]
+            assert LibIndex.solve_3d_model('${KIBOT_LIB_INDEX}/m.wrl', 'lib', used_extra, solver) == 'a/m.wrl'
+            assert used_extra[0]
+            used_extra = [False]
+            assert LibIndex.solve_3d_model('m.wrl', 'lib', used_extra, solver) == 'm.wrl'
+            assert not used_extra[0]
+        assert calls == ['${KIBOT_LIB_INDEX}/m.wrl', 'm.wrl']
+        # Another lib, the name can be relative to it
+        LibIndex.solve_3d_model('m.wrl', 'lib2', [False], solver)
+        assert len(calls) == 3
+        # Changes in the environment solves it again
+        monkeypatch.setenv('KIBOT_LIB_INDEX', 'b')
+        LibIndex.update_env()
+        assert LibIndex.solve_3d_model('${KIBOT_LIB_INDEX}/m.wrl', 'lib', [False], solver) == 'b/m.wrl'
+        assert len(calls) == 4
+        assert LibIndex.stats['3D models'] == [2, 4]
+
+
+class FakeField(object):
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+
+    def GetName(self):
+        return self.name
+
+    def GetText(self):
+        return self.text
+
+    def SetVisible(self, visible):
+        pass
+
+
+class FakeFootprint(object):
+    """ Footprint with the KiCad 6/7 properties and the KiCad 8 fields, counts the writes """
+    def __init__(self, ref, value, fp, props):
+        self.ref = ref
+        self.value = value
+        self.fp = fp
+        self.props = props
+        self.writes = 0
+
+    def GetReference(self):
+        return self.ref
+
+    def GetValue(self):
+        return self.value
+
+    def SetValue(self, value):
+        self.value = value
+        self.writes += 1
+
+    def GetFPIDAsString(self):
+        return self.fp
+
+    def SetFPIDAsString(self, fp):
+        self.fp = fp
+        self.writes += 1
+
+    def GetProperties(self):
+        return dict(self.props)
+
+    def SetProperties(self, props):
+        self.props = dict(props)
+        self.writes += 1
+
+    def GetFields(self):
+        return [FakeField(k, v) for k, v in self.props.items()]
+
+    def HasField(self, name):
+        return name in self.props
+
+    def SetFields(self, fields):
+        self.props.update(fields)
+        self.writes += len(fields)
+
+    def GetFieldByName(self, name):
+        return FakeField(name, self.props[name])
+
+
+class FakeFootprints(object):
+    def __init__(self, fps):
+        self.fps = fps
+
+    def GetFootprints(self):
+        return self.fps
+
+
+@pytest.mark.parametrize("ki8", [False, True])
+@pytest.mark.indep
+def test_sch_fields_to_pcb(caplog, monkeypatch, ki8):
+    """ Only the differences are written and restored """
+    comps = [make_comp('R1', '10k', {'MPN': 'RC0603'}),
+             make_comp('R2', '2k2', {'MPN': 'RC0402'}),
+             make_comp('C1', '100n', {'MPN': 'GRM188'})]
+    for c in comps:
+        c.set_field('Footprint', 'R:R0603')
+    comps[2].set_field('Footprint', 'C:C0603')
+    comps_hash = {c.ref: c for c in comps}
+    props = [{'MPN': 'RC0603'}, {'MPN': 'RC0603'}, {'MPN': 'GRM188'}]
+    if ki8:
+        for p, c, v in zip(props, comps, ['10k', '1k', '100n']):
+            p.update({'Reference': c.ref, 'Value': v, 'Footprint': 'R:R0603', 'Datasheet': ''})
+    else:
+        for p in props:
+            p.update({'Sheetfile': 'test.kicad_sch', 'Sheetname': ''})
+    fps = [FakeFootprint('R1', '10k', 'R:R0603', props[0]), FakeFootprint('R2', '1k', 'R:R0603', props[1]),
+           FakeFootprint('C1', '100n', 'R:R0603', props[2])]
+    board = FakeFootprints(fps)
+    orig = [(fp.value, fp.fp, dict(fp.props)) for fp in fps]
+    with context.cover_it(cov):
+        monkeypatch.setattr(GS, 'ki6', True)
+        monkeypatch.setattr(GS, 'ki8', ki8)
+        o = VariantOptions()
+        o.sch_fields_to_pcb(board, comps_hash)
+        # R1 is the same, R2 has a different value and MPN, C1 a different footprint
+        assert fps[0].writes == 0
+        assert (fps[1].value, fps[1].fp, fps[1].props['MPN']) == ('2k2', 'R:R0603', 'RC0402')
+        assert (fps[2].value, fps[2].fp) == ('100n', 'C:C0603')
+        if ki8:
+            assert [fp.writes for fp in fps] == [0, 3, 2]
+            assert '2 footprints changed, 5 writes (16 avoided)' in caplog.text
+        else:
+            assert [fp.writes for fp in fps] == [0, 2, 1]
+            assert '2 footprints changed, 3 writes (6 avoided)' in caplog.text
+        o.restore_sch_fields_to_pcb(board)
+        assert [(fp.value, fp.fp, fp.props) for fp in fps] == orig
+        assert fps[0].writes == 0
+
+
+@pytest.mark.indep
+def test_profiler_nested(test_dir, monkeypatch):
+    """ Outputs that run outputs and the memory peak of each step """
+    import tracemalloc
+    monkeypatch.setattr(GS, 'out_dir', test_dir)
+    monkeypatch.setattr(Profiler, 'level', 0)
+    monkeypatch.setattr(Profiler, 'records', [])
+    was_tracing = tracemalloc.is_tracing()
+    try:
+        with context.cover_it(cov):
+            Profiler.enable('cprofile')
+            # The nested output doesn't start another cProfile (Python 3.12 raises an error)
+            with Profiler.output('outer'):
+                big = bytearray(8*1024*1024)
+                del big
+                with Profiler.output('inner'):
+                    big = bytearray(4*1024*1024)
+                    del big
+            with Profiler.measure('run', 'small'):
+                small = bytearray(1024)
+                del small
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    assert os.listdir(os.path.join(test_dir, 'kibot_profile')) == ['outer.prof']
+    recs = {r['name']: r for r in Profiler.records}
+    assert recs['inner']['depth'] == 1
+    if 'py_mem_peak_kb' in recs['inner']:
+        # Python 3.9+
+        assert 4096 <= recs['inner']['py_mem_peak_kb'] < 8192
+        assert recs['outer']['py_mem_peak_kb'] >= 8192
+        # The peak is for the step, not the global one
+        assert recs['small']['py_mem_peak_kb'] < 1024
+    assert 'Py peak [KiB]' in Profiler.summary()
+
+
+def write_render(dir, size):
+    os.makedirs(dir, exist_ok=True)
+    with open(os.path.join(dir, 'render.svg'), 'wb') as f:
+        f.write(b'x'*size)
+
+
+@pytest.mark.indep
+def test_render_cache(test_dir, monkeypatch):
+    """ Content addressed cache used by diff/kiri """
+    root = os.path.join(test_dir, 'render_cache')
+    monkeypatch.setenv('KIBOT_DIFF_CACHE', root)
+    monkeypatch.setattr(GS, 'global_diff_cache_size', 1)
+    monkeypatch.setattr(RenderCache, 'used', set())
+    src = os.path.join(test_dir, 'render_src')
+    with context.cover_it(cov):
+        # Same ids as git
+        assert blob_id(b'') == 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+        assert file_blob_id(os.path.join(test_dir, 'None.kicad_pcb')) == MISSING
+        # Keys
+        assert RenderCache.make_key('a', None, 1) == RenderCache.make_key('a', None, 1)
+        assert RenderCache.make_key('a', None, 1) != RenderCache.make_key('a', 'pro', 1)
+        keys = [RenderCache.make_key('render', n) for n in range(3)]
+        # Store and fetch
+        write_render(src, 400*1024)
+        dest = os.path.join(test_dir, 'render_dest')
+        assert not RenderCache.fetch(keys[0], dest)
+        for k in keys:
+            RenderCache.store(k, src)
+        assert RenderCache.has(keys[0])
+        write_render(dest, 10)
+        assert RenderCache.fetch(keys[0], dest)
+        assert os.path.getsize(os.path.join(dest, 'render.svg')) == 400*1024
+        # Storing again doesn't change it
+        write_render(src, 10)
+        RenderCache.store(keys[0], src)
+        assert os.path.getsize(os.path.join(root, keys[0], 'render.svg')) == 400*1024
+        assert sorted(os.listdir(root)) == sorted(keys)
+        # Eviction: 1.2 MB with a 1 MB limit, the oldest not used in this run goes away
+        for n, k in enumerate(keys):
+            os.utime(os.path.join(root, k), (1000+n, 1000+n))
+        monkeypatch.setattr(RenderCache, 'used', {keys[0]})
+        RenderCache.evict()
+        assert sorted(os.listdir(root)) == sorted([keys[0], keys[2]])
+        # Below the limit, nothing removed
+        monkeypatch.setattr(RenderCache, 'used', set())
+        RenderCache.evict()
+        assert sorted(os.listdir(root)) == sorted([keys[0], keys[2]])
+        # The key depends on the project and the tools versions
+        load_actions()
+        o = RegOutput.get_class_for('diff')().options()
+        o.command = 'kicad-diff.py'
+        o.incl_file = None
+        key = o.render_key('hash', 'pro')
+        assert o.render_key('hash', 'pro2') != key
+        o._kidiff_version = (2, 5, 5)
+        assert o.render_key('hash', 'pro') != key
+        assert kibot_version in o.render_signature()
+        # Disabled
+        monkeypatch.setattr(GS, 'global_diff_cache_size', 0)
+        assert not RenderCache.enabled()
+        assert o.render_key('hash', 'pro') is None
+        # Sub-sheets, KiCad 6+
+        sch_dir = os.path.join(test_dir, 'render_sch')
+        os.makedirs(os.path.join(sch_dir, 'sub'), exist_ok=True)
+        files = {'top.kicad_sch': '(property "Sheet file" "sub/a.kicad_sch")\n(property "Sheetfile" "b.kicad_sch")',
+                 'sub/a.kicad_sch': '(property "Sheetfile" "../b.kicad_sch")\n(property "Sheetfile" "c.kicad_sch")',
+                 'b.kicad_sch': '(kicad_sch)',
+                 # KiCad 5
+                 'top.sch': 'F0 "Sub" 50\nF1 "sub/a.sch" 50\nF1 "a.sch" 50',
+                 'sub/a.sch': 'EESchema',
+                 'a.sch': 'F1 "sub/a.sch" 50'}
+        for name, text in files.items():
+            with open(os.path.join(sch_dir, name), 'wt') as f:
+                f.write(text)
+        res = sch_sheets(os.path.join(sch_dir, 'top.kicad_sch'), read_text)
+        assert [os.path.relpath(f, sch_dir) for f in res] == ['top.kicad_sch', 'sub/a.kicad_sch', 'b.kicad_sch',
+                                                              'sub/c.kicad_sch']
+        res = sch_sheets(os.path.join(sch_dir, 'top.sch'), read_text)
+        assert [os.path.relpath(f, sch_dir) for f in res] == ['top.sch', 'sub/a.sch', 'a.sch']
@@ -20,6 +20,7 @@ import os
 import re
 import shutil
 from subprocess import run, PIPE
+import xml.etree.ElementTree as ET
 from . import context
 from kibot.misc import (DRC_ERROR, ERC_ERROR, BOM_ERROR, CORRUPTED_PCB, CORRUPTED_SCH, EXIT_BAD_CONFIG, NETLIST_DIFF,
                         CHECK_FIELD)
@@ -451,6 +452,69 @@ def test_update_xml_not_in_bom(test_dir):
     ctx.clean_up()
 
 
+# Reference XMLs created by KiCad from older versions of the schematics.
+# The schematics got new fields and the Sheetfile is the absolute name of the KiCad 5 file.
+OLD_XMLS = {(6, 'kibom-variant_2c'), (6, 'kibom-variant_3'), (6, 'kibom-variant_kicost'), (7, 'kibom-variant_2c')}
+
+
+def xml_section(xml, section):
+    return xml.split('<'+section+'>')[1].split('</'+section+'>')[0]
+
+
+def xml_components(xml):
+    """ Data for each component, the Sheetfile is reduced to the name of the file """
+    res = {}
+    for comp in ET.fromstring(xml.encode()).find('components'):
+        props = {p.get('name'): p.get('value') for p in comp.iter('property')}
+        if 'Sheetfile' in props:
+            props['Sheetfile'] = os.path.splitext(os.path.basename(props['Sheetfile']))[0]
+        fields = comp.find('fields')
+        fields = {f.get('name'): f.text for f in fields} if fields is not None else {}
+        data = {c.tag: (c.text, sorted(c.attrib.items())) for c in comp if c.tag not in {'fields', 'property'}}
+        res[comp.get('ref')] = (data, fields, props)
+    return res
+
+
+@pytest.mark.skipif(context.ki5(), reason="KiCad 6+ implementation")
+@pytest.mark.parametrize("prj", ['bom', 'kibom-variant_2c', 'kibom-variant_3', 'kibom-variant_kicost'])
+def test_update_xml_internal(test_dir, prj):
+    """ XML created without KiCad, must be the same (the header and libraries aren't compared) """
+    ctx = context.TestContext(test_dir, prj, 'update_xml_internal', '')
+    # The XML should be created where the schematic is located
+    xml = os.path.abspath(os.path.join(ctx.get_board_dir(), prj+'.xml'))
+    with open(xml, 'rt') as f:
+        ref = f.read()
+    os.replace(xml, xml+'-bak')
+    try:
+        ctx.run()
+        with open(xml, 'rt') as f:
+            res = f.read()
+    finally:
+        if os.path.isfile(xml):
+            os.remove(xml)
+        os.replace(xml+'-bak', xml)
+    assert xml_section(res, 'nets') == xml_section(ref, 'nets')
+    ki = 8 if context.ki8() else (7 if context.ki7() else 6)
+    # The KiCad 8 XML for kibom-variant_kicost was created by a nightly, the descriptions come from the installed
+    # libs, they aren't in the schematic. So only the nets can be compared.
+    if ki != 8 or prj != 'kibom-variant_kicost':
+        assert xml_section(res, 'libparts') == xml_section(ref, 'libparts')
+        if (ki, prj) in OLD_XMLS:
+            # Just what KiCad emitted for the old schematic
+            ref_comps = xml_components(ref)
+            res_comps = xml_components(res)
+            assert res_comps.keys() == ref_comps.keys()
+            for k, (data, fields, props) in ref_comps.items():
+                logging.debug('Checking '+k)
+                res_data, res_fields, res_props = res_comps[k]
+                assert res_data == data
+                assert fields.items() <= res_fields.items()
+                assert props.items() <= res_props.items()
+        else:
+            assert xml_section(res, 'components') == xml_section(ref, 'components')
+    ctx.clean_up()
+
+
 @pytest.mark.slow
 @pytest.mark.eeschema
 def test_update_xml_fail(test_dir):
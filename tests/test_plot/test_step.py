@@ -206,6 +206,20 @@ def test_blender_export_1(test_dir):
     ctx.clean_up(keep_project=True)
 
 
+@pytest.mark.slow
+@pytest.mark.pcbnew
+@pytest.mark.skipif(context.ki5(), reason="uses pcb2blender")
+def test_blender_export_workers(test_dir):
+    """ Points of view rendered by two Blender instances """
+    prj = 'light_control'
+    yaml = 'blender_export_workers'
+    ctx = context.TestContext(test_dir, prj, yaml)
+    ctx.run(extra_debug=True)
+    for n in range(1, 5):
+        ctx.expect_out_file(prj+f'-3D_blender_{n:03d}.png', sub=True)
+    ctx.clean_up(keep_project=True)
+
+
 @pytest.mark.slow
 @pytest.mark.pcbnew
 @pytest.mark.skipif(context.ki5(), reason="uses pcb2blender")
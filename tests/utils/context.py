@@ -839,6 +839,9 @@ class TestContext(object):
         rows = []
         root = ET.parse(worksheet).getroot()
         ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        # Read the strings (not used in constant_memory mode)
+        strings = self.get_out_path(os.path.join('desc', 'xl', 'sharedStrings.xml'))
+        strs = [t.text for t in ET.parse(strings).getroot().iter(ns+'t')] if os.path.isfile(strings) else []
         rnum = 1
         rfirst = 1
         sh_head = []
@@ -856,13 +859,17 @@ class TestContext(object):
                     type = cell.attrib['t']
                 else:
                     type = 'n'   # default: number
+                if type == 'inlineStr':
+                    this_row.append(''.join(t.text or '' for t in cell.iter(ns+'t')))
+                    continue
                 value = cell.find(ns+'v')
                 if value is not None:
                     if type == 'n':
                         # Numbers as integers
                         value = int(value.text)
                     else:
-                        value = value.text
+                        # Replace the indexes by the strings
+                        value = strs[int(value.text)]
                     this_row.append(value)
             rows.append(this_row)
             rnum += 1
@@ -873,18 +880,6 @@ class TestContext(object):
         if hlinks:
             for r in hlinks.iter(ns+'hyperlink'):
                 links[r.attrib['ref']] = r.attrib[nr+'id']
-        # Read the strings
-        strings = self.get_out_path(os.path.join('desc', 'xl', 'sharedStrings.xml'))
-        strs = [t.text for t in ET.parse(strings).getroot().iter(ns+'t')]
-        # Replace the indexes by the strings
-        for r in rows:
-            for i, val in enumerate(r):
-                if isinstance(val, str):
-                    r[i] = strs[int(val)]
-        for r in sh_head:
-            for i, val in enumerate(r):
-                if isinstance(val, str):
-                    r[i] = strs[int(val)]
         # Translate the links
         if links:
             # Read the relationships